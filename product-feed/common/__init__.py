@@ -0,0 +1 @@
+"""Helpers shared by the product-feed platform collectors."""
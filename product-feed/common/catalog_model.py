@@ -0,0 +1,433 @@
+"""Compact in-memory records for catalog products, variants, inventory and images.
+
+GraphQL responses wrap every list in ``edges``/``node`` objects and repeat the
+same strings (location names, option names, units, currencies) on every
+variant. These ``__slots__`` dataclasses hold the same data flat, intern those
+strings, share one dict per distinct inventory location (an LRU cache of the
+``LOCATION_CACHE_SIZE`` most recent, so a long-running process stays
+bounded), and convert both ways
+between the raw-admin snapshot node shape (``from_node``/``to_node``) and the
+pipeline's Supabase row shapes (``from_row``/``to_row``).
+
+Keys a node did not have are ``MISSING`` and are left out again by
+``to_node``; keys not modelled here ride along in ``extra``. Converted output
+may share interned location dicts, so treat it as read-only.
+"""
+
+from __future__ import annotations
+
+import sys
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Iterable
+
+# Address keys of a pipeline ``variant_info`` inventory level location.
+ROW_ADDRESS_FIELDS = ("address1", "address2", "city", "provinceCode", "countryCode", "zip")
+LOCATION_CACHE_SIZE = 4096
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+    def __bool__(self) -> bool:
+        return False
+
+    def __reduce__(self) -> str:
+        return "MISSING"
+
+
+MISSING: Any = _Missing()
+
+
+def _interned(value: object) -> object:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _frozen(value: object) -> object:
+    if isinstance(value, dict):
+        return tuple((key, _frozen(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return ("__list__",) + tuple(_frozen(item) for item in value)
+    return value
+
+
+def _thawed(value: object) -> object:
+    """The JSON value ``_frozen`` made ``value`` from, with its strings interned."""
+    if isinstance(value, tuple):
+        if value[:1] == ("__list__",):
+            return [_thawed(item) for item in value[1:]]
+        return {_interned(key): _thawed(item) for key, item in value}
+    return _interned(value)
+
+
+@lru_cache(maxsize=LOCATION_CACHE_SIZE)
+def _shared_location(key: tuple) -> dict:
+    return _thawed(key)
+
+
+def shared_location(location: object) -> object:
+    """One shared dict per distinct location (names and address strings interned)."""
+    if not isinstance(location, dict):
+        return location
+    return _shared_location(_frozen(location))
+
+
+def _node_list(section: object) -> list[dict]:
+    """Nodes of a GraphQL connection (``edges`` or ``nodes``)."""
+    if not isinstance(section, dict):
+        return []
+    if "edges" in section:
+        edges = section.get("edges") or []
+        return [edge["node"] for edge in edges if isinstance(edge, dict) and isinstance(edge.get("node"), dict)]
+    return [node for node in section.get("nodes") or [] if isinstance(node, dict)]
+
+
+def _extra(node: dict, modelled: frozenset[str]) -> dict | None:
+    extra = {key: value for key, value in node.items() if key not in modelled}
+    return extra or None
+
+
+def _put(target: dict, key: str, value: object) -> None:
+    if value is not MISSING:
+        target[key] = value
+
+
+def _value(value: object) -> object:
+    return None if value is MISSING else value
+
+
+@dataclass(slots=True)
+class Image:
+    id: str | None = MISSING
+    url: str | None = MISSING
+    alt_text: str | None = MISSING
+    extra: dict | None = None
+
+    FIELDS = frozenset({"id", "url", "altText"})
+
+    @classmethod
+    def from_node(cls, node: dict) -> Image:
+        return cls(node.get("id", MISSING), node.get("url", MISSING), node.get("altText", MISSING), _extra(node, cls.FIELDS))
+
+    def to_node(self) -> dict:
+        node: dict = {}
+        _put(node, "id", self.id)
+        _put(node, "url", self.url)
+        _put(node, "altText", self.alt_text)
+        if self.extra:
+            node.update(self.extra)
+        return node
+
+
+@dataclass(slots=True)
+class InventoryLevel:
+    location: dict | None = MISSING
+    quantities: tuple[tuple[str, int | None], ...] | None = MISSING
+    extra: dict | None = None
+
+    FIELDS = frozenset({"location", "quantities"})
+
+    @classmethod
+    def from_node(cls, node: dict) -> InventoryLevel:
+        quantities = node.get("quantities", MISSING)
+        if isinstance(quantities, list):
+            quantities = tuple(
+                (_interned(entry.get("name")), entry.get("quantity")) for entry in quantities if isinstance(entry, dict)
+            )
+        return cls(shared_location(node.get("location", MISSING)), quantities, _extra(node, cls.FIELDS))
+
+    def to_node(self) -> dict:
+        node: dict = {}
+        _put(node, "location", self.location)
+        if self.quantities is not MISSING:
+            node["quantities"] = None if self.quantities is None else [{"name": name, "quantity": quantity} for name, quantity in self.quantities]
+        if self.extra:
+            node.update(self.extra)
+        return node
+
+    def to_row(self) -> dict:
+        location = self.location if isinstance(self.location, dict) else None
+        row_location = None
+        if location is not None:
+            address = location.get("address")
+            row_location = {
+                "name": location.get("name"),
+                "address": {key: address.get(key) for key in ROW_ADDRESS_FIELDS} if isinstance(address, dict) else None,
+            }
+        quantities = self.quantities if isinstance(self.quantities, tuple) else ()
+        return {"location": row_location, "quantities": [{"name": name, "quantity": quantity} for name, quantity in quantities]}
+
+
+@dataclass(slots=True)
+class InventoryItem:
+    id: str | None = MISSING
+    tracked: bool | None = MISSING
+    country_code_of_origin: str | None = MISSING
+    harmonized_system_code: str | None = MISSING
+    # (value, unit); None for a measurement without a weight.
+    weight: tuple[float | None, str | None] | None = MISSING
+    levels: list[InventoryLevel] | None = MISSING
+    extra: dict | None = None
+
+    FIELDS = frozenset({"id", "tracked", "countryCodeOfOrigin", "harmonizedSystemCode", "measurement", "inventoryLevels"})
+
+    @classmethod
+    def from_node(cls, node: dict) -> InventoryItem:
+        extra = _extra(node, cls.FIELDS)
+        measurement = node.get("measurement", MISSING)
+        weight = MISSING
+        if isinstance(measurement, dict):
+            weight = None
+            if isinstance(measurement.get("weight"), dict):
+                weight = (measurement["weight"].get("value"), _interned(measurement["weight"].get("unit")))
+        elif measurement is not MISSING:
+            # A null measurement rides along as-is.
+            extra = {**(extra or {}), "measurement": measurement}
+        levels = node.get("inventoryLevels", MISSING)
+        if levels is not MISSING and levels is not None:
+            levels = [InventoryLevel.from_node(level) for level in (_node_list(levels) if isinstance(levels, dict) else levels) if isinstance(level, dict)]
+        return cls(
+            node.get("id", MISSING),
+            node.get("tracked", MISSING),
+            _interned(node.get("countryCodeOfOrigin", MISSING)),
+            _interned(node.get("harmonizedSystemCode", MISSING)),
+            weight,
+            levels,
+            extra,
+        )
+
+    def _measurement(self) -> dict | None:
+        if self.weight is None or self.weight is MISSING:
+            return None
+        value, unit = self.weight
+        return {"weight": {"value": value, "unit": unit}}
+
+    def to_node(self) -> dict:
+        node: dict = {}
+        _put(node, "id", self.id)
+        _put(node, "tracked", self.tracked)
+        _put(node, "countryCodeOfOrigin", self.country_code_of_origin)
+        _put(node, "harmonizedSystemCode", self.harmonized_system_code)
+        if self.weight is not MISSING:
+            node["measurement"] = self._measurement() or {"weight": None}
+        if self.levels is not MISSING:
+            node["inventoryLevels"] = None if self.levels is None else {"edges": [{"node": level.to_node()} for level in self.levels]}
+        if self.extra:
+            node.update(self.extra)
+        return node
+
+    def to_row(self) -> dict:
+        return {
+            "id": _value(self.id),
+            "tracked": _value(self.tracked),
+            "measurement": self._measurement(),
+            "inventoryLevels": [level.to_row() for level in self.levels or ()],
+        }
+
+
+@dataclass(slots=True)
+class Variant:
+    id: str | None = MISSING
+    title: str | None = MISSING
+    sku: str | None = MISSING
+    barcode: str | None = MISSING
+    price: str | None = MISSING
+    inventory_quantity: int | None = MISSING
+    selected_options: tuple[tuple[str, str], ...] | None = MISSING
+    inventory_item: InventoryItem | None = MISSING
+    extra: dict | None = None
+
+    FIELDS = frozenset({"id", "title", "sku", "barcode", "price", "inventoryQuantity", "selectedOptions", "inventoryItem"})
+
+    @classmethod
+    def from_node(cls, node: dict) -> Variant:
+        options = node.get("selectedOptions", MISSING)
+        if isinstance(options, list):
+            options = tuple(
+                (_interned(option.get("name")), _interned(option.get("value"))) for option in options if isinstance(option, dict)
+            )
+        inventory_item = node.get("inventoryItem", MISSING)
+        if isinstance(inventory_item, dict):
+            inventory_item = InventoryItem.from_node(inventory_item)
+        return cls(
+            node.get("id", MISSING),
+            _interned(node.get("title", MISSING)),
+            node.get("sku", MISSING),
+            node.get("barcode", MISSING),
+            node.get("price", MISSING),
+            node.get("inventoryQuantity", MISSING),
+            options,
+            inventory_item,
+            _extra(node, cls.FIELDS),
+        )
+
+    @classmethod
+    def from_row(cls, row: dict) -> Variant:
+        """From a ``variant_info`` payload (flattened lists are read like connections)."""
+        return cls.from_node(row)
+
+    def to_node(self) -> dict:
+        node: dict = {}
+        _put(node, "id", self.id)
+        _put(node, "title", self.title)
+        _put(node, "sku", self.sku)
+        _put(node, "barcode", self.barcode)
+        _put(node, "price", self.price)
+        _put(node, "inventoryQuantity", self.inventory_quantity)
+        if self.selected_options is not MISSING:
+            node["selectedOptions"] = None if self.selected_options is None else [{"name": name, "value": value} for name, value in self.selected_options]
+        if self.inventory_item is not MISSING:
+            node["inventoryItem"] = None if self.inventory_item is None else self.inventory_item.to_node()
+        if self.extra:
+            node.update(self.extra)
+        return node
+
+    def to_row(self) -> dict:
+        """The pipeline's ``variant_info`` payload."""
+        price = _value(self.price)
+        return {
+            "id": _value(self.id),
+            "price": str(price) if price is not None else None,
+            "title": _value(self.title),
+            "sku": _value(self.sku),
+            "barcode": _value(self.barcode),
+            "inventoryQuantity": _value(self.inventory_quantity),
+            "selectedOptions": [{"name": name, "value": value} for name, value in self.selected_options or ()],
+            "inventoryItem": self.inventory_item.to_row() if isinstance(self.inventory_item, InventoryItem) else None,
+        }
+
+
+@dataclass(slots=True)
+class Product:
+    id: str | None = MISSING
+    handle: str | None = MISSING
+    title: str | None = MISSING
+    description: str | None = MISSING
+    description_html: str | None = MISSING
+    vendor: str | None = MISSING
+    product_type: str | None = MISSING
+    tags: tuple[str, ...] | None = MISSING
+    updated_at: str | None = MISSING
+    total_inventory: int | None = MISSING
+    featured_image: Image | None = MISSING
+    images: list[Image] | None = MISSING
+    variants: list[Variant] | None = MISSING
+    variants_page_info: dict | None = MISSING
+    # The snapshot edge cursor, when the product came from an edge.
+    cursor: str | None = MISSING
+    extra: dict | None = field(default=None)
+
+    FIELDS = frozenset({
+        "id", "handle", "title", "description", "descriptionHtml", "vendor", "productType", "tags",
+        "updatedAt", "totalInventory", "featuredImage", "images", "variants",
+    })
+
+    @classmethod
+    def from_node(cls, node: dict) -> Product:
+        tags = node.get("tags", MISSING)
+        if isinstance(tags, list):
+            tags = tuple(_interned(tag) for tag in tags)
+        featured = node.get("featuredImage", MISSING)
+        if isinstance(featured, dict):
+            featured = Image.from_node(featured)
+        images = node.get("images", MISSING)
+        if images is not MISSING and images is not None:
+            images = [Image.from_node(image) for image in (_node_list(images) if isinstance(images, dict) else images) if isinstance(image, dict)]
+        variants = node.get("variants", MISSING)
+        page_info = MISSING
+        if isinstance(variants, dict):
+            page_info = variants.get("pageInfo", MISSING)
+            variants = [Variant.from_node(variant) for variant in _node_list(variants)]
+        elif isinstance(variants, list):
+            variants = [Variant.from_row(variant) for variant in variants if isinstance(variant, dict)]
+        return cls(
+            node.get("id", MISSING),
+            node.get("handle", MISSING),
+            node.get("title", MISSING),
+            node.get("description", MISSING),
+            node.get("descriptionHtml", MISSING),
+            _interned(node.get("vendor", MISSING)),
+            _interned(node.get("productType", MISSING)),
+            tags,
+            node.get("updatedAt", MISSING),
+            node.get("totalInventory", MISSING),
+            featured,
+            images,
+            variants,
+            page_info,
+            MISSING,
+            _extra(node, cls.FIELDS),
+        )
+
+    @classmethod
+    def from_edge(cls, edge: dict) -> Product:
+        product = cls.from_node(edge.get("node") or {})
+        product.cursor = edge.get("cursor", MISSING)
+        return product
+
+    @classmethod
+    def from_row(cls, row: dict) -> Product:
+        """From a ``product_info`` payload, or an ``acp_export`` product with its ``variants`` rows."""
+        return cls.from_node(row)
+
+    def to_node(self) -> dict:
+        node: dict = {}
+        _put(node, "id", self.id)
+        _put(node, "handle", self.handle)
+        _put(node, "title", self.title)
+        _put(node, "description", self.description)
+        _put(node, "descriptionHtml", self.description_html)
+        _put(node, "vendor", self.vendor)
+        _put(node, "productType", self.product_type)
+        if self.tags is not MISSING:
+            node["tags"] = None if self.tags is None else list(self.tags)
+        _put(node, "updatedAt", self.updated_at)
+        _put(node, "totalInventory", self.total_inventory)
+        if self.featured_image is not MISSING:
+            node["featuredImage"] = None if self.featured_image is None else self.featured_image.to_node()
+        if self.images is not MISSING:
+            node["images"] = None if self.images is None else {"edges": [{"node": image.to_node()} for image in self.images]}
+        if self.variants is not MISSING:
+            variants: dict | None = None
+            if self.variants is not None:
+                variants = {"edges": [{"node": variant.to_node()} for variant in self.variants]}
+                _put(variants, "pageInfo", self.variants_page_info)
+            node["variants"] = variants
+        if self.extra:
+            node.update(self.extra)
+        return node
+
+    def to_edge(self) -> dict:
+        edge: dict = {"node": self.to_node()}
+        _put(edge, "cursor", self.cursor)
+        return edge
+
+    def to_row(self, with_variants: bool = False) -> dict:
+        """The pipeline's ``product_info`` payload; ``with_variants`` adds the ``variant_info`` rows (``acp_export``)."""
+        featured = self.featured_image
+        row = {
+            "id": _value(self.id),
+            "title": _value(self.title),
+            "handle": _value(self.handle),
+            "description": _value(self.description),
+            "descriptionHtml": _value(self.description_html),
+            "productType": _value(self.product_type),
+            "tags": None if self.tags is MISSING or self.tags is None else list(self.tags),
+            "featuredImage": featured.to_node() if isinstance(featured, Image) else None,
+            "images": [image.to_node() for image in self.images or ()],
+            "totalInventory": _value(self.total_inventory),
+        }
+        if with_variants:
+            row["variants"] = [variant.to_row() for variant in self.variants or ()]
+        return row
+
+
+def products_from_edges(edges: Iterable[object]) -> list[Product]:
+    return [Product.from_edge(edge) for edge in edges if isinstance(edge, dict) and isinstance(edge.get("node"), dict)]
+
+
+def products_to_edges(products: Iterable[Product]) -> list[dict]:
+    return [product.to_edge() for product in products]
@@ -0,0 +1,283 @@
+"""Change sets between consecutive raw-admin snapshots of one store.
+
+Each snapshot gets a ``<stamp>.digest.json.gz`` sidecar holding a stable hash
+per product and variant (volatile fields excluded) plus the price and
+inventory values we report field-level changes for. Diffing two digests
+yields ``<stamp>.changes.jsonl``: one line per added, removed or modified
+product or variant, so consumers can process only the delta.
+
+Digests are written one ``[product_id, digest]`` line per product as pages
+arrive, and the previous digest is looked up through a temporary SQLite
+table while diffing, so neither is held in memory.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import tempfile
+import uuid
+from typing import IO, Iterable, Iterator
+
+from common.snapshot_reader import SnapshotReader
+
+DIGEST_SUFFIX = ".digest.json.gz"
+CHANGES_SUFFIX = ".changes.jsonl"
+# Excluded from node hashes: they move without the catalog changing, or
+# (variants) are hashed on their own.
+PRODUCT_VOLATILE_FIELDS = frozenset({"updatedAt", "variants"})
+VARIANT_VOLATILE_FIELDS = frozenset({"updatedAt"})
+PRODUCT_TRACKED_FIELDS = ("totalInventory",)
+VARIANT_TRACKED_FIELDS = ("price", "inventoryQuantity")
+
+
+def snapshot_stamp(path: pathlib.Path) -> str:
+    return path.name.split(".")[0]
+
+
+def digest_path(snapshot_path: pathlib.Path) -> pathlib.Path:
+    return snapshot_path.with_name(snapshot_stamp(snapshot_path) + DIGEST_SUFFIX)
+
+
+def changes_path(snapshot_path: pathlib.Path) -> pathlib.Path:
+    return snapshot_path.with_name(snapshot_stamp(snapshot_path) + CHANGES_SUFFIX)
+
+
+def node_hash(node: dict, volatile: frozenset[str]) -> str:
+    stable = {key: value for key, value in node.items() if key not in volatile}
+    payload = json.dumps(stable, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def product_digest(node: dict) -> dict:
+    """``{"hash", "handle", <tracked fields>, "variants": {id: {...}}}`` for one product node."""
+    digest = {"hash": node_hash(node, PRODUCT_VOLATILE_FIELDS), "handle": node.get("handle")}
+    for field in PRODUCT_TRACKED_FIELDS:
+        digest[field] = node.get(field)
+    variants: dict[str, dict] = {}
+    section = node.get("variants")
+    for edge in (section.get("edges") if isinstance(section, dict) else None) or []:
+        variant = edge.get("node") if isinstance(edge, dict) else None
+        if not isinstance(variant, dict) or not variant.get("id"):
+            continue
+        entry = {"hash": node_hash(variant, VARIANT_VOLATILE_FIELDS), "sku": variant.get("sku")}
+        for field in VARIANT_TRACKED_FIELDS:
+            entry[field] = variant.get(field)
+        variants[str(variant["id"])] = entry
+    digest["variants"] = variants
+    return digest
+
+
+def digest_edges(edges: Iterable[object], into: dict[str, dict] | None = None) -> dict[str, dict]:
+    digests = {} if into is None else into
+    for edge in edges:
+        node = edge.get("node") if isinstance(edge, dict) else None
+        if isinstance(node, dict) and node.get("id"):
+            digests[str(node["id"])] = product_digest(node)
+    return digests
+
+
+def _field_changes(before: dict, after: dict, fields: Iterable[str]) -> dict:
+    return {field: [before.get(field), after.get(field)] for field in fields if before.get(field) != after.get(field)}
+
+
+def product_changes(product_id: str, old: dict | None, new: dict | None) -> Iterator[dict]:
+    """Change records for one product between two digests (``None`` when absent)."""
+    if new is None:
+        if old is not None:
+            yield {"entity": "product", "change": "removed", "product_id": product_id, "handle": old.get("handle")}
+            for variant_id, variant in old["variants"].items():
+                yield {"entity": "variant", "change": "removed", "product_id": product_id, "variant_id": variant_id, "sku": variant.get("sku")}
+        return
+    if old is None:
+        yield {"entity": "product", "change": "added", "product_id": product_id, "handle": new.get("handle")}
+        for variant_id, variant in new["variants"].items():
+            yield {"entity": "variant", "change": "added", "product_id": product_id, "variant_id": variant_id, "sku": variant.get("sku")}
+        return
+    if old["hash"] != new["hash"]:
+        yield {
+            "entity": "product",
+            "change": "modified",
+            "product_id": product_id,
+            "handle": new.get("handle"),
+            "fields": _field_changes(old, new, PRODUCT_TRACKED_FIELDS),
+        }
+    for variant_id, variant in new["variants"].items():
+        previous = old["variants"].get(variant_id)
+        base = {"entity": "variant", "product_id": product_id, "variant_id": variant_id, "sku": variant.get("sku")}
+        if previous is None:
+            yield {**base, "change": "added"}
+        elif previous["hash"] != variant["hash"]:
+            yield {**base, "change": "modified", "fields": _field_changes(previous, variant, VARIANT_TRACKED_FIELDS)}
+    for variant_id, variant in old["variants"].items():
+        if variant_id not in new["variants"]:
+            yield {"entity": "variant", "change": "removed", "product_id": product_id, "variant_id": variant_id, "sku": variant.get("sku")}
+
+
+def diff_digests(before: dict[str, dict], after: dict[str, dict]) -> Iterator[dict]:
+    """Yield change records from one snapshot digest to the next, products in ``after`` order."""
+    for product_id, new in after.items():
+        yield from product_changes(product_id, before.get(product_id), new)
+    for product_id, old in before.items():
+        if product_id not in after:
+            yield from product_changes(product_id, old, None)
+
+
+def diff_digest_streams(before: Iterable[tuple[str, dict]], after: Iterable[tuple[str, dict]]) -> Iterator[dict]:
+    """``diff_digests`` over ``(product_id, digest)`` streams; ``before`` is indexed in a temporary SQLite file."""
+    with tempfile.TemporaryDirectory(prefix="digest-") as directory:
+        conn = sqlite3.connect(pathlib.Path(directory) / "before.sqlite3")
+        try:
+            conn.execute("CREATE TABLE digest (product_id TEXT PRIMARY KEY, digest TEXT NOT NULL, seen INTEGER NOT NULL DEFAULT 0)")
+            conn.executemany(
+                "INSERT OR REPLACE INTO digest (product_id, digest) VALUES (?, ?)",
+                ((product_id, json.dumps(digest, separators=(",", ":"))) for product_id, digest in before),
+            )
+            for product_id, new in after:
+                row = conn.execute("SELECT digest FROM digest WHERE product_id = ?", (product_id,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE digest SET seen = 1 WHERE product_id = ?", (product_id,))
+                yield from product_changes(product_id, json.loads(row[0]) if row is not None else None, new)
+            for product_id, digest in conn.execute("SELECT product_id, digest FROM digest WHERE seen = 0 ORDER BY rowid"):
+                yield from product_changes(product_id, json.loads(digest), None)
+        finally:
+            conn.close()
+
+
+def _write_atomic(path: pathlib.Path, payload: bytes) -> None:
+    temp_path = path.parent / f".{uuid.uuid4().hex}.tmp"
+    try:
+        temp_path.write_bytes(payload)
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def _digest_line(product_id: str, digest: dict) -> bytes:
+    return json.dumps([product_id, digest], separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def write_digest(snapshot_path: pathlib.Path, digests: dict[str, dict]) -> pathlib.Path:
+    path = digest_path(snapshot_path)
+    _write_atomic(path, gzip.compress(b"".join(_digest_line(key, value) for key, value in digests.items()), mtime=0))
+    return path
+
+
+def iter_digest(snapshot_path: pathlib.Path) -> Iterator[tuple[str, dict]]:
+    """``(product_id, digest)`` pairs for a snapshot, computed from the snapshot when the sidecar is missing."""
+    path = digest_path(snapshot_path)
+    if not path.is_file():
+        for edge in SnapshotReader(snapshot_path).iter_edges():
+            node = edge.get("node")
+            if isinstance(node, dict) and node.get("id"):
+                yield str(node["id"]), product_digest(node)
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        if handle.read(1) == "{":
+            # Sidecars written before digests were streamed hold one JSON object.
+            handle.seek(0)
+            yield from json.load(handle).items()
+            return
+        handle.seek(0)
+        for line in handle:
+            if line.strip():
+                product_id, digest = json.loads(line)
+                yield product_id, digest
+
+
+def load_digest(snapshot_path: pathlib.Path) -> dict[str, dict]:
+    """Digest for a snapshot as one map (small snapshots and tests; diffs stream through ``iter_digest``)."""
+    return dict(iter_digest(snapshot_path))
+
+
+def write_changes(path: pathlib.Path, header: dict, records: Iterable[dict]) -> dict[str, int]:
+    """Write a change log (summary line last) and return its per-kind counts."""
+    counts: dict[str, int] = {}
+    temp_path = path.parent / f".{uuid.uuid4().hex}.tmp"
+    try:
+        with temp_path.open("w", encoding="utf-8") as handle:
+            for record in records:
+                key = f"{record['entity']}_{record['change']}"
+                counts[key] = counts.get(key, 0) + 1
+                handle.write(json.dumps(record, sort_keys=True, ensure_ascii=False) + "\n")
+            handle.write(json.dumps({**header, "entity": "summary", "counts": counts}, sort_keys=True) + "\n")
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return counts
+
+
+def read_change_counts(snapshot_path: pathlib.Path) -> dict[str, int] | None:
+    """Per-kind counts from a snapshot's change log summary, or ``None`` without a log."""
+    try:
+        with changes_path(snapshot_path).open("rb") as handle:
+            handle.seek(0, os.SEEK_END)
+            handle.seek(max(0, handle.tell() - 4096))
+            summary = json.loads(handle.read().splitlines()[-1])
+    except (OSError, ValueError, IndexError):
+        return None
+    counts = summary.get("counts") if isinstance(summary, dict) else None
+    return counts if isinstance(counts, dict) else None
+
+
+class ChangeSetRecorder:
+    """Snapshot sink that writes the digest and change log for a new snapshot.
+
+    Product digests are appended to a hidden gzip file in ``directory`` as
+    pages arrive. ``commit(path, previous)`` renames it into the snapshot's
+    digest sidecar and diffs it against ``previous`` (the store's prior
+    snapshot, if any); the first snapshot of a store logs every product as added.
+    """
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+        self.counts: dict[str, int] = {}
+        self._temp_path: pathlib.Path | None = None
+        self._handle: IO[bytes] | None = None
+
+    def _open(self) -> IO[bytes]:
+        if self._handle is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._temp_path = self.directory / f".{uuid.uuid4().hex}.tmp"
+            self._handle = gzip.open(self._temp_path, "wb")
+        return self._handle
+
+    def write_edges(self, edges: Iterable[object]) -> None:
+        handle = self._open()
+        for edge in edges:
+            node = edge.get("node") if isinstance(edge, dict) else None
+            if isinstance(node, dict) and node.get("id"):
+                handle.write(_digest_line(str(node["id"]), product_digest(node)))
+
+    def finish(self, shop: object, page_info: object, extensions: object = None) -> None:
+        pass
+
+    def commit(self, path: pathlib.Path, previous: pathlib.Path | None = None) -> pathlib.Path:
+        handle = self._open()
+        handle.close()
+        self._handle = None
+        target = digest_path(path)
+        os.replace(self._temp_path, target)
+        self._temp_path = None
+        header = {"from": snapshot_stamp(previous) if previous is not None else None, "to": snapshot_stamp(path)}
+        before = iter_digest(previous) if previous is not None else iter(())
+        log_path = changes_path(path)
+        try:
+            self.counts = write_changes(log_path, header, diff_digest_streams(before, iter_digest(path)))
+        except sqlite3.Error as exc:
+            raise RuntimeError(f"change log diff failed: {exc}") from exc
+        return log_path
+
+    def abort(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        if self._temp_path is not None:
+            self._temp_path.unlink(missing_ok=True)
+            self._temp_path = None
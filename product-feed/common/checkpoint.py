@@ -0,0 +1,139 @@
+"""Checkpoints that let an interrupted cursor-paginated crawl resume where it stopped."""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+import pathlib
+import shutil
+import time
+import uuid
+from typing import Iterable, Iterator
+
+STATE_FILENAME = "state.json"
+ITEMS_FILENAME = "items.jsonl"
+DEFAULT_COMMIT_INTERVAL_SECONDS = 10.0
+
+
+def _now() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+
+class PaginationCheckpoint:
+    """Last committed cursor plus every item produced before it, for one crawl.
+
+    ``record`` appends a page's items to ``items.jsonl``; at most every
+    ``commit_interval`` seconds (and on ``commit``) the items file is fsynced
+    and ``state.json`` atomically rewritten with the cursor and the items file
+    length, so a crash leaves a consistent checkpoint (bytes after the last
+    commit are truncated on resume, and those pages are fetched again).
+    ``load`` only returns a checkpoint that was updated
+    within ``max_age`` and was taken with the same ``fingerprint`` (query,
+    API version, ...) and that still has pages to fetch; anything else is
+    discarded. A finished crawl whose results were never committed is
+    re-fetched rather than republished as current.
+    """
+
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        max_age: dt.timedelta,
+        fingerprint: dict | None = None,
+        commit_interval: float = DEFAULT_COMMIT_INTERVAL_SECONDS,
+    ) -> None:
+        self.directory = directory
+        self.max_age = max_age
+        self.fingerprint = fingerprint or {}
+        self.commit_interval = commit_interval
+        self.state_path = directory / STATE_FILENAME
+        self.items_path = directory / ITEMS_FILENAME
+        self.state: dict | None = None
+        self._pending: dict | None = None  # state of the last page recorded but not committed
+        self._committed_at: float | None = None
+
+    def load(self) -> dict | None:
+        try:
+            with self.state_path.open("r", encoding="utf-8") as handle:
+                state = json.load(handle)
+            updated_at = dt.datetime.fromisoformat(state["updated_at"])
+        except FileNotFoundError:
+            self.clear()  # items written before the first state commit are unusable
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            self.clear()
+            return None
+        if (
+            state.get("fingerprint") != self.fingerprint
+            or _now() - updated_at > self.max_age
+            or not state.get("has_next_page")
+        ):
+            self.clear()
+            return None
+        try:
+            with self.items_path.open("r+b") as handle:
+                handle.truncate(state.get("items_bytes", 0))
+        except OSError:
+            self.clear()
+            return None
+        self.state = state
+        return state
+
+    def iter_items(self) -> Iterator[object]:
+        if self.state is None or not self.items_path.exists():
+            return
+        with self.items_path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                yield json.loads(line)
+
+    def iter_batches(self, size: int = 250) -> Iterator[list]:
+        batch: list = []
+        for item in self.iter_items():
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def record(self, items: Iterable[object], cursor: str | None, has_next_page: bool, **extra: object) -> None:
+        """Append a finished page's items; the cursor to continue from is committed at the next interval."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self.items_path.open("ab") as handle:
+            for item in items:
+                handle.write(json.dumps(item, ensure_ascii=False).encode("utf-8") + b"\n")
+            items_bytes = handle.tell()
+        previous = self._pending or self.state or {}
+        self._pending = {
+            **extra,
+            "fingerprint": self.fingerprint,
+            "cursor": cursor,
+            "has_next_page": has_next_page,
+            "items_bytes": items_bytes,
+            "started_at": previous.get("started_at") or _now().isoformat(),
+        }
+        if self._committed_at is None or time.monotonic() - self._committed_at >= self.commit_interval:
+            self.commit()
+
+    def commit(self) -> None:
+        """Make the last recorded page durable and the point a resume continues from."""
+        if self._pending is None:
+            return
+        with self.items_path.open("ab") as handle:
+            os.fsync(handle.fileno())
+        state = {**self._pending, "updated_at": _now().isoformat()}
+        temp_path = self.directory / f".{uuid.uuid4().hex}.tmp"
+        try:
+            temp_path.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+            os.replace(temp_path, self.state_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        self.state = state
+        self._pending = None
+        self._committed_at = time.monotonic()
+
+    def clear(self) -> None:
+        self.state = None
+        self._pending = None
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,230 @@
+"""Compressed, framed JSONL snapshots with a sidecar index for point lookups.
+
+A framed snapshot ``<stamp>.jsonl.gz`` (or ``.jsonl.zst``) is a series of
+independently compressed frames. Each frame holds up to ``FRAME_EDGES`` lines,
+one product edge per line, and the final frame holds a single
+``{"meta": {"shop": ..., "pageInfo": ..., "extensions": ...}}`` line. Gzip
+members and zstd frames concatenate into a valid stream, so ``zcat`` still
+reads the whole file.
+
+The sidecar ``<stamp>.jsonl.gz.idx`` records each frame's byte offset and
+length and maps product IDs, handles and variant SKUs to ``[frame, line]``,
+so a lookup decompresses one frame instead of the whole catalog.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import pathlib
+import uuid
+from typing import Iterable, Iterator
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip needs nothing beyond the stdlib
+    zstandard = None
+
+FORMAT_VERSION = 1
+FRAME_EDGES = 32
+INDEX_SUFFIX = ".idx"
+COMPRESSION_SUFFIXES = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+PRODUCT_GID_PREFIX = "gid://shopify/Product/"
+
+
+def require_compression(compression: str) -> None:
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown snapshot compression {compression!r}")
+    if compression == "zstd" and zstandard is None:
+        raise RuntimeError("zstd snapshots need the 'zstandard' package (pip install zstandard)")
+
+
+def _compress(compression: str, payload: bytes) -> bytes:
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(payload)
+    return gzip.compress(payload, mtime=0)
+
+
+def _decompress(compression: str, frame: bytes) -> bytes:
+    if compression == "zstd":
+        require_compression("zstd")
+        return zstandard.ZstdDecompressor().decompress(frame)
+    return gzip.decompress(frame)
+
+
+def index_path(path: pathlib.Path) -> pathlib.Path:
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+def is_framed_snapshot(path: pathlib.Path) -> bool:
+    return any(path.name.endswith(suffix) for suffix in COMPRESSION_SUFFIXES.values())
+
+
+def _product_gid(product_id: str | int) -> str:
+    text = str(product_id)
+    return text if text.startswith("gid://") else f"{PRODUCT_GID_PREFIX}{text}"
+
+
+class FramedSnapshotWriter:
+    """Snapshot sink producing a framed snapshot plus its index.
+
+    Same interface as ``SnapshotWriter``; ``commit`` writes the index before
+    renaming the data file into place, so a visible snapshot always has one.
+    """
+
+    def __init__(self, directory: pathlib.Path, compression: str = "gzip") -> None:
+        require_compression(compression)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.compression = compression
+        self.suffix = COMPRESSION_SUFFIXES[compression]
+        self.temp_path = directory / f".{uuid.uuid4().hex}{self.suffix}.tmp"
+        self._handle = self.temp_path.open("wb")
+        self._lines: list[bytes] = []
+        self._frames: list[list[int]] = []
+        self._products: dict[str, list[int]] = {}
+        self._handles: dict[str, str] = {}
+        self._skus: dict[str, str] = {}
+        self._meta: list[int] | None = None
+        self.edge_count = 0
+        self._finished = False
+
+    def _flush_frame(self) -> None:
+        if not self._lines:
+            return
+        frame = _compress(self.compression, b"".join(self._lines))
+        self._frames.append([self._handle.tell(), len(frame)])
+        self._handle.write(frame)
+        self._lines = []
+
+    def _add_line(self, value: object) -> list[int]:
+        if len(self._lines) >= FRAME_EDGES:
+            self._flush_frame()
+        position = [len(self._frames), len(self._lines)]
+        self._lines.append(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8") + b"\n")
+        return position
+
+    def write_edges(self, edges: Iterable[object]) -> None:
+        for edge in edges:
+            position = self._add_line(edge)
+            self.edge_count += 1
+            node = edge.get("node") if isinstance(edge, dict) else None
+            if not isinstance(node, dict) or not node.get("id"):
+                continue
+            product_id = str(node["id"])
+            self._products[product_id] = position
+            if node.get("handle"):
+                self._handles.setdefault(str(node["handle"]), product_id)
+            variants = node.get("variants")
+            variant_edges = variants.get("edges") if isinstance(variants, dict) else None
+            for variant_edge in variant_edges or []:
+                variant = variant_edge.get("node") if isinstance(variant_edge, dict) else None
+                if isinstance(variant, dict) and variant.get("sku"):
+                    # SKUs are not unique in Shopify; the first product wins.
+                    self._skus.setdefault(str(variant["sku"]), product_id)
+
+    def finish(self, shop: object, page_info: object, extensions: object = None) -> None:
+        self._flush_frame()
+        self._meta = self._add_line({"meta": {"shop": shop, "pageInfo": page_info, "extensions": extensions}})
+        self._flush_frame()
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+        self._handle.close()
+        self._finished = True
+
+    def commit(self, path: pathlib.Path) -> pathlib.Path:
+        if not self._finished:
+            raise RuntimeError("FramedSnapshotWriter.finish() must be called before commit()")
+        index = {
+            "format": FORMAT_VERSION,
+            "compression": self.compression,
+            "frames": self._frames,
+            "meta": self._meta,
+            "products": self._products,
+            "handles": self._handles,
+            "skus": self._skus,
+        }
+        temp_index = self.temp_path.with_name(self.temp_path.name + INDEX_SUFFIX)
+        try:
+            temp_index.write_text(json.dumps(index, separators=(",", ":")), encoding="utf-8")
+            os.replace(temp_index, index_path(path))
+        except BaseException:
+            temp_index.unlink(missing_ok=True)
+            raise
+        os.replace(self.temp_path, path)
+        return path
+
+    def abort(self) -> None:
+        if not self._handle.closed:
+            self._handle.close()
+        self.temp_path.unlink(missing_ok=True)
+
+
+class FramedSnapshot:
+    """Read a framed snapshot, decompressing only the frames a lookup needs."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        with index_path(path).open("r", encoding="utf-8") as handle:
+            self.index = json.load(handle)
+        if self.index.get("format") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported framed snapshot format {self.index.get('format')!r}")
+        self.compression = self.index.get("compression", "gzip")
+        self._cached: tuple[int, list[bytes]] | None = None
+
+    def _frame_lines(self, frame_index: int) -> list[bytes]:
+        if self._cached and self._cached[0] == frame_index:
+            return self._cached[1]
+        offset, length = self.index["frames"][frame_index]
+        with self.path.open("rb") as handle:
+            handle.seek(offset)
+            frame = handle.read(length)
+        lines = _decompress(self.compression, frame).splitlines()
+        self._cached = (frame_index, lines)
+        return lines
+
+    def _line(self, position: list[int] | None) -> dict | None:
+        if not position:
+            return None
+        frame_index, line_index = position
+        return json.loads(self._frame_lines(frame_index)[line_index])
+
+    def edge(self, product_id: str | int) -> dict | None:
+        return self._line(self.index["products"].get(_product_gid(product_id)))
+
+    def product(self, product_id: str | int) -> dict | None:
+        edge = self.edge(product_id)
+        return edge.get("node") if edge else None
+
+    def product_by_handle(self, handle: str) -> dict | None:
+        product_id = self.index["handles"].get(handle)
+        return self.product(product_id) if product_id else None
+
+    def product_by_sku(self, sku: str) -> dict | None:
+        product_id = self.index["skus"].get(sku)
+        return self.product(product_id) if product_id else None
+
+    def meta(self) -> dict:
+        record = self._line(self.index.get("meta")) or {}
+        return record.get("meta") or {}
+
+    def iter_edges(self) -> Iterator[dict]:
+        meta_frame = (self.index.get("meta") or [None])[0]
+        for frame_index in range(len(self.index["frames"])):
+            if frame_index == meta_frame:
+                continue
+            for line in self._frame_lines(frame_index):
+                yield json.loads(line)
+
+    def load(self) -> dict:
+        """Rebuild the whole snapshot in the raw-admin JSON shape."""
+        meta = self.meta()
+        snapshot: dict = {
+            "data": {
+                "products": {"edges": list(self.iter_edges()), "pageInfo": meta.get("pageInfo")},
+                "shop": meta.get("shop"),
+            }
+        }
+        if meta.get("extensions") is not None:
+            snapshot["extensions"] = meta["extensions"]
+        return snapshot
@@ -0,0 +1,140 @@
+"""Adaptive per-store refresh schedules for long-running collectors."""
+
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Iterable
+
+
+@dataclass(frozen=True)
+class Cadence:
+    """Refresh interval bounds (seconds) for one kind of task.
+
+    A run that found changes shortens the interval by ``speedup``; a run that
+    found none lengthens it by ``slowdown``, always within the bounds.
+    """
+
+    minimum: float
+    initial: float
+    maximum: float
+    speedup: float = 0.5
+    slowdown: float = 1.5
+
+    def adjust(self, interval: float, changed: bool | None) -> float:
+        if changed is None:
+            return interval
+        factor = self.speedup if changed else self.slowdown
+        return min(self.maximum, max(self.minimum, interval * factor))
+
+
+class RefreshScheduler:
+    """Due times and adaptive intervals for every (store, task) pair.
+
+    ``next_due`` hands out the most overdue task (lateness relative to its
+    interval) whose store is not busy; ``complete`` reschedules it from the
+    outcome. State survives restarts when ``state_path`` is given.
+    """
+
+    def __init__(self, cadences: dict[str, Cadence], state_path: pathlib.Path | None = None) -> None:
+        self.cadences = cadences
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[str, dict[str, float]]] = {}
+        if state_path is not None and state_path.is_file():
+            try:
+                loaded = json.loads(state_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                loaded = {}
+            if isinstance(loaded, dict):
+                self._entries = {
+                    store: {task: entry for task, entry in tasks.items() if task in cadences}
+                    for store, tasks in loaded.items()
+                    if isinstance(tasks, dict)
+                }
+
+    def sync(self, stores: Iterable[str], now: float | None = None) -> None:
+        """Track exactly ``stores`` and drop the rest.
+
+        A new store's first task (in ``cadences`` order) is due immediately and
+        the others one initial interval later.
+        """
+        now = time.time() if now is None else now
+        wanted = set(stores)
+        with self._lock:
+            for store in list(self._entries):
+                if store not in wanted:
+                    del self._entries[store]
+            for store in wanted:
+                tasks = self._entries.setdefault(store, {})
+                for position, (task, cadence) in enumerate(self.cadences.items()):
+                    tasks.setdefault(task, {"interval": cadence.initial, "due": now + (cadence.initial if position else 0.0)})
+
+    def next_due(self, busy: Iterable[str] = (), now: float | None = None) -> tuple[str, str] | None:
+        now = time.time() if now is None else now
+        busy = set(busy)
+        best: tuple[float, float, str, str] | None = None
+        with self._lock:
+            for store, tasks in self._entries.items():
+                if store in busy:
+                    continue
+                for task, entry in tasks.items():
+                    if entry["due"] > now:
+                        continue
+                    lateness = (now - entry["due"]) / max(entry["interval"], 1.0)
+                    candidate = (-lateness, entry["due"], store, task)
+                    if best is None or candidate < best:
+                        best = candidate
+        return (best[2], best[3]) if best else None
+
+    def complete(self, store: str, task: str, changed: bool | None, now: float | None = None) -> float:
+        """Reschedule after a run; ``changed=None`` (failed or unknown) keeps the interval. Returns it."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(store, {}).get(task)
+            if entry is None:
+                return 0.0
+            entry["interval"] = self.cadences[task].adjust(entry["interval"], changed)
+            entry["due"] = now + entry["interval"]
+            return entry["interval"]
+
+    def trigger(self, store: str, task: str, now: float | None = None) -> None:
+        """Make a task due now (e.g. a cheap probe found something the task should pick up)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(store, {}).get(task)
+            if entry is not None:
+                entry["due"] = min(entry["due"], now)
+
+    def defer(self, store: str, task: str, now: float | None = None) -> None:
+        """Push a task a full interval out without adapting it (another run already covered it)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(store, {}).get(task)
+            if entry is not None:
+                entry["due"] = max(entry["due"], now + entry["interval"])
+
+    def seconds_until_next(self, now: float | None = None) -> float | None:
+        now = time.time() if now is None else now
+        with self._lock:
+            dues = [entry["due"] for tasks in self._entries.values() for entry in tasks.values()]
+        return max(0.0, min(dues) - now) if dues else None
+
+    def save(self) -> None:
+        if self.state_path is None:
+            return
+        with self._lock:
+            payload = json.dumps(self._entries, indent=2, sort_keys=True)
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.state_path.with_name(f".{uuid.uuid4().hex}.tmp")
+        try:
+            temp_path.write_text(payload + "\n", encoding="utf-8")
+            os.replace(temp_path, self.state_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
@@ -0,0 +1,394 @@
+"""Pooled HTTP client shared by the Shopify Admin API fetchers."""
+
+from __future__ import annotations
+
+import gzip
+import http.client
+import json
+import os
+import random
+import re
+import ssl
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Iterator
+from urllib.parse import urlsplit
+
+ADMIN_BASE_URL_ENV = "SHOPIFY_ADMIN_BASE_URL"
+DEFAULT_TIMEOUT_SECONDS = 30.0
+DEFAULT_MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 30.0
+MAX_IDLE_PER_HOST = 8
+STREAM_CHUNK_SIZE = 1 << 16
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Statuses that mean the request was turned away unprocessed, so even a
+# non-idempotent request (a GraphQL mutation) can be resent.
+UNPROCESSED_STATUSES = frozenset({429})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+MUTATION_RE = re.compile(r"^\s*mutation\b", re.MULTILINE)
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+class ConnectError(OSError):
+    """Opening a connection failed, so nothing of the request reached the server."""
+
+
+class AdminAPIError(RuntimeError):
+    """Raised when an Admin API call fails after retries."""
+
+    def __init__(self, message: str, status: int | None = None) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class CallStats:
+    calls: int = 0
+    errors: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+    bytes_received: int = 0
+
+
+# observer(label, operation, seconds, bytes_received, retries, failed), called once per finished request.
+RequestObserver = Callable[[str, str, float, int, int, bool], None]
+
+
+def admin_api_url(shop: str, resource: str, api_version: str) -> str:
+    """Admin API URL for ``shop`` (store handle or myshopify host).
+
+    ``SHOPIFY_ADMIN_BASE_URL`` replaces ``https://{host}`` and may reference
+    ``{host}`` or ``{store_id}``, which lets runs target a local stub server.
+    """
+    host = shop.strip()
+    if "." not in host:
+        host = f"{host}.myshopify.com"
+    store_id = host.removesuffix(".myshopify.com")
+    template = os.getenv(ADMIN_BASE_URL_ENV) or "https://{host}"
+    base_url = template.format(host=host, store_id=store_id).rstrip("/")
+    return f"{base_url}/admin/api/{api_version}/{resource}"
+
+
+class ShopifyAdminClient:
+    """Keep-alive connections per host, gzip decoding, retries and per-operation timings."""
+
+    def __init__(
+        self,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        observer: RequestObserver | None = None,
+    ) -> None:
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.observer = observer
+        self._ssl_context = ssl.create_default_context()
+        self._idle: dict[tuple[str, str, int | None], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self._stats: dict[str, CallStats] = {}
+
+    def close(self) -> None:
+        with self._lock:
+            idle = [conn for conns in self._idle.values() for conn in conns]
+            self._idle.clear()
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict[str, CallStats]:
+        """Copy of the per-operation counters collected so far."""
+        with self._lock:
+            return {name: CallStats(**vars(stat)) for name, stat in self._stats.items()}
+
+    def _record(self, operation: str, **deltas: float) -> None:
+        with self._lock:
+            stat = self._stats.setdefault(operation, CallStats())
+            for field, delta in deltas.items():
+                setattr(stat, field, getattr(stat, field) + delta)
+
+    def _observe(self, label: str, operation: str, seconds: float, wire_bytes: int, retries: int, failed: bool) -> None:
+        if self.observer is not None:
+            self.observer(label, operation, seconds, wire_bytes, retries, failed)
+
+    def _checkout(self, key: tuple[str, str, int | None]) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, host, port = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        return conn, False
+
+    def _checkin(self, key: tuple[str, str, int | None], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < MAX_IDLE_PER_HOST:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        body: bytes | None,
+    ) -> tuple[int, dict[str, str], bytes, int]:
+        """Send one request over a pooled connection; returns status, headers, body and wire size."""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname or "", parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        while True:
+            conn, reused = self._checkout(key)
+            if conn.sock is None:
+                try:
+                    conn.connect()
+                except ssl.SSLCertVerificationError:
+                    conn.close()
+                    raise
+                except (OSError, http.client.HTTPException) as exc:
+                    conn.close()
+                    raise ConnectError(str(exc)) from exc
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                raw = response.read()
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if reused:
+                    # The server dropped an idle keep-alive connection before
+                    # reading the request; open a fresh one.
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            response_headers = {name.lower(): value for name, value in response.getheaders()}
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+            wire_bytes = len(raw)
+            if response_headers.get("content-encoding", "").lower() == "gzip":
+                raw = gzip.decompress(raw)
+            return response.status, response_headers, raw, wire_bytes
+
+    def _backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0.0), BACKOFF_CAP_SECONDS)
+            except ValueError:
+                pass
+        delay = min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+        return delay * (0.5 + random.random() / 2)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: dict[str, str] | None = None,
+        body: bytes | None = None,
+        label: str = "shopify",
+        operation: str = "request",
+        idempotent: bool | None = None,
+    ) -> bytes:
+        """Send a request and return the decoded body, retrying transient failures.
+
+        ``label`` prefixes error messages; ``operation`` names the timing bucket.
+        A non-``idempotent`` request (by default anything but GET, HEAD, OPTIONS,
+        PUT and DELETE) is only resent when it cannot have reached the server:
+        the connection failed to open, or the reply was a 429.
+        """
+        request_headers = {"Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        request_headers.update(headers or {})
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                status, response_headers, raw, wire_bytes = self._send(method, url, request_headers, body)
+            except ssl.SSLCertVerificationError as exc:
+                elapsed = time.perf_counter() - started
+                self._record(operation, calls=1, errors=1, seconds=elapsed)
+                self._observe(label, operation, elapsed, 0, attempt, True)
+                raise AdminAPIError(
+                    f"{label}: TLS certificate validation failed. Verify your system certificate bundle."
+                ) from exc
+            except (OSError, http.client.HTTPException) as exc:
+                elapsed = time.perf_counter() - started
+                if attempt < self.max_retries and (idempotent or isinstance(exc, ConnectError)):
+                    attempt += 1
+                    self._record(operation, retries=1, seconds=elapsed)
+                    time.sleep(self._backoff(attempt))
+                    continue
+                self._record(operation, calls=1, errors=1, seconds=elapsed)
+                self._observe(label, operation, elapsed, 0, attempt, True)
+                raise AdminAPIError(f"{label}: network error {exc}") from exc
+
+            elapsed = time.perf_counter() - started
+            if status in retry_statuses and attempt < self.max_retries:
+                attempt += 1
+                self._record(operation, retries=1, seconds=elapsed, bytes_received=wire_bytes)
+                time.sleep(self._backoff(attempt, response_headers.get("retry-after")))
+                continue
+
+            failed = status >= 400
+            self._record(operation, calls=1, errors=int(failed), seconds=elapsed, bytes_received=wire_bytes)
+            self._observe(label, operation, elapsed, wire_bytes, attempt, failed)
+            if failed:
+                detail = raw.decode("utf-8", errors="replace")
+                raise AdminAPIError(f"{label}: HTTP {status} {detail[:200]}", status=status)
+            return raw
+
+    def iter_lines(self, url: str, *, label: str = "shopify", operation: str = "download") -> Iterator[bytes]:
+        """GET ``url`` and yield its body line by line without holding it whole.
+
+        Connection errors and retryable statuses are retried as in ``request``
+        until the response starts; a failure while streaming raises
+        ``AdminAPIError``. The download is timed and counted as one call.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname or "", parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        headers = {"Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        attempt = 0
+        started = time.perf_counter()
+        while True:
+            conn, reused = self._checkout(key)
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+            except STALE_CONNECTION_ERRORS as exc:
+                conn.close()
+                if reused:
+                    continue
+                error: BaseException = exc
+            except (OSError, http.client.HTTPException) as exc:
+                conn.close()
+                error = exc
+            else:
+                if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                    response.read()
+                    conn.close()
+                    attempt += 1
+                    self._record(operation, retries=1)
+                    time.sleep(self._backoff(attempt, response.getheader("retry-after")))
+                    continue
+                break
+            if attempt < self.max_retries:
+                attempt += 1
+                self._record(operation, retries=1)
+                time.sleep(self._backoff(attempt))
+                continue
+            elapsed = time.perf_counter() - started
+            self._record(operation, calls=1, errors=1, seconds=elapsed)
+            self._observe(label, operation, elapsed, 0, attempt, True)
+            raise AdminAPIError(f"{label}: network error {error}") from error
+
+        wire_bytes = 0
+        failed = True
+        drained = False
+        try:
+            if response.status >= 400:
+                detail = response.read().decode("utf-8", errors="replace")
+                wire_bytes = len(detail)
+                raise AdminAPIError(f"{label}: HTTP {response.status} {detail[:200]}", status=response.status)
+            gzipped = (response.getheader("content-encoding") or "").lower() == "gzip"
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+            pending = b""
+            while True:
+                try:
+                    chunk = response.read(STREAM_CHUNK_SIZE)
+                except (OSError, http.client.HTTPException) as exc:
+                    raise AdminAPIError(f"{label}: network error {exc}") from exc
+                if not chunk:
+                    break
+                wire_bytes += len(chunk)
+                pending += decoder.decompress(chunk) if decoder is not None else chunk
+                *lines, pending = pending.split(b"\n")
+                yield from lines
+            if decoder is not None:
+                pending += decoder.flush()
+            drained = True
+            if pending:
+                yield pending
+            failed = False
+        except GeneratorExit:
+            # The caller stopped reading early; that is not a failed download.
+            failed = False
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self._record(operation, calls=1, errors=int(failed), seconds=elapsed, bytes_received=wire_bytes)
+            self._observe(label, operation, elapsed, wire_bytes, attempt, failed)
+            if not drained or response.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+
+    def _decode_json(self, raw: bytes, label: str) -> dict:
+        try:
+            parsed = json.loads(raw)
+        except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+            raise AdminAPIError(f"{label}: invalid JSON response ({exc})") from exc
+        if not isinstance(parsed, dict):
+            raise AdminAPIError(f"{label}: unexpected JSON payload")
+        return parsed
+
+    def get_json(self, url: str, token: str, *, label: str = "shopify", operation: str = "rest") -> dict:
+        raw = self.request(
+            "GET",
+            url,
+            headers={"Accept": "application/json", "X-Shopify-Access-Token": token},
+            label=label,
+            operation=operation,
+        )
+        return self._decode_json(raw, label)
+
+    def post_graphql(
+        self,
+        url: str,
+        token: str,
+        query: str,
+        variables: dict | None = None,
+        *,
+        label: str = "shopify",
+        operation: str = "graphql",
+        idempotent: bool | None = None,
+    ) -> dict:
+        """POST a GraphQL document; queries are retried like GETs, mutations only when unsent.
+
+        ``idempotent`` overrides the check for a ``mutation`` operation.
+        """
+        body = json.dumps({"query": query, "variables": variables or {}}).encode("utf-8")
+        if idempotent is None:
+            idempotent = MUTATION_RE.search(query) is None
+        raw = self.request(
+            "POST",
+            url,
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+                "X-Shopify-Access-Token": token,
+            },
+            body=body,
+            label=label,
+            operation=operation,
+            idempotent=idempotent,
+        )
+        return self._decode_json(raw, label)
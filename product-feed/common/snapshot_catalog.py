@@ -0,0 +1,253 @@
+"""Per-store SQLite catalog of normalized snapshot rows.
+
+Each committed snapshot becomes a row in ``snapshots`` (keyed by its timestamp
+stamp); products, variants, inventory levels, collections and images carry
+that ``snapshot_id`` so lookups across history are indexed queries, e.g.::
+
+    SELECT s.stamp, v.variant_id FROM variants v JOIN snapshots s USING (snapshot_id)
+    WHERE v.barcode = ?
+
+The JSON snapshot remains the export format; this database is written next to it.
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+import sqlite3
+from typing import Iterable
+
+CATALOG_FILENAME = "catalog.sqlite3"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    snapshot_id INTEGER PRIMARY KEY,
+    stamp TEXT UNIQUE,
+    product_count INTEGER NOT NULL DEFAULT 0,
+    shop TEXT
+);
+CREATE TABLE IF NOT EXISTS products (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(snapshot_id),
+    product_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    cursor TEXT,
+    handle TEXT,
+    title TEXT,
+    vendor TEXT,
+    product_type TEXT,
+    tags TEXT,
+    category TEXT,
+    material TEXT,
+    total_inventory INTEGER,
+    updated_at TEXT,
+    product_url TEXT,
+    description TEXT,
+    description_html TEXT,
+    PRIMARY KEY (snapshot_id, product_id)
+);
+CREATE TABLE IF NOT EXISTS variants (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(snapshot_id),
+    variant_id TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    title TEXT,
+    sku TEXT,
+    barcode TEXT,
+    price TEXT,
+    inventory_quantity INTEGER,
+    inventory_item_id TEXT,
+    tracked INTEGER,
+    weight_value REAL,
+    weight_unit TEXT,
+    selected_options TEXT,
+    variant_url TEXT,
+    PRIMARY KEY (snapshot_id, variant_id)
+);
+CREATE TABLE IF NOT EXISTS inventory_levels (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(snapshot_id),
+    variant_id TEXT NOT NULL,
+    location_name TEXT,
+    location_zip TEXT,
+    quantity_name TEXT,
+    quantity INTEGER
+);
+CREATE TABLE IF NOT EXISTS collections (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(snapshot_id),
+    product_id TEXT NOT NULL,
+    collection_id TEXT,
+    handle TEXT,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS images (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(snapshot_id),
+    product_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    url TEXT,
+    alt_text TEXT,
+    featured INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS products_handle ON products (handle, snapshot_id);
+CREATE INDEX IF NOT EXISTS products_updated_at ON products (updated_at);
+CREATE INDEX IF NOT EXISTS variants_sku ON variants (sku, snapshot_id);
+CREATE INDEX IF NOT EXISTS variants_barcode ON variants (barcode, snapshot_id);
+CREATE INDEX IF NOT EXISTS variants_product ON variants (snapshot_id, product_id);
+CREATE INDEX IF NOT EXISTS inventory_levels_variant ON inventory_levels (snapshot_id, variant_id);
+CREATE INDEX IF NOT EXISTS collections_collection ON collections (collection_id, snapshot_id);
+CREATE INDEX IF NOT EXISTS collections_product ON collections (snapshot_id, product_id);
+CREATE INDEX IF NOT EXISTS images_product ON images (snapshot_id, product_id);
+"""
+SNAPSHOT_TABLES = ("products", "variants", "inventory_levels", "collections", "images")
+
+
+def connect(path: pathlib.Path) -> sqlite3.Connection:
+    """Open (creating if needed) a catalog database in WAL mode."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Pages may be delivered from a helper thread; callers never use one connection concurrently.
+    connection = sqlite3.connect(path, isolation_level=None, timeout=30.0, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _edges(section: object) -> list:
+    if not isinstance(section, dict):
+        return []
+    edges = section.get("edges")
+    return edges if isinstance(edges, list) else []
+
+
+def _nodes(section: object) -> Iterable[dict]:
+    for edge in _edges(section):
+        node = edge.get("node") if isinstance(edge, dict) else None
+        if isinstance(node, dict):
+            yield node
+
+
+def _json(value: object) -> str | None:
+    return None if value is None else json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+def _get(value: object, *keys: str) -> object:
+    for key in keys:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+class SnapshotCatalog:
+    """Snapshot sink that loads each page into the store's SQLite catalog.
+
+    Rows go in under an open transaction against a provisional ``snapshots``
+    row; ``commit`` stamps that row with the snapshot's version and commits,
+    ``abort`` rolls everything back.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self._connection = connect(path)
+        self._connection.execute("BEGIN IMMEDIATE")
+        self.snapshot_id = self._connection.execute("INSERT INTO snapshots (stamp) VALUES (NULL)").lastrowid
+        self._position = 0
+        self._closed = False
+
+    def write_edges(self, edges: Iterable[object]) -> None:
+        products, variants, levels, collections, images = [], [], [], [], []
+        snapshot_id = self.snapshot_id
+        for edge in edges:
+            node = edge.get("node") if isinstance(edge, dict) else None
+            if not isinstance(node, dict) or not node.get("id"):
+                continue
+            product_id = str(node["id"])
+            products.append((
+                snapshot_id, product_id, self._position, edge.get("cursor"), node.get("handle"), node.get("title"),
+                node.get("vendor"), node.get("productType"), _json(node.get("tags")), _get(node, "category", "fullName"),
+                _get(node, "metafield", "value"), node.get("totalInventory"), node.get("updatedAt"),
+                node.get("productUrl"), node.get("description"), node.get("descriptionHtml"),
+            ))
+            self._position += 1
+            for variant in _nodes(node.get("variants")):
+                if not variant.get("id"):
+                    continue
+                variant_id = str(variant["id"])
+                inventory_item = variant.get("inventoryItem") if isinstance(variant.get("inventoryItem"), dict) else {}
+                tracked = inventory_item.get("tracked")
+                variants.append((
+                    snapshot_id, variant_id, product_id, variant.get("title"), variant.get("sku"), variant.get("barcode"),
+                    variant.get("price"), variant.get("inventoryQuantity"), inventory_item.get("id"),
+                    None if tracked is None else int(bool(tracked)),
+                    _get(inventory_item, "measurement", "weight", "value"), _get(inventory_item, "measurement", "weight", "unit"),
+                    _json(variant.get("selectedOptions")), variant.get("variantUrl"),
+                ))
+                for level in _nodes(inventory_item.get("inventoryLevels")):
+                    location_name = _get(level, "location", "name")
+                    location_zip = _get(level, "location", "address", "zip")
+                    for quantity in level.get("quantities") or []:
+                        if isinstance(quantity, dict):
+                            levels.append((
+                                snapshot_id, variant_id, location_name, location_zip,
+                                quantity.get("name"), quantity.get("quantity"),
+                            ))
+            for collection in _nodes(node.get("collections")):
+                collections.append((snapshot_id, product_id, collection.get("id"), collection.get("handle"), collection.get("title")))
+            featured = node.get("featuredImage")
+            if isinstance(featured, dict):
+                images.append((snapshot_id, product_id, -1, featured.get("url"), featured.get("altText"), 1))
+            for position, image in enumerate(_nodes(node.get("images"))):
+                images.append((snapshot_id, product_id, position, image.get("url"), image.get("altText"), 0))
+
+        execute = self._connection.executemany
+        execute(f"INSERT OR REPLACE INTO products VALUES ({', '.join('?' * 16)})", products)
+        execute(f"INSERT OR REPLACE INTO variants VALUES ({', '.join('?' * 14)})", variants)
+        execute("INSERT INTO inventory_levels VALUES (?, ?, ?, ?, ?, ?)", levels)
+        execute("INSERT INTO collections VALUES (?, ?, ?, ?, ?)", collections)
+        execute("INSERT INTO images VALUES (?, ?, ?, ?, ?, ?)", images)
+
+    def finish(self, shop: object, page_info: object, extensions: object = None) -> None:
+        self._connection.execute(
+            "UPDATE snapshots SET product_count = ?, shop = ? WHERE snapshot_id = ?",
+            (self._position, _json(shop), self.snapshot_id),
+        )
+
+    def commit(self, path: pathlib.Path) -> pathlib.Path:
+        """Stamp the loaded rows; a snapshot rewritten in place replaces the rows loaded for it before."""
+        stamp = path.name.split(".")[0]
+        connection = self._connection
+        for (replaced,) in connection.execute("SELECT snapshot_id FROM snapshots WHERE stamp = ?", (stamp,)).fetchall():
+            for table in SNAPSHOT_TABLES + ("snapshots",):
+                connection.execute(f"DELETE FROM {table} WHERE snapshot_id = ?", (replaced,))
+        connection.execute("UPDATE snapshots SET stamp = ? WHERE snapshot_id = ?", (stamp, self.snapshot_id))
+        connection.execute("COMMIT")
+        return self.path
+
+    def prune(self, retention: int) -> None:
+        """Delete snapshots (and their rows) beyond the newest ``retention``; also drops abandoned ones."""
+        connection = self._connection
+        expired = [
+            row[0] for row in connection.execute(
+                "SELECT snapshot_id FROM snapshots WHERE stamp IS NULL OR snapshot_id NOT IN "
+                "(SELECT snapshot_id FROM snapshots WHERE stamp IS NOT NULL ORDER BY stamp DESC LIMIT ?)",
+                (max(retention, 1),),
+            )
+        ]
+        if not expired:
+            return
+        placeholders = ", ".join("?" * len(expired))
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for table in SNAPSHOT_TABLES + ("snapshots",):
+                connection.execute(f"DELETE FROM {table} WHERE snapshot_id IN ({placeholders})", expired)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def close(self) -> None:
+        self._connection.close()
+        self._closed = True
+
+    def abort(self) -> None:
+        if self._closed:
+            return
+        if self._connection.in_transaction:
+            self._connection.execute("ROLLBACK")
+        self.close()
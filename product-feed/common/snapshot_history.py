@@ -0,0 +1,209 @@
+"""Content-addressed snapshot history: product nodes stored once, snapshots kept as manifests."""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import uuid
+from typing import Iterable
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from common.snapshot_writer import SnapshotWriter  # noqa: E402
+
+OBJECTS_DIR = "objects"
+MANIFESTS_DIR = "manifests"
+MANIFEST_SUFFIX = ".json.gz"
+
+
+def canonical_json(value: object) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def content_hash(value: object) -> str:
+    return hashlib.sha256(canonical_json(value)).hexdigest()
+
+
+def _write_atomic(path: pathlib.Path, payload: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.parent / f".{uuid.uuid4().hex}.tmp"
+    try:
+        temp_path.write_bytes(payload)
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+class SnapshotHistory:
+    """History for one store rooted at ``directory``.
+
+    ``objects/<aa>/<sha256>.json.gz`` holds each distinct product node (and shop
+    section) once; ``manifests/<version>.json.gz`` lists a snapshot's edge
+    cursors and object hashes. ``rebuild`` turns a manifest back into the
+    regular snapshot JSON.
+    """
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+        self.objects_dir = directory / OBJECTS_DIR
+        self.manifests_dir = directory / MANIFESTS_DIR
+
+    def object_path(self, digest: str) -> pathlib.Path:
+        return self.objects_dir / digest[:2] / f"{digest}.json.gz"
+
+    def put(self, value: object) -> str:
+        """Store ``value`` unless an identical object exists; return its hash."""
+        payload = canonical_json(value)
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self.object_path(digest)
+        if not path.exists():
+            _write_atomic(path, gzip.compress(payload, mtime=0))
+        return digest
+
+    def get(self, digest: str) -> object:
+        with gzip.open(self.object_path(digest), "rb") as handle:
+            return json.loads(handle.read())
+
+    def manifest_path(self, version: str) -> pathlib.Path:
+        return self.manifests_dir / f"{version}{MANIFEST_SUFFIX}"
+
+    def versions(self) -> list[str]:
+        """Recorded snapshot versions (timestamp stems), oldest first."""
+        if not self.manifests_dir.is_dir():
+            return []
+        return sorted(
+            p.name[: -len(MANIFEST_SUFFIX)]
+            for p in self.manifests_dir.glob(f"*{MANIFEST_SUFFIX}")
+            if not p.name.startswith(".")
+        )
+
+    def load_manifest(self, version: str) -> dict:
+        with gzip.open(self.manifest_path(version), "rb") as handle:
+            return json.loads(handle.read())
+
+    def write_manifest(self, version: str, manifest: dict) -> pathlib.Path:
+        path = self.manifest_path(version)
+        _write_atomic(path, gzip.compress(canonical_json(manifest), mtime=0))
+        return path
+
+    def recorder(self) -> HistoryRecorder:
+        return HistoryRecorder(self)
+
+    def rebuild(self, version: str, writer: SnapshotWriter) -> None:
+        """Stream ``version`` into ``writer`` (finished, not committed)."""
+        manifest = self.load_manifest(version)
+        writer.write_edges(
+            {"cursor": cursor, "node": self.get(digest)}
+            for cursor, digest in manifest.get("edges") or []
+        )
+        shop_digest = manifest.get("shop")
+        writer.finish(
+            self.get(shop_digest) if shop_digest else None,
+            manifest.get("pageInfo"),
+            manifest.get("extensions"),
+        )
+
+    def rebuild_to(self, version: str, path: pathlib.Path) -> pathlib.Path:
+        writer = SnapshotWriter(path.parent)
+        try:
+            self.rebuild(version, writer)
+            return writer.commit(path)
+        except BaseException:
+            writer.abort()
+            raise
+
+    def prune(self, retention: int) -> int:
+        """Drop manifests beyond ``retention`` and objects no manifest references.
+
+        Returns the number of objects removed.
+        """
+        versions = self.versions()
+        expired = versions[:-retention] if retention > 0 else versions
+        if not expired:
+            return 0
+        for version in expired:
+            self.manifest_path(version).unlink(missing_ok=True)
+        referenced: set[str] = set()
+        for version in self.versions():
+            manifest = self.load_manifest(version)
+            referenced.update(digest for _, digest in manifest.get("edges") or [])
+            if manifest.get("shop"):
+                referenced.add(manifest["shop"])
+        removed = 0
+        for path in self.objects_dir.glob("*/*.json.gz"):
+            if path.name[: -len(".json.gz")] not in referenced:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+
+class HistoryRecorder:
+    """Snapshot sink that records a manifest alongside the regular JSON writer.
+
+    Mirrors ``SnapshotWriter``: ``write_edges`` per page, ``finish`` once the
+    shop section is known, then ``commit`` with the snapshot path whose
+    timestamp stem becomes the history version.
+    """
+
+    def __init__(self, history: SnapshotHistory) -> None:
+        self.history = history
+        self._edges: list[list] = []
+        self._manifest: dict | None = None
+
+    def write_edges(self, edges: Iterable[object]) -> None:
+        for edge in edges:
+            if not isinstance(edge, dict):
+                continue
+            self._edges.append([edge.get("cursor"), self.history.put(edge.get("node"))])
+
+    def finish(self, shop: object, page_info: object, extensions: object = None) -> None:
+        self._manifest = {
+            "edges": self._edges,
+            "pageInfo": page_info,
+            "shop": self.history.put(shop) if shop is not None else None,
+            "extensions": extensions,
+        }
+
+    def commit(self, path: pathlib.Path) -> pathlib.Path:
+        if self._manifest is None:
+            raise RuntimeError("HistoryRecorder.finish() must be called before commit()")
+        return self.history.write_manifest(path.name.split(".")[0], self._manifest)
+
+    def abort(self) -> None:
+        # Objects already written stay until the next prune finds them unreferenced.
+        self._edges = []
+        self._manifest = None
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="List or rebuild snapshots from a store's deduplicated history.")
+    parser.add_argument("history_dir", type=pathlib.Path, help="Store history directory, e.g. data/shopify/raw-admin/<store_id>/history")
+    parser.add_argument("version", nargs="?", help="Snapshot version to rebuild (omit to list versions)")
+    parser.add_argument("--output", type=pathlib.Path, help="Where to write the rebuilt snapshot (default: ./<version>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    history = SnapshotHistory(args.history_dir)
+    if not args.version:
+        for version in history.versions():
+            print(version)
+        return 0
+    if not history.manifest_path(args.version).is_file():
+        print(f"Unknown snapshot version {args.version}", file=sys.stderr)
+        return 1
+    output = args.output or pathlib.Path(f"{args.version}.json")
+    print(history.rebuild_to(args.version, output.resolve()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
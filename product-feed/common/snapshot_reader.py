@@ -0,0 +1,354 @@
+"""Stream raw-admin snapshots without loading them whole.
+
+``SnapshotReader(path).iter_edges()`` decodes ``data.products.edges`` one edge
+at a time from a buffered scan of the file, and ``.shop()``,
+``.page_info()`` and ``.extensions()`` are read from the end of the file:
+snapshots are written with sorted keys, so ``pageInfo``, ``shop`` and
+``extensions`` follow the products array, which is not read at all. Files
+laid out differently fall back to stepping over the array one edge at a time,
+so memory stays flat however large the snapshot is. Framed ``.jsonl.gz``/``.jsonl.zst`` snapshots are read through
+``FramedSnapshot``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import io
+import json
+import os
+import pathlib
+import re
+import sys
+from typing import Iterable, Iterator, TextIO
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from common.framed_snapshot import FramedSnapshot, is_framed_snapshot  # noqa: E402
+
+CHUNK_SIZE = 1 << 20
+# Window read from the end of a snapshot for the sections after the products
+# array; doubled up to the maximum before falling back to a forward scan.
+TAIL_BYTES = 1 << 16
+MAX_TAIL_BYTES = 1 << 24
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class _JsonStream:
+    """Cursor over a JSON document read in chunks; only the unread tail stays buffered."""
+
+    def __init__(self, handle: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+
+    def _fill(self) -> bool:
+        chunk = self.handle.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, without consuming it."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("unexpected end of snapshot")
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"expected {char!r} but found {found!r}")
+        self.pos += 1
+
+    def value(self) -> object:
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number or literal ending the buffer may continue in the next chunk.
+            if end < len(self.buffer) or not self._fill():
+                self.pos = end
+                return value
+
+    def skip(self) -> None:
+        """Step over the value at the cursor, decoding at most one array element at a time."""
+        char = self.peek()
+        if char == "[":
+            for _ in self.elements():
+                self.value()
+        elif char == "{":
+            for _ in self.members():
+                self.skip()
+        else:
+            self.value()
+
+    def members(self) -> Iterator[str]:
+        """Keys of the object at the cursor; consume each value before asking for the next key."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            separator = self.peek()
+            self.pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"expected ',' or '}}' but found {separator!r}")
+
+    def elements(self) -> Iterator[None]:
+        """One step per element of the array at the cursor; consume each element before the next step."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield None
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"expected ',' or ']' but found {separator!r}")
+
+    def close_members(self, members: dict) -> None:
+        """Read ``key: value`` members into ``members`` up to and including the closing ``}``."""
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError(f"expected a key but found {key!r}")
+            self.expect(":")
+            members[key] = self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"expected ',' or '}}' but found {separator!r}")
+
+    def descend(self, keys: Iterable[str]) -> bool:
+        """Move the cursor to the value at ``keys``; False when a key is missing or not inside an object."""
+        for key in keys:
+            if self.peek() != "{":
+                return False
+            for found in self.members():
+                if found == key:
+                    break
+                self.skip()
+            else:
+                return False
+        return True
+
+
+def _as_datetime(value: str | dt.datetime | None) -> dt.datetime | None:
+    if value is None or isinstance(value, dt.datetime):
+        return value
+    try:
+        parsed = dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=dt.timezone.utc)
+
+
+def _folded(values: str | Iterable[str] | None) -> frozenset[str] | None:
+    if values is None:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    return frozenset(value.casefold() for value in values)
+
+
+def product_matches(
+    node: object,
+    vendor: str | Iterable[str] | None = None,
+    product_type: str | Iterable[str] | None = None,
+    updated_since: str | dt.datetime | None = None,
+    updated_before: str | dt.datetime | None = None,
+) -> bool:
+    """Whether a product node passes the filters.
+
+    ``vendor`` and ``product_type`` match case-insensitively (one value or
+    several); ``updatedAt`` must be at or after ``updated_since`` and before
+    ``updated_before``.
+    """
+    if not isinstance(node, dict):
+        return False
+    vendors, product_types = _folded(vendor), _folded(product_type)
+    if vendors is not None and str(node.get("vendor") or "").casefold() not in vendors:
+        return False
+    if product_types is not None and str(node.get("productType") or "").casefold() not in product_types:
+        return False
+    since, before = _as_datetime(updated_since), _as_datetime(updated_before)
+    if since is not None or before is not None:
+        updated_at = _as_datetime(node.get("updatedAt")) if isinstance(node.get("updatedAt"), str) else None
+        if updated_at is None:
+            return False
+        if since is not None and updated_at < since:
+            return False
+        if before is not None and updated_at >= before:
+            return False
+    return True
+
+
+class SnapshotReader:
+    """Lazy access to one raw-admin snapshot (JSON or framed)."""
+
+    def __init__(self, path: pathlib.Path, chunk_size: int = CHUNK_SIZE) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.framed = is_framed_snapshot(path)
+
+    def _tail(self) -> dict | None:
+        """The document minus ``data.products.edges``, parsed from the end of the file.
+
+        Only for files that open with ``{"data": {"products": {"edges": [``, so
+        every other section comes after the array. Parsing starts at the last
+        ``"pageInfo"`` key and must close exactly ``products``, ``data`` and
+        the document; ``None`` when the file is laid out differently.
+        """
+        with self.path.open("r", encoding="utf-8") as handle:
+            head = _JsonStream(handle, 4096)
+            try:
+                for key in ("data", "products", "edges"):
+                    head.expect("{")
+                    if head.value() != key:
+                        return None
+                    head.expect(":")
+                head.expect("[")
+            except ValueError:
+                return None
+        with self.path.open("rb") as handle:
+            size = handle.seek(0, os.SEEK_END)
+            window = TAIL_BYTES
+            while True:
+                handle.seek(max(0, size - window))
+                text = handle.read().decode("utf-8", errors="replace")
+                start = text.rfind('"pageInfo"')
+                if start >= 0 or window >= min(size, MAX_TAIL_BYTES):
+                    break
+                window *= 2
+        if start < 0:
+            return None
+        stream = _JsonStream(io.StringIO(text[start:]), self.chunk_size)
+        products: dict = {}
+        data: dict = {}
+        document: dict = {}
+        try:
+            stream.close_members(products)
+            for members in (data, document):
+                separator = stream.peek()
+                stream.pos += 1
+                if separator == ",":
+                    stream.close_members(members)
+                elif separator != "}":
+                    return None
+            try:
+                stream.peek()
+            except ValueError:
+                pass
+            else:
+                return None  # more closing brackets: the key belonged to a nested connection
+        except ValueError:
+            return None
+        if not isinstance(products.get("pageInfo"), dict):
+            return None
+        return {**document, "data": {**data, "products": products}}
+
+    def _section(self, keys: tuple[str, ...]) -> object:
+        tail = self._tail()
+        if tail is not None:
+            for key in keys:
+                tail = tail.get(key) if isinstance(tail, dict) else None
+            return tail
+        with self.path.open("r", encoding="utf-8") as handle:
+            stream = _JsonStream(handle, self.chunk_size)
+            return stream.value() if stream.descend(keys) else None
+
+    def _meta(self, key: str) -> object:
+        return FramedSnapshot(self.path).meta().get(key)
+
+    def shop(self) -> dict | None:
+        shop = self._meta("shop") if self.framed else self._section(("data", "shop"))
+        return shop if isinstance(shop, dict) else None
+
+    def page_info(self) -> dict | None:
+        page_info = self._meta("pageInfo") if self.framed else self._section(("data", "products", "pageInfo"))
+        return page_info if isinstance(page_info, dict) else None
+
+    def extensions(self) -> dict | None:
+        extensions = self._meta("extensions") if self.framed else self._section(("extensions",))
+        return extensions if isinstance(extensions, dict) else None
+
+    def iter_edges(self) -> Iterator[dict]:
+        """Product edges in snapshot order, decoded one at a time."""
+        if self.framed:
+            yield from FramedSnapshot(self.path).iter_edges()
+            return
+        with self.path.open("r", encoding="utf-8") as handle:
+            stream = _JsonStream(handle, self.chunk_size)
+            if not stream.descend(("data", "products", "edges")) or stream.peek() != "[":
+                return
+            for _ in stream.elements():
+                edge = stream.value()
+                if isinstance(edge, dict):
+                    yield edge
+
+    def iter_products(
+        self,
+        vendor: str | Iterable[str] | None = None,
+        product_type: str | Iterable[str] | None = None,
+        updated_since: str | dt.datetime | None = None,
+        updated_before: str | dt.datetime | None = None,
+    ) -> Iterator[dict]:
+        """Product nodes passing ``product_matches`` with the same filters."""
+        vendors, product_types = _folded(vendor), _folded(product_type)
+        since, before = _as_datetime(updated_since), _as_datetime(updated_before)
+        for edge in self.iter_edges():
+            node = edge.get("node")
+            if product_matches(node, vendors, product_types, since, before):
+                yield node
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Stream products (one JSON node per line) or the shop section out of a raw-admin snapshot.")
+    parser.add_argument("snapshot", type=pathlib.Path, help="Snapshot file (.json, .jsonl.gz or .jsonl.zst)")
+    parser.add_argument("--shop", action="store_true", help="Print the shop section instead of products")
+    parser.add_argument("--vendor", action="append", help="Only products from this vendor (repeatable, case-insensitive)")
+    parser.add_argument("--product-type", action="append", help="Only products of this productType (repeatable, case-insensitive)")
+    parser.add_argument("--updated-since", help="Only products with updatedAt at or after this ISO timestamp")
+    parser.add_argument("--updated-before", help="Only products with updatedAt before this ISO timestamp")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    for name in ("updated_since", "updated_before"):
+        if getattr(args, name) is not None and _as_datetime(getattr(args, name)) is None:
+            print(f"Invalid timestamp for --{name.replace('_', '-')}: {getattr(args, name)}", file=sys.stderr)
+            return 2
+    reader = SnapshotReader(args.snapshot)
+    if args.shop:
+        print(json.dumps(reader.shop(), indent=2, sort_keys=True))
+        return 0
+    for node in reader.iter_products(args.vendor, args.product_type, args.updated_since, args.updated_before):
+        sys.stdout.write(json.dumps(node, sort_keys=True) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
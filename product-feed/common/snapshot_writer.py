@@ -0,0 +1,70 @@
+"""Stream raw-admin snapshots to disk one page of product edges at a time."""
+
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import uuid
+from typing import Iterable
+
+INDENT = "  "
+
+
+def _dump_at(value: object, level: int) -> str:
+    """``json.dumps`` a value nested ``level`` deep in an ``indent=2`` document."""
+    text = json.dumps(value, indent=2, sort_keys=True)
+    # JSON escapes newlines inside strings, so every "\n" here is structural.
+    return text.replace("\n", "\n" + INDENT * level)
+
+
+class SnapshotWriter:
+    """Write ``{"data": {"products": {"edges": [...]}, "shop": ...}}`` incrementally.
+
+    Output is byte-identical to ``json.dump(snapshot, indent=2, sort_keys=True)``
+    followed by a newline, so memory stays flat regardless of catalog size.
+    Edges go to a hidden temp file in ``directory``; ``commit`` renames it into
+    place atomically and ``abort`` discards it.
+    """
+
+    suffix = ".json"
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        self.temp_path = directory / f".{uuid.uuid4().hex}.json.tmp"
+        self._handle = self.temp_path.open("w", encoding="utf-8")
+        self._handle.write('{\n  "data": {\n    "products": {\n      "edges": [')
+        self.edge_count = 0
+        self._finished = False
+
+    def write_edges(self, edges: Iterable[object]) -> None:
+        for edge in edges:
+            separator = ",\n" if self.edge_count else "\n"
+            self._handle.write(separator + INDENT * 4 + _dump_at(edge, 4))
+            self.edge_count += 1
+
+    def finish(self, shop: object, page_info: object, extensions: object = None) -> None:
+        """Close the document; ``extensions`` is omitted when ``None``."""
+        handle = self._handle
+        handle.write(("\n" + INDENT * 3 + "]") if self.edge_count else "]")
+        handle.write(",\n" + INDENT * 3 + '"pageInfo": ' + _dump_at(page_info, 3))
+        handle.write("\n" + INDENT * 2 + "},\n" + INDENT * 2 + '"shop": ' + _dump_at(shop, 2))
+        handle.write("\n" + INDENT + "}")
+        if extensions is not None:
+            handle.write(",\n" + INDENT + '"extensions": ' + _dump_at(extensions, 1))
+        handle.write("\n}\n")
+        handle.flush()
+        os.fsync(handle.fileno())
+        handle.close()
+        self._finished = True
+
+    def commit(self, path: pathlib.Path) -> pathlib.Path:
+        if not self._finished:
+            raise RuntimeError("SnapshotWriter.finish() must be called before commit()")
+        os.replace(self.temp_path, path)
+        return path
+
+    def abort(self) -> None:
+        if not self._handle.closed:
+            self._handle.close()
+        self.temp_path.unlink(missing_ok=True)
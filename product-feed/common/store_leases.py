@@ -0,0 +1,282 @@
+"""Expiring per-store leases so several workers can share one store list.
+
+A worker ``claim``s a store before processing it and ``release``s it with the
+outcome; a heartbeat thread keeps every held lease alive. A lease whose
+holder stopped heartbeating expires after ``ttl`` seconds and can be claimed
+again, and a store that succeeded less than ``refresh_interval`` seconds ago
+is left alone, so workers started by the same cron tick do not redo each
+other's stores. A store released after a failure only waits out
+``failure_backoff`` seconds before the next worker retries it.
+
+``SQLiteStoreLeases`` keeps the table in a local SQLite file (one machine or
+a shared volume); ``SupabaseStoreLeases`` uses ``feed_shopify.store_lease``
+through a Supabase client (created by the ``source_feed/shopify`` Medusa
+migrations in ``website/medusa-app``).
+"""
+
+from __future__ import annotations
+
+import abc
+import datetime as dt
+import os
+import pathlib
+import socket
+import sqlite3
+import threading
+import uuid
+from typing import Any, Iterable
+
+DEFAULT_LEASE_TTL_SECONDS = 10 * 60
+DEFAULT_REFRESH_INTERVAL_SECONDS = 30 * 60
+DEFAULT_FAILURE_BACKOFF_SECONDS = 2 * 60
+SUCCESS_STATE = "success"  # the only outcome that counts as completing the store
+LEASE_TABLE = "store_lease"
+# Rows start out expired and never completed.
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class StoreLeases(abc.ABC):
+    """Claim, renew and release store leases; subclasses implement the storage."""
+
+    def __init__(
+        self,
+        worker_id: str | None = None,
+        ttl: float = DEFAULT_LEASE_TTL_SECONDS,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL_SECONDS,
+        failure_backoff: float = DEFAULT_FAILURE_BACKOFF_SECONDS,
+    ) -> None:
+        self.worker_id = worker_id or default_worker_id()
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.failure_backoff = failure_backoff
+        self._lock = threading.Lock()
+        self._held: set[str] = set()
+        self._stop = threading.Event()
+        self._heartbeat: threading.Thread | None = None
+
+    # Storage hooks; times are aware UTC datetimes.
+    @abc.abstractmethod
+    def _insert_missing(self, store_ids: list[str]) -> None:
+        ...
+
+    @abc.abstractmethod
+    def _try_claim(self, store_id: str, now: dt.datetime) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def _extend(self, store_id: str, now: dt.datetime) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def _release(self, store_id: str, state: str, expires_at: dt.datetime, completed_at: dt.datetime | None) -> None:
+        ...
+
+    def ensure(self, store_ids: Iterable[str]) -> None:
+        """Create lease rows for stores that have none yet."""
+        store_ids = list(dict.fromkeys(store_ids))
+        if store_ids:
+            self._insert_missing(store_ids)
+
+    def claim(self, store_id: str) -> bool:
+        """Take the store's lease if it is free (or expired) and not recently completed."""
+        if not self._try_claim(store_id, dt.datetime.now(dt.timezone.utc)):
+            return False
+        with self._lock:
+            self._held.add(store_id)
+        return True
+
+    def holds(self, store_id: str) -> bool:
+        """Whether this worker still holds the lease (a failed heartbeat drops it)."""
+        with self._lock:
+            return store_id in self._held
+
+    def release(self, store_id: str, state: str) -> None:
+        """Give the lease up; only a success stamps ``completed_at``, a failure backs off briefly."""
+        with self._lock:
+            held = store_id in self._held
+            self._held.discard(store_id)
+        if not held:
+            return
+        now = dt.datetime.now(dt.timezone.utc)
+        if state == SUCCESS_STATE:
+            self._release(store_id, state, now, now)
+        else:
+            self._release(store_id, state, now + dt.timedelta(seconds=self.failure_backoff), None)
+
+    def renew(self) -> list[str]:
+        """Extend every held lease; returns the stores whose lease was lost."""
+        with self._lock:
+            held = sorted(self._held)
+        lost = []
+        for store_id in held:
+            try:
+                extended = self._extend(store_id, dt.datetime.now(dt.timezone.utc))
+            except Exception:  # noqa: BLE001
+                # A transient error is retried on the next beat; the lease only lapses at expiry.
+                continue
+            if not extended:
+                lost.append(store_id)
+        if lost:
+            with self._lock:
+                self._held.difference_update(lost)
+        return lost
+
+    def start_heartbeat(self, interval: float | None = None) -> None:
+        """Renew held leases every ``interval`` seconds (a third of the TTL by default)."""
+        if self._heartbeat is not None:
+            return
+        interval = interval if interval is not None else max(1.0, self.ttl / 3)
+
+        def beat() -> None:
+            while not self._stop.wait(interval):
+                self.renew()
+
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=beat, name="lease-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def _expires(self, now: dt.datetime) -> dt.datetime:
+        return now + dt.timedelta(seconds=self.ttl)
+
+    def _completed_before(self, now: dt.datetime) -> dt.datetime:
+        return now - dt.timedelta(seconds=self.refresh_interval)
+
+
+class SQLiteStoreLeases(StoreLeases):
+    """Leases in a local SQLite table (times as epoch seconds)."""
+
+    def __init__(self, path: pathlib.Path, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._execute(
+            f"CREATE TABLE IF NOT EXISTS {LEASE_TABLE} ("
+            "store_id TEXT PRIMARY KEY, owner TEXT, expires_at REAL NOT NULL, heartbeat_at REAL, "
+            "completed_at REAL NOT NULL, last_state TEXT)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _execute(self, sql: str, params: tuple | list = ()) -> int:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if isinstance(params, list):
+                cursor = conn.executemany(sql, params)
+            else:
+                cursor = conn.execute(sql, params)
+            conn.execute("COMMIT")
+            return cursor.rowcount
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _insert_missing(self, store_ids: list[str]) -> None:
+        self._execute(
+            f"INSERT OR IGNORE INTO {LEASE_TABLE} (store_id, expires_at, completed_at) VALUES (?, 0, 0)",
+            [(store_id,) for store_id in store_ids],
+        )
+
+    def _try_claim(self, store_id: str, now: dt.datetime) -> bool:
+        return self._execute(
+            f"UPDATE {LEASE_TABLE} SET owner = ?, expires_at = ?, heartbeat_at = ? "
+            "WHERE store_id = ? AND expires_at < ? AND completed_at < ?",
+            (self.worker_id, self._expires(now).timestamp(), now.timestamp(), store_id, now.timestamp(), self._completed_before(now).timestamp()),
+        ) == 1
+
+    def _extend(self, store_id: str, now: dt.datetime) -> bool:
+        return self._execute(
+            f"UPDATE {LEASE_TABLE} SET expires_at = ?, heartbeat_at = ? WHERE store_id = ? AND owner = ? AND expires_at >= ?",
+            (self._expires(now).timestamp(), now.timestamp(), store_id, self.worker_id, now.timestamp()),
+        ) == 1
+
+    def _release(self, store_id: str, state: str, expires_at: dt.datetime, completed_at: dt.datetime | None) -> None:
+        self._execute(
+            f"UPDATE {LEASE_TABLE} SET owner = NULL, expires_at = ?, completed_at = COALESCE(?, completed_at), last_state = ? "
+            "WHERE store_id = ? AND owner = ?",
+            (expires_at.timestamp(), completed_at.timestamp() if completed_at is not None else None, state, store_id, self.worker_id),
+        )
+
+    def rows(self) -> list[dict]:
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(f"SELECT * FROM {LEASE_TABLE} ORDER BY store_id")]
+        finally:
+            conn.close()
+
+
+def _timestamp(moment: dt.datetime) -> str:
+    # No "+00:00": a "+" would need escaping inside PostgREST filters.
+    return moment.astimezone(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class SupabaseStoreLeases(StoreLeases):
+    """Leases in ``feed_shopify.store_lease`` through a Supabase client.
+
+    Each claim, renewal and release is a single filtered ``UPDATE``, so
+    PostgREST applies it atomically and only the worker whose filter still
+    matched gets the row back.
+    """
+
+    def __init__(self, client: Any, schema: str = "feed_shopify", **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.client = client
+        self.schema = schema
+
+    def _table(self) -> Any:
+        return self.client.schema(self.schema).table(LEASE_TABLE)
+
+    def _insert_missing(self, store_ids: list[str]) -> None:
+        rows = [{"store_id": store_id, "expires_at": _timestamp(EPOCH), "completed_at": _timestamp(EPOCH)} for store_id in store_ids]
+        self._table().upsert(rows, on_conflict="store_id", ignore_duplicates=True).execute()
+
+    def _try_claim(self, store_id: str, now: dt.datetime) -> bool:
+        response = (
+            self._table()
+            .update({"owner": self.worker_id, "expires_at": _timestamp(self._expires(now)), "heartbeat_at": _timestamp(now)})
+            .eq("store_id", store_id)
+            .lt("expires_at", _timestamp(now))
+            .lt("completed_at", _timestamp(self._completed_before(now)))
+            .execute()
+        )
+        return bool(response.data)
+
+    def _extend(self, store_id: str, now: dt.datetime) -> bool:
+        response = (
+            self._table()
+            .update({"expires_at": _timestamp(self._expires(now)), "heartbeat_at": _timestamp(now)})
+            .eq("store_id", store_id)
+            .eq("owner", self.worker_id)
+            .gte("expires_at", _timestamp(now))
+            .execute()
+        )
+        return bool(response.data)
+
+    def _release(self, store_id: str, state: str, expires_at: dt.datetime, completed_at: dt.datetime | None) -> None:
+        values = {"owner": None, "expires_at": _timestamp(expires_at), "last_state": state}
+        if completed_at is not None:
+            values["completed_at"] = _timestamp(completed_at)
+        (
+            self._table()
+            .update(values)
+            .eq("store_id", store_id)
+            .eq("owner", self.worker_id)
+            .execute()
+        )
@@ -0,0 +1,161 @@
+"""Per-run request telemetry: latency percentiles, bytes, query cost, throttle waits and retries."""
+
+from __future__ import annotations
+
+import json
+import math
+import pathlib
+import threading
+from dataclasses import dataclass, field
+
+TABLE_COLUMNS = (
+    ("store", "{store}"),
+    ("operation", "{operation}"),
+    ("calls", "{calls}"),
+    ("err", "{errors}"),
+    ("retry", "{retries}"),
+    ("p50ms", "{p50_ms:.0f}"),
+    ("p95ms", "{p95_ms:.0f}"),
+    ("p99ms", "{p99_ms:.0f}"),
+    ("MB", "{megabytes:.2f}"),
+    ("req.cost", "{requested_cost:.0f}"),
+    ("act.cost", "{actual_cost:.0f}"),
+    ("waits", "{throttle_waits}"),
+    ("wait s", "{throttle_wait_seconds:.1f}"),
+)
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list (0.0 when empty)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+@dataclass
+class OperationMetrics:
+    calls: int = 0
+    errors: int = 0
+    retries: int = 0
+    bytes_received: int = 0
+    requested_cost: float = 0.0
+    actual_cost: float = 0.0
+    throttle_waits: int = 0
+    throttle_wait_seconds: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes_received": self.bytes_received,
+            "megabytes": self.bytes_received / 1_000_000,
+            "requested_cost": self.requested_cost,
+            "actual_cost": self.actual_cost,
+            "throttle_waits": self.throttle_waits,
+            "throttle_wait_seconds": round(self.throttle_wait_seconds, 3),
+            "total_seconds": round(sum(latencies), 3),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+
+
+class RunMetrics:
+    """Thread-safe metrics for one run, keyed by store and operation (query or REST resource)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: dict[tuple[str, str], OperationMetrics] = {}
+
+    def _entry(self, store: str, operation: str) -> OperationMetrics:
+        key = (store, operation)
+        entry = self._metrics.get(key)
+        if entry is None:
+            entry = self._metrics[key] = OperationMetrics()
+        return entry
+
+    def record_request(
+        self,
+        store: str,
+        operation: str,
+        seconds: float,
+        bytes_received: int,
+        retries: int = 0,
+        failed: bool = False,
+    ) -> None:
+        with self._lock:
+            entry = self._entry(store, operation)
+            entry.calls += 1
+            entry.errors += int(failed)
+            entry.retries += retries
+            entry.bytes_received += bytes_received
+            entry.latencies.append(seconds)
+
+    def record_cost(self, store: str, operation: str, requested: object, actual: object) -> None:
+        with self._lock:
+            entry = self._entry(store, operation)
+            if isinstance(requested, (int, float)):
+                entry.requested_cost += requested
+            if isinstance(actual, (int, float)):
+                entry.actual_cost += actual
+
+    def record_retry(self, store: str, operation: str) -> None:
+        with self._lock:
+            self._entry(store, operation).retries += 1
+
+    def record_throttle_wait(self, store: str, operation: str, seconds: float) -> None:
+        with self._lock:
+            entry = self._entry(store, operation)
+            entry.throttle_waits += 1
+            entry.throttle_wait_seconds += seconds
+
+    def reset(self) -> None:
+        with self._lock:
+            self._metrics.clear()
+
+    def summary(self) -> dict:
+        """``{"stores": {store: {"operations": {...}, "total": {...}}}, "total": {...}}``."""
+        with self._lock:
+            items = [(key, OperationMetrics(**{**vars(entry), "latencies": list(entry.latencies)})) for key, entry in self._metrics.items()]
+        stores: dict[str, dict] = {}
+        store_totals: dict[str, OperationMetrics] = {}
+        run_total = OperationMetrics()
+        for (store, operation), entry in sorted(items):
+            stores.setdefault(store, {"operations": {}})["operations"][operation] = entry.summary()
+            for total in (store_totals.setdefault(store, OperationMetrics()), run_total):
+                for name, value in vars(entry).items():
+                    if name == "latencies":
+                        total.latencies.extend(value)
+                    else:
+                        setattr(total, name, getattr(total, name) + value)
+        for store, total in store_totals.items():
+            stores[store]["total"] = total.summary()
+        return {"stores": stores, "total": run_total.summary()}
+
+    def write_json(self, path: pathlib.Path, **extra: object) -> pathlib.Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {**extra, **self.summary()}
+        path.write_text(json.dumps(payload, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        return path
+
+    def table(self) -> list[str]:
+        """Summary table rows (header first): one per store and operation, then per-store totals."""
+        summary = self.summary()
+        rows = []
+        for store, store_summary in summary["stores"].items():
+            for operation, values in store_summary["operations"].items():
+                rows.append({**values, "store": store, "operation": operation})
+            rows.append({**store_summary["total"], "store": store, "operation": "(total)"})
+        if len(summary["stores"]) > 1:
+            rows.append({**summary["total"], "store": "(all)", "operation": "(total)"})
+        cells = [[title for title, _ in TABLE_COLUMNS]]
+        cells.extend([template.format(**row) for _, template in TABLE_COLUMNS] for row in rows)
+        widths = [max(len(row[i]) for row in cells) for i in range(len(TABLE_COLUMNS))]
+        return [
+            "  ".join(cell.ljust(width) if i < 2 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths)))
+            for row in cells
+        ]
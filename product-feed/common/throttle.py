@@ -0,0 +1,150 @@
+"""Client-side pacing on a store's GraphQL query cost bucket.
+
+Shared by ``fetch_admin.py`` and ``pipeline/main.py`` so both follow one
+throttling policy: reserve a query's expected cost before sending it, track
+``extensions.cost.throttleStatus`` between responses, and size pages so one
+request fits the single-query limit and a share of the bucket.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+
+MAX_PAGE_SIZE = 250  # Shopify caps `first` at 250
+MAX_SINGLE_QUERY_COST = 1000  # Shopify rejects queries requesting more points
+# Keep a single page's requested cost under this share of the bucket so one
+# request never drains it and waits stay short.
+THROTTLE_BUCKET_SHARE = 0.5
+
+
+class ThrottleController:
+    """Client-side model of a store's GraphQL cost bucket.
+
+    State comes from ``extensions.cost.throttleStatus``; between responses the
+    bucket refills at ``restoreRate``. Requests reserve their expected cost
+    before they are sent, so concurrent callers for the same store share it;
+    a response's ``currentlyAvailable`` does not yet reflect the requests
+    still in flight, so their reservations are kept deducted from it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.maximum_available: float | None = None
+        self.currently_available: float | None = None
+        self.restore_rate: float | None = None
+        self.reserved = 0.0
+        self.observed_at = time.monotonic()
+        self.requested_costs: dict[str, tuple[int | None, float]] = {}
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+
+    def _available(self, now: float) -> float | None:
+        if self.currently_available is None or self.restore_rate is None:
+            return None
+        refilled = self.currently_available + (now - self.observed_at) * self.restore_rate
+        if self.maximum_available is not None:
+            refilled = min(refilled, self.maximum_available)
+        return refilled
+
+    def expected_cost(self, cost_key: str, first: int | None) -> float | None:
+        known = self.requested_costs.get(cost_key)
+        if known is None:
+            return None
+        known_first, cost = known
+        if first and known_first and first != known_first:
+            # Connection costs scale with `first`; close enough for pacing.
+            return cost * first / known_first
+        return cost
+
+    def acquire(self, cost_key: str, first: int | None = None) -> tuple[float, float]:
+        """Block until the bucket can cover the expected cost, then reserve it.
+
+        Returns the seconds waited and the reservation, which goes back through
+        ``observe`` (or ``release`` when the request failed).
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                available = self._available(now)
+                cost = self.expected_cost(cost_key, first)
+                if cost is not None and self.maximum_available is not None:
+                    # Never wait for more than a full bucket can hold.
+                    cost = min(cost, self.maximum_available)
+                if available is None or cost is None or available >= cost or not self.restore_rate:
+                    reservation = 0.0
+                    if available is not None and cost is not None:
+                        self.currently_available = available - cost
+                        self.observed_at = now
+                        reservation = cost
+                        self.reserved += cost
+                    return waited, reservation
+                delay = (cost - available) / self.restore_rate
+                self.wait_count += 1
+                self.wait_seconds += delay
+            time.sleep(delay)
+            waited += delay
+
+    def release(self, reservation: float) -> None:
+        """Return a reservation whose request never reached the store."""
+        with self._lock:
+            self.reserved = max(0.0, self.reserved - reservation)
+            if self.currently_available is not None:
+                self.currently_available += reservation
+
+    def observe(self, cost_key: str, first: int | None, extensions: dict | None, reservation: float = 0.0) -> None:
+        cost = (extensions or {}).get("cost")
+        with self._lock:
+            self.reserved = max(0.0, self.reserved - reservation)
+            if not isinstance(cost, dict):
+                return
+            requested = cost.get("requestedQueryCost")
+            if isinstance(requested, (int, float)):
+                self.requested_costs[cost_key] = (first, float(requested))
+            status = cost.get("throttleStatus")
+            if isinstance(status, dict):
+                for attr, key in (
+                    ("maximum_available", "maximumAvailable"),
+                    ("currently_available", "currentlyAvailable"),
+                    ("restore_rate", "restoreRate"),
+                ):
+                    value = status.get(key)
+                    if isinstance(value, (int, float)):
+                        setattr(self, attr, float(value))
+                if self.currently_available is not None:
+                    # Other requests were reserved against the bucket but not yet charged by the store.
+                    self.currently_available -= self.reserved
+                self.observed_at = time.monotonic()
+
+    def exceeds_bucket(self, cost_key: str, first: int | None) -> bool:
+        cost = self.expected_cost(cost_key, first)
+        return cost is not None and self.maximum_available is not None and cost > self.maximum_available
+
+    def suggest_page_size(self, cost_key: str, page_size: int) -> int:
+        """Scale ``page_size`` so one page's requested cost fits the target budget."""
+        with self._lock:
+            cost = self.expected_cost(cost_key, page_size)
+            budget = float(MAX_SINGLE_QUERY_COST)
+            if self.maximum_available:
+                budget = min(budget, self.maximum_available * THROTTLE_BUCKET_SHARE)
+        if not cost or cost <= 0:
+            return page_size
+        scaled = int(page_size * budget / cost)
+        return max(1, min(scaled, page_size * 2, MAX_PAGE_SIZE))
+
+
+def query_cost_key(query: str) -> str:
+    match = re.search(r"\b(?:query|mutation)\s+(\w+)", query)
+    return match.group(1) if match else query
+
+
+def error_codes(errors: object) -> set[str]:
+    if not isinstance(errors, list):
+        return set()
+    return {
+        str((error.get("extensions") or {}).get("code"))
+        for error in errors
+        if isinstance(error, dict) and isinstance(error.get("extensions"), dict)
+    }
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Benchmark the Shopify fetch strategies against the synthetic Admin API stub.
+
+Each strategy runs as its own process against a fresh in-process stub store
+and reports wall time, products/sec, the child's peak RSS and the stub's
+request, throttle and byte counters.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+from stub_admin import MAX_QUERY_COST, StubState, SyntheticCatalog, start_server  # noqa: E402
+from fetch_admin import latest_snapshot_path, load_snapshot, snapshot_product_edges  # noqa: E402
+
+SHOPIFY_DIR = pathlib.Path(__file__).resolve().parents[1]
+FETCH_ADMIN = SHOPIFY_DIR / "fetch_admin.py"
+PIPELINE_DIR = SHOPIFY_DIR / "pipeline"
+BENCH_STORE = "bench"
+# fetch_admin.py arguments per strategy; "incremental" runs on top of an unmeasured bulk snapshot.
+STRATEGIES = {
+    "paged": [],
+    "partitioned": ["--partitions", "4"],
+    "commerce": ["--profile", "commerce"],
+    "inventory": ["--profile", "inventory"],
+    "bulk": ["--bulk"],
+    "incremental": ["--incremental"],
+    "pipeline": None,
+}
+# Lean profiles merge into the newest snapshot, so they are measured on top of a bulk one too.
+SEEDED_STRATEGIES = frozenset({"commerce", "inventory", "incremental"})
+PIPELINE_DRIVER = """
+import sys
+sys.path.insert(0, sys.argv[1])
+import main
+print(len(main.fetch_all_products(sys.argv[2], "benchmark-token")))
+"""
+
+
+def run_measured(command: list[str], env: dict[str, str]) -> tuple[float, float, int, str]:
+    """Run ``command``; returns ``(seconds, peak RSS in MB, exit code, stdout)``."""
+    started = time.perf_counter()
+    with tempfile.TemporaryFile() as output:
+        process = subprocess.Popen(command, env=env, stdout=output, stderr=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        elapsed = time.perf_counter() - started
+        output.seek(0)
+        stdout = output.read().decode("utf-8", "replace")
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return elapsed, peak_mb, process.returncode, stdout
+
+
+def fetch_admin_command(config_path: pathlib.Path, output_dir: pathlib.Path, page_size: int, extra: list[str]) -> list[str]:
+    return [
+        sys.executable, str(FETCH_ADMIN), "--config", str(config_path), "--output", str(output_dir),
+        "--page-size", str(page_size), "--log-to-stdout", *extra,
+    ]
+
+
+def snapshot_product_count(output_dir: pathlib.Path) -> int:
+    path = latest_snapshot_path(output_dir / BENCH_STORE)
+    return len(snapshot_product_edges(load_snapshot(path))) if path is not None else 0
+
+
+def stub_totals(state: StubState) -> dict:
+    totals = {"requests": 0, "throttled": 0, "bytes": 0, "operations": {}}
+    with state.lock:
+        for operations in state.stats.values():
+            for operation, entry in operations.items():
+                totals["requests"] += entry["requests"]
+                totals["throttled"] += entry["throttled"]
+                totals["bytes"] += entry["bytes"]
+                totals["operations"][operation] = entry["requests"]
+    return totals
+
+
+def run_strategy(name: str, state: StubState, workdir: pathlib.Path, config_path: pathlib.Path, env: dict[str, str], page_size: int) -> dict:
+    output_dir = workdir / name
+    if name == "pipeline":
+        if importlib.util.find_spec("supabase") is None or importlib.util.find_spec("dotenv") is None:
+            return {"strategy": name, "skipped": "pipeline/main.py needs supabase and python-dotenv"}
+        # The pipeline's page sizes are fitted to the query cost limit, so --page-size does not apply.
+        command = [sys.executable, "-c", PIPELINE_DRIVER, str(PIPELINE_DIR), BENCH_STORE]
+    else:
+        if name in SEEDED_STRATEGIES:
+            subprocess.run(fetch_admin_command(config_path, output_dir, page_size, ["--bulk"]), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        command = fetch_admin_command(config_path, output_dir, page_size, STRATEGIES[name])
+    state.reset_stats()
+    seconds, peak_mb, exit_code, stdout = run_measured(command, env)
+    totals = stub_totals(state)
+    if name == "pipeline":
+        lines = stdout.strip().splitlines()
+        products = int(lines[-1]) if exit_code == 0 and lines and lines[-1].isdigit() else 0
+    else:
+        products = snapshot_product_count(output_dir)
+    return {
+        "strategy": name,
+        "exit_code": exit_code,
+        "products": products,
+        "seconds": round(seconds, 3),
+        "products_per_second": round(products / seconds, 1) if seconds > 0 else None,
+        "peak_rss_mb": round(peak_mb, 1),
+        "requests": totals["requests"],
+        "throttled": totals["throttled"],
+        "megabytes": round(totals["bytes"] / (1024 * 1024), 2),
+        "operations": totals["operations"],
+    }
+
+
+def format_table(results: list[dict], expected: int) -> str:
+    lines = [f"{'strategy':<12} {'products':>8} {'seconds':>8} {'prod/s':>8} {'peakMB':>7} {'requests':>8} {'throttled':>9} {'MB':>7}  note"]
+    for result in results:
+        if "skipped" in result:
+            lines.append(f"{result['strategy']:<12} {'-':>8} {'-':>8} {'-':>8} {'-':>7} {'-':>8} {'-':>9} {'-':>7}  skipped: {result['skipped']}")
+            continue
+        note = ""
+        if result["exit_code"] != 0:
+            note = f"exit code {result['exit_code']}"
+        elif result["products"] != expected:
+            note = f"expected {expected} products"
+        lines.append(
+            f"{result['strategy']:<12} {result['products']:>8} {result['seconds']:>8.2f} {result['products_per_second'] or 0:>8.1f} "
+            f"{result['peak_rss_mb']:>7.1f} {result['requests']:>8} {result['throttled']:>9} {result['megabytes']:>7.2f}  {note}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark Shopify fetch strategies against a synthetic Admin API")
+    parser.add_argument("--products", default=250, type=int, help="Products in the synthetic catalog")
+    parser.add_argument("--variants", default="1-8", help="Variants per product: a count (3) or an inclusive range (1-8)")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES), help=f"Comma-separated strategies to run ({', '.join(STRATEGIES)})")
+    parser.add_argument("--page-size", default=50, type=int, help="Starting products per page")
+    parser.add_argument("--bucket-size", default=20000.0, type=float, help="Stub query cost bucket size (Shopify Plus: 20000)")
+    parser.add_argument("--restore-rate", default=1000.0, type=float, help="Stub cost points restored per second (Shopify Plus: 1000)")
+    parser.add_argument(
+        "--max-query-cost",
+        default=0,
+        type=int,
+        help=f"Stub single-query cost limit; Shopify enforces {MAX_QUERY_COST}, which the nested full/inventory queries exceed, so 0 (off) is the default",
+    )
+    parser.add_argument("--latency-ms", default=50.0, type=float, help="Stub delay per API response")
+    parser.add_argument("--jitter-ms", default=20.0, type=float, help="Stub random extra delay of up to this many milliseconds")
+    parser.add_argument("--json", dest="json_path", type=pathlib.Path, help="Also write the results (with per-operation request counts) to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    names = [name.strip() for name in args.strategies.split(",") if name.strip()]
+    unknown = [name for name in names if name not in STRATEGIES]
+    if unknown:
+        print(f"Unknown strategies: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    catalog = SyntheticCatalog(args.products, args.variants)
+    state = StubState(catalog, args.bucket_size, args.restore_rate, args.latency_ms, args.jitter_ms, args.max_query_cost)
+    server = start_server(state)
+    results: list[dict] = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="shopify-bench-") as temp:
+            workdir = pathlib.Path(temp)
+            config_path = workdir / "shops.json"
+            config_path.write_text(json.dumps({"stores": [{"store_id": BENCH_STORE, "admin_token": "benchmark-token", "return_window_days": 30}]}), encoding="utf-8")
+            env = {**os.environ, "SHOPIFY_ADMIN_BASE_URL": f"{state.base_url}/{{store_id}}"}
+            for name in names:
+                print(f"Running {name}...", file=sys.stderr, flush=True)
+                results.append(run_strategy(name, state, workdir, config_path, env, args.page_size))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(format_table(results, args.products))
+    if args.json_path is not None:
+        report = {"catalog": {"products": args.products, "variants": args.variants}, "stub": {"bucket_size": args.bucket_size, "restore_rate": args.restore_rate, "max_query_cost": args.max_query_cost, "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms}, "results": results}
+        args.json_path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0 if all(result.get("exit_code", 0) == 0 for result in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,914 @@
+#!/usr/bin/env python3
+"""Synthetic Shopify Admin API server for local runs and benchmarks.
+
+Serves ``graphql.json``, ``policies.json`` and ``shipping_zones.json`` under
+``/<store_id>/admin/api/<version>/`` for a generated catalog of configurable
+size and variant fan-out. GraphQL documents are parsed and projected onto the
+catalog (fragments, aliases, arguments and connections), so every query the
+collectors send is answered in the shape it asked for. Each store has a
+cost-based leaky bucket like Shopify's (``THROTTLED`` and
+``MAX_COST_EXCEEDED`` included), and responses can be delayed to simulate
+latency. Point the collectors at it with
+``SHOPIFY_ADMIN_BASE_URL=http://127.0.0.1:<port>/{store_id}``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import datetime as dt
+import gzip
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator
+
+DEFAULT_PORT = 8900
+DEFAULT_PRODUCTS = 1000
+DEFAULT_VARIANTS = "1-8"
+DEFAULT_BUCKET_SIZE = 2000.0
+DEFAULT_RESTORE_RATE = 100.0
+MAX_QUERY_COST = 1000
+BULK_OPERATION_COST = 10
+CATALOG_EPOCH = dt.datetime(2025, 1, 1, tzinfo=dt.timezone.utc)
+VENDORS = ("Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark", "Wayne")
+PRODUCT_TYPES = ("Shirt", "Shoe", "Bag", "Hat", "Jacket", "Sock")
+SIZES = ("XS", "S", "M", "L", "XL", "XXL")
+COLORS = ("Black", "White", "Red", "Blue", "Green", "Grey", "Navy", "Olive")
+TOKEN_PATTERN = re.compile(
+    r'(?P<skip>[\s,]+|#[^\n]*)|(?P<spread>\.\.\.)|(?P<punct>[{}():\[\]!$=@])'
+    r'|(?P<string>"(?:[^"\\]|\\.)*")|(?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)|(?P<name>[_A-Za-z][_0-9A-Za-z]*)'
+)
+SEARCH_TERM_PATTERN = re.compile(r"(\w+):(>=|<=|>|<)?'?([^'\s)]+)'?")
+
+
+class GraphQLError(ValueError):
+    def __init__(self, message: str, code: str | None = None) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+# --- GraphQL documents -------------------------------------------------------
+
+
+@dataclass
+class Field:
+    name: str
+    alias: str | None
+    args: dict
+    selections: list
+
+
+@dataclass
+class FragmentSpread:
+    name: str
+
+
+@dataclass
+class InlineFragment:
+    type_condition: str | None
+    selections: list
+
+
+@dataclass
+class Variable:
+    name: str
+
+
+@dataclass
+class Document:
+    operation: str
+    name: str | None
+    selections: list
+    fragments: dict[str, InlineFragment]
+
+
+class Parser:
+    """Just enough of the GraphQL grammar for executable documents."""
+
+    def __init__(self, source: str) -> None:
+        self.tokens: list[tuple[str, str]] = []
+        position = 0
+        while position < len(source):
+            match = TOKEN_PATTERN.match(source, position)
+            if match is None:
+                raise GraphQLError(f"Unexpected character {source[position]!r} at {position}")
+            position = match.end()
+            if match.lastgroup != "skip":
+                self.tokens.append((match.lastgroup, match.group()))
+        self.position = 0
+
+    def peek(self) -> tuple[str, str] | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected: str | None = None) -> str:
+        token = self.peek()
+        if token is None or (expected is not None and token[1] != expected):
+            raise GraphQLError(f"Expected {expected or 'token'}, got {token[1] if token else 'end of document'}")
+        self.position += 1
+        return token[1]
+
+    def accept(self, value: str) -> bool:
+        token = self.peek()
+        if token is not None and token[1] == value:
+            self.position += 1
+            return True
+        return False
+
+    def document(self) -> Document:
+        operation: tuple[str, str | None, list] | None = None
+        fragments: dict[str, InlineFragment] = {}
+        while self.peek() is not None:
+            if self.peek()[1] == "{":
+                operation = ("query", None, self.selection_set())
+                continue
+            keyword = self.take()
+            if keyword == "fragment":
+                name = self.take()
+                self.take("on")
+                type_condition = self.take()
+                self.directives()
+                fragments[name] = InlineFragment(type_condition, self.selection_set())
+            elif keyword in ("query", "mutation", "subscription"):
+                name = self.take() if self.peek() and self.peek()[0] == "name" else None
+                if self.accept("("):
+                    depth = 1
+                    while depth:
+                        token = self.take()
+                        depth += {"(": 1, ")": -1}.get(token, 0)
+                self.directives()
+                operation = (keyword, name, self.selection_set())
+            else:
+                raise GraphQLError(f"Unexpected {keyword!r}")
+        if operation is None:
+            raise GraphQLError("Document has no operation")
+        return Document(operation[0], operation[1], operation[2], fragments)
+
+    def directives(self) -> None:
+        while self.accept("@"):
+            self.take()
+            if self.peek() and self.peek()[1] == "(":
+                self.arguments()
+
+    def selection_set(self) -> list:
+        self.take("{")
+        selections: list = []
+        while not self.accept("}"):
+            if self.accept("..."):
+                if self.accept("on"):
+                    type_condition = self.take()
+                    self.directives()
+                    selections.append(InlineFragment(type_condition, self.selection_set()))
+                elif self.peek() and self.peek()[1] == "{":
+                    selections.append(InlineFragment(None, self.selection_set()))
+                else:
+                    selections.append(FragmentSpread(self.take()))
+                    self.directives()
+                continue
+            name = self.take()
+            alias = None
+            if self.accept(":"):
+                alias, name = name, self.take()
+            args = self.arguments() if self.peek() and self.peek()[1] == "(" else {}
+            self.directives()
+            children = self.selection_set() if self.peek() and self.peek()[1] == "{" else []
+            selections.append(Field(name, alias, args, children))
+        return selections
+
+    def arguments(self) -> dict:
+        self.take("(")
+        args = {}
+        while not self.accept(")"):
+            name = self.take()
+            self.take(":")
+            args[name] = self.value()
+        return args
+
+    def value(self) -> object:
+        kind, token = self.peek() or ("", "")
+        if token == "$":
+            self.take()
+            return Variable(self.take())
+        if token == "[":
+            self.take()
+            items = []
+            while not self.accept("]"):
+                items.append(self.value())
+            return items
+        if token == "{":
+            self.take()
+            fields = {}
+            while not self.accept("}"):
+                name = self.take()
+                self.take(":")
+                fields[name] = self.value()
+            return fields
+        self.take()
+        if kind == "string":
+            return json.loads(token)
+        if kind == "number":
+            return float(token) if any(c in token for c in ".eE") else int(token)
+        return {"true": True, "false": False, "null": None}.get(token, token)
+
+
+def resolve_value(value: object, variables: dict) -> object:
+    if isinstance(value, Variable):
+        return variables.get(value.name)
+    if isinstance(value, list):
+        return [resolve_value(item, variables) for item in value]
+    if isinstance(value, dict):
+        return {key: resolve_value(item, variables) for key, item in value.items()}
+    return value
+
+
+def collect_fields(selections: list, typename: str | None, fragments: dict[str, InlineFragment]) -> Iterator[Field]:
+    for selection in selections:
+        if isinstance(selection, Field):
+            yield selection
+            continue
+        fragment = fragments.get(selection.name) if isinstance(selection, FragmentSpread) else selection
+        if fragment is None:
+            raise GraphQLError(f"Unknown fragment {selection.name}")
+        if fragment.type_condition is None or typename is None or fragment.type_condition == typename:
+            yield from collect_fields(fragment.selections, typename, fragments)
+
+
+def connection_item_fields(field: Field, fragments: dict[str, InlineFragment]) -> list[Field]:
+    """Selections applied to each node of a connection field (``edges { node }`` and ``nodes``)."""
+    items: list[Field] = []
+    for child in collect_fields(field.selections, None, fragments):
+        if child.name == "nodes":
+            items.append(child)
+        elif child.name == "edges":
+            items.extend(grandchild for grandchild in collect_fields(child.selections, None, fragments) if grandchild.name == "node")
+    return items
+
+
+def is_connection(field: Field, fragments: dict[str, InlineFragment]) -> bool:
+    return any(child.name in ("edges", "nodes", "pageInfo") for child in collect_fields(field.selections, None, fragments))
+
+
+def requested_cost(selections: list, fragments: dict[str, InlineFragment], variables: dict) -> int:
+    """Shopify's static cost: objects cost 1, connections 2 plus ``first`` times their node cost."""
+    total = 0
+    for field in collect_fields(selections, None, fragments):
+        if not field.selections:
+            continue
+        if is_connection(field, fragments):
+            args = resolve_value(field.args, variables)
+            size = args.get("first") or args.get("last") or 0
+            per_item = sum(1 + requested_cost(item.selections, fragments, variables) for item in connection_item_fields(field, fragments))
+            total += 2 + int(size) * per_item
+        else:
+            total += 1 + requested_cost(field.selections, fragments, variables)
+    return total
+
+
+# --- Synthetic catalog -------------------------------------------------------
+
+
+def gid(resource: str, number: int) -> str:
+    return f"gid://shopify/{resource}/{number}"
+
+
+def gid_number(value: object) -> int | None:
+    try:
+        return int(str(value).rsplit("/", 1)[-1])
+    except ValueError:
+        return None
+
+
+def timestamp(moment: dt.datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class SyntheticCatalog:
+    """Deterministic products 1..N; each one is generated on demand from ``seed``.
+
+    ``variants`` is a fixed fan-out (``3``) or an inclusive range (``1-8``).
+    Variant and inventory item IDs are ``product * 10000 + index``.
+    """
+
+    def __init__(
+        self,
+        products: int = DEFAULT_PRODUCTS,
+        variants: str = DEFAULT_VARIANTS,
+        images: int = 3,
+        collections: int = 2,
+        locations: int = 2,
+        seed: int = 1,
+    ) -> None:
+        low, _, high = str(variants).partition("-")
+        self.size = products
+        self.variant_range = (max(1, int(low)), max(1, int(high or low)))
+        self.images = images
+        self.collections = collections
+        self.locations = locations
+        self.seed = seed
+
+    def _random(self, number: int) -> random.Random:
+        return random.Random(self.seed * 1_000_003 + number)
+
+    def variant_count(self, number: int) -> int:
+        low, high = self.variant_range
+        return low if low == high else self._random(number).randint(low, high)
+
+    def product(self, number: int) -> dict | None:
+        if not 1 <= number <= self.size:
+            return None
+        rng = self._random(number)
+        handle = f"product-{number}"
+        created = CATALOG_EPOCH + dt.timedelta(minutes=number)
+        updated = created + dt.timedelta(days=rng.randint(0, 90))
+        variants = [self.variant(number, index, rng) for index in range(self.variant_count(number))]
+        images = [
+            {"__typename": "Image", "id": gid("ProductImage", number * 100 + index), "url": f"https://cdn.example.com/{handle}/{index}.jpg", "altText": f"Product {number} image {index}"}
+            for index in range(self.images)
+        ]
+        description = f"Synthetic product {number}. " * rng.randint(2, 12)
+        return {
+            "__typename": "Product",
+            "id": gid("Product", number),
+            "handle": handle,
+            "title": f"Product {number}",
+            "description": description.strip(),
+            "descriptionHtml": f"<p>{description.strip()}</p>",
+            "vendor": VENDORS[number % len(VENDORS)],
+            "productType": PRODUCT_TYPES[number % len(PRODUCT_TYPES)],
+            "status": "ACTIVE",
+            "tags": sorted(rng.sample(("new", "sale", "summer", "winter", "eco", "limited"), 2)),
+            "category": {"id": gid("TaxonomyCategory", number % 50), "fullName": f"Apparel > {PRODUCT_TYPES[number % len(PRODUCT_TYPES)]}"},
+            "featuredImage": dict(images[0]) if images else None,
+            "images": images,
+            "collections": [
+                {"__typename": "Collection", "id": gid("Collection", (number + index) % 25 + 1), "handle": f"collection-{(number + index) % 25 + 1}", "title": f"Collection {(number + index) % 25 + 1}"}
+                for index in range(self.collections)
+            ],
+            "createdAt": timestamp(created),
+            "updatedAt": timestamp(updated),
+            "totalInventory": sum(variant["inventoryQuantity"] for variant in variants),
+            "metafield": {"value": rng.choice(("cotton", "wool", "linen", "polyester"))},
+            "onlineStoreUrl": f"https://shop.example.com/products/{handle}",
+            "variantsCount": {"count": len(variants), "precision": "EXACT"},
+            "variants": variants,
+        }
+
+    def variant(self, number: int, index: int, rng: random.Random) -> dict:
+        variant_number = number * 10000 + index
+        levels = [
+            {
+                "__typename": "InventoryLevel",
+                "id": gid("InventoryLevel", variant_number * 10 + location),
+                "location": {"id": gid("Location", location + 1), "name": f"Warehouse {location + 1}", "address": {"zip": f"{10000 + location}"}},
+                "quantities": [{"name": "on_hand", "quantity": rng.randint(0, 40)}],
+            }
+            for location in range(self.locations)
+        ]
+        quantity = sum(level["quantities"][0]["quantity"] for level in levels)
+        size = SIZES[index % len(SIZES)]
+        color = COLORS[(index // len(SIZES)) % len(COLORS)]
+        variant = {
+            "__typename": "ProductVariant",
+            "id": gid("ProductVariant", variant_number),
+            "title": f"{size} / {color}",
+            "sku": f"SKU-{number}-{index}",
+            "barcode": f"{variant_number:013d}",
+            "price": f"{rng.randint(500, 20000) / 100:.2f}",
+            "compareAtPrice": None,
+            "inventoryQuantity": quantity,
+            "selectedOptions": [{"name": "Size", "value": size}, {"name": "Color", "value": color}],
+            "product": {"__typename": "Product", "id": gid("Product", number)},
+            "inventoryItem": {
+                "__typename": "InventoryItem",
+                "id": gid("InventoryItem", variant_number),
+                "sku": f"SKU-{number}-{index}",
+                "tracked": True,
+                "countryCodeOfOrigin": "US",
+                "harmonizedSystemCode": "620520",
+                "updatedAt": timestamp(CATALOG_EPOCH + dt.timedelta(minutes=variant_number % 100000)),
+                "measurement": {"weight": {"value": round(0.1 + index * 0.05, 2), "unit": "KILOGRAMS"}},
+                "inventoryLevels": levels,
+            },
+        }
+        variant["inventoryItem"]["variant"] = variant
+        return variant
+
+    def product_numbers(self, search: str | None) -> list[int] | range:
+        """Product numbers matching a products search query (``id:``, ``updated_at:``, ``created_at:``, ``vendor:``, ``product_type:``)."""
+        if not search:
+            return range(1, self.size + 1)
+        terms = SEARCH_TERM_PATTERN.findall(search)
+        ids = [int(value) for key, op, value in terms if key == "id" and not op and value.isdigit()]
+        if ids and " OR " in search:
+            return sorted(number for number in set(ids) if 1 <= number <= self.size)
+        numbers = range(1, self.size + 1) if not ids else sorted(set(ids))
+        filters = [(key, op or "=", value) for key, op, value in terms if key != "id" or " OR " not in search]
+        return [number for number in numbers if self._matches(number, filters)]
+
+    def _matches(self, number: int, filters: list[tuple[str, str, str]]) -> bool:
+        if not 1 <= number <= self.size:
+            return False
+        product = None
+        for key, op, value in filters:
+            if key == "id":
+                actual, expected = number, int(value)
+            else:
+                product = product or self.product(number)
+                field = {"updated_at": "updatedAt", "created_at": "createdAt", "vendor": "vendor", "product_type": "productType"}.get(key)
+                if field is None:
+                    continue
+                actual, expected = product[field], value
+                if key == "vendor" or key == "product_type":
+                    actual, expected = actual.lower(), expected.lower()
+            if not {"=": actual == expected, ">": actual > expected, ">=": actual >= expected, "<": actual < expected, "<=": actual <= expected}[op]:
+                return False
+        return True
+
+
+class LazyProducts:
+    """Sequence view of catalog products by number, generated only when indexed."""
+
+    def __init__(self, catalog: SyntheticCatalog, numbers: list[int] | range) -> None:
+        self.catalog = catalog
+        self.numbers = numbers
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __getitem__(self, index: int) -> dict:
+        return self.catalog.product(self.numbers[index])
+
+
+class LazyInventoryItems:
+    """Every inventory item of the catalog in product/variant order, generated on demand."""
+
+    def __init__(self, catalog: SyntheticCatalog) -> None:
+        self.catalog = catalog
+        self.offsets = [0]
+        for number in range(1, catalog.size + 1):
+            self.offsets.append(self.offsets[-1] + catalog.variant_count(number))
+
+    def __len__(self) -> int:
+        return self.offsets[-1]
+
+    def __getitem__(self, index: int) -> dict:
+        number = bisect.bisect_right(self.offsets, index)
+        product = self.catalog.product(number)
+        return product["variants"][index - self.offsets[number - 1]]["inventoryItem"]
+
+
+# --- Execution ---------------------------------------------------------------
+
+
+class _Wrapper(dict):
+    """Connection and edge containers; they do not count towards actual cost."""
+
+
+class Executor:
+    def __init__(self, server: "StubState", store: str, document: Document, variables: dict) -> None:
+        self.server = server
+        self.store = store
+        self.document = document
+        self.variables = variables
+        self.actual_cost = 0
+        self.bulk_lines: list | None = None
+        self.bulk_parents: list[str] = []
+
+    def run(self) -> dict:
+        return self.execute(self.document.selections, None)
+
+    def execute(self, selections: list, obj: dict | None) -> dict:
+        if obj is not None and not isinstance(obj, _Wrapper):
+            self.actual_cost += 1
+        typename = obj.get("__typename") if isinstance(obj, dict) else None
+        result: dict = {}
+        for field in collect_fields(selections, typename, self.document.fragments):
+            key = field.alias or field.name
+            args = resolve_value(field.args, self.variables)
+            if field.name == "__typename":
+                result[key] = typename
+                continue
+            value = self.server.resolve_root(self, field, args) if obj is None else obj.get(field.name)
+            if self.bulk_lines is not None and is_connection(field, self.document.fragments):
+                self.emit_bulk(field, value)
+                continue
+            result[key] = self.complete(field, value, args)
+        return result
+
+    def complete(self, field: Field, value: object, args: dict) -> object:
+        if value is None or not field.selections:
+            return value
+        if is_connection(field, self.document.fragments):
+            return self.connection(field, value, args)
+        if isinstance(value, list):
+            return [self.execute(field.selections, item) for item in value]
+        return self.execute(field.selections, value)
+
+    def connection(self, field: Field, items: object, args: dict) -> dict:
+        self.actual_cost += 2
+        total = len(items)
+        start = int(args["after"]) if args.get("after") else 0
+        end = total
+        if args.get("before"):
+            end = min(end, int(args["before"]) - 1)
+        if args.get("first") is not None:
+            end = min(end, start + int(args["first"]))
+        if args.get("last") is not None:
+            start = max(start, end - int(args["last"]))
+        window = [items[index] for index in range(start, max(start, end))]
+        container = _Wrapper(
+            edges=[_Wrapper(cursor=str(start + offset + 1), node=node) for offset, node in enumerate(window)],
+            nodes=window,
+            pageInfo=_Wrapper(
+                hasNextPage=end < total,
+                hasPreviousPage=start > 0,
+                startCursor=str(start + 1) if window else None,
+                endCursor=str(end) if window else None,
+            ),
+        )
+        return self.execute(field.selections, container)
+
+    def emit_bulk(self, field: Field, items: object) -> None:
+        """Bulk results flatten nested connections into their own lines linked by ``__parentId``."""
+        for node in items or []:
+            for item_field in connection_item_fields(field, self.document.fragments):
+                slot = len(self.bulk_lines)
+                self.bulk_lines.append(None)
+                self.bulk_parents.append(node.get("id"))
+                line = self.execute(item_field.selections, node)
+                self.bulk_parents.pop()
+                if self.bulk_parents:
+                    line["__parentId"] = self.bulk_parents[-1]
+                self.bulk_lines[slot] = line
+
+
+class TokenBucket:
+    def __init__(self, size: float, restore_rate: float) -> None:
+        self.size = size
+        self.restore_rate = restore_rate
+        self.available = size
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.size, self.available + (now - self.updated) * self.restore_rate)
+        self.updated = now
+
+    def status(self) -> dict:
+        return {"maximumAvailable": self.size, "currentlyAvailable": round(self.available, 1), "restoreRate": self.restore_rate}
+
+
+class StubState:
+    """Catalog, per-store buckets, bulk operations and request counters shared by all handlers."""
+
+    def __init__(
+        self,
+        catalog: SyntheticCatalog,
+        bucket_size: float = DEFAULT_BUCKET_SIZE,
+        restore_rate: float = DEFAULT_RESTORE_RATE,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        max_query_cost: int = MAX_QUERY_COST,
+    ) -> None:
+        self.catalog = catalog
+        self.max_query_cost = max_query_cost
+        self.bucket_size = bucket_size
+        self.restore_rate = restore_rate
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.lock = threading.Lock()
+        self.buckets: dict[str, TokenBucket] = {}
+        self.bulk_operations: dict[str, dict] = {}
+        self.stats: dict[str, dict] = {}
+        self._inventory_items: LazyInventoryItems | None = None
+        self.base_url = ""
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.stats.clear()
+            self.buckets.clear()
+
+    def count(self, store: str, operation: str, bytes_sent: int = 0, throttled: bool = False, cost: float = 0.0) -> None:
+        with self.lock:
+            entry = self.stats.setdefault(store, {}).setdefault(operation, {"requests": 0, "throttled": 0, "bytes": 0, "cost": 0.0})
+            entry["requests"] += 1
+            entry["throttled"] += int(throttled)
+            entry["bytes"] += bytes_sent
+            entry["cost"] += cost
+
+    def delay(self) -> None:
+        seconds = (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def shop(self, store: str) -> dict:
+        host = f"{store}.example.com"
+        return {
+            "__typename": "Shop",
+            "id": gid("Shop", 1),
+            "name": f"Synthetic {store}",
+            "myshopifyDomain": f"{store}.myshopify.com",
+            "contactEmail": f"support@{host}",
+            "currencyCode": "USD",
+            "url": f"https://{host}",
+            "primaryDomain": {"url": f"https://{host}", "host": host},
+            "shopPolicies": [
+                {"id": gid("ShopPolicy", index + 1), "title": title, "type": kind, "url": f"https://{host}/policies/{kind.lower()}", "body": f"<p>{title}</p>"}
+                for index, (title, kind) in enumerate((("Refund policy", "REFUND_POLICY"), ("Shipping policy", "SHIPPING_POLICY")))
+            ],
+        }
+
+    def resolve_root(self, executor: Executor, field: Field, args: dict) -> object:
+        catalog = self.catalog
+        name = field.name
+        if name == "shop":
+            return self.shop(executor.store)
+        if name == "products":
+            numbers = catalog.product_numbers(args.get("query"))
+            # ID and CREATED_AT sort keys give the same order here; products are created in ID order.
+            return LazyProducts(catalog, numbers[::-1] if args.get("reverse") else numbers)
+        if name == "productsCount":
+            return {"count": len(catalog.product_numbers(args.get("query"))), "precision": "EXACT"}
+        if name == "product":
+            return catalog.product(gid_number(args.get("id")) or 0)
+        if name == "nodes":
+            return [self.node(executor.store, node_id) for node_id in args.get("ids") or []]
+        if name == "node":
+            return self.node(executor.store, args.get("id"))
+        if name == "inventoryItems":
+            with self.lock:
+                if self._inventory_items is None:
+                    self._inventory_items = LazyInventoryItems(catalog)
+            return self._inventory_items
+        if name == "deliveryProfiles":
+            return []
+        if name == "bulkOperationRunQuery":
+            return self.start_bulk(executor.store, args.get("query") or "")
+        return None
+
+    def node(self, store: str, node_id: object) -> dict | None:
+        text = str(node_id or "")
+        number = gid_number(text) or 0
+        if "/BulkOperation/" in text:
+            with self.lock:
+                return self.bulk_operations.get(text)
+        if "/Product/" in text:
+            return self.catalog.product(number)
+        if "/ProductVariant/" in text or "/InventoryItem/" in text:
+            product = self.catalog.product(number // 10000)
+            variants = product["variants"] if product else []
+            index = number % 10000
+            if index >= len(variants):
+                return None
+            return variants[index] if "/ProductVariant/" in text else variants[index]["inventoryItem"]
+        return None
+
+    def start_bulk(self, store: str, query: str) -> dict:
+        try:
+            Parser(query).document()
+        except GraphQLError as exc:
+            return {"bulkOperation": None, "userErrors": [{"field": ["query"], "message": str(exc)}]}
+        operation_id = gid("BulkOperation", uuid.uuid4().int % 10**12)
+        operation = {
+            "__typename": "BulkOperation",
+            "id": operation_id,
+            "status": "COMPLETED",
+            "errorCode": None,
+            "objectCount": str(self.catalog.size),
+            "url": f"{self.base_url}/{store}/bulk/{gid_number(operation_id)}.jsonl",
+            "partialDataUrl": None,
+            "query": query,
+        }
+        with self.lock:
+            self.bulk_operations[operation_id] = operation
+        return {"bulkOperation": {"__typename": "BulkOperation", "id": operation_id, "status": "CREATED"}, "userErrors": []}
+
+    def bulk_results(self, store: str, operation_number: int) -> Iterator[bytes]:
+        with self.lock:
+            operation = self.bulk_operations.get(gid("BulkOperation", operation_number))
+        if operation is None:
+            return
+        document = Parser(operation["query"]).document()
+        executor = Executor(self, store, document, {})
+        for field in collect_fields(document.selections, None, document.fragments):
+            items = self.resolve_root(executor, field, resolve_value(field.args, {}))
+            if not is_connection(field, document.fragments):
+                continue
+            for index in range(len(items)):
+                executor.bulk_lines = []
+                executor.emit_bulk(field, [items[index]])
+                yield "".join(json.dumps(line, separators=(",", ":")) + "\n" for line in executor.bulk_lines).encode("utf-8")
+
+    def graphql(self, store: str, request: dict) -> tuple[dict, str, bool]:
+        """Execute one request; returns the response, its operation name and whether it was throttled."""
+        try:
+            document = Parser(str(request.get("query") or "")).document()
+        except GraphQLError as exc:
+            return {"errors": [{"message": str(exc)}]}, "invalid", False
+        operation = document.name or document.operation
+        variables = request.get("variables") or {}
+        if document.operation == "mutation":
+            cost = BULK_OPERATION_COST
+        else:
+            cost = max(1, requested_cost(document.selections, document.fragments, variables))
+        if self.max_query_cost and cost > self.max_query_cost:
+            return {
+                "errors": [{"message": f"Query cost is {cost}, which exceeds the single query max cost limit ({self.max_query_cost}).", "extensions": {"code": "MAX_COST_EXCEEDED", "cost": cost, "maxCost": self.max_query_cost}}],
+            }, operation, False
+        with self.lock:
+            bucket = self.buckets.get(store)
+            if bucket is None:
+                bucket = self.buckets[store] = TokenBucket(self.bucket_size, self.restore_rate)
+            bucket.refill()
+            if bucket.available < cost:
+                return {
+                    "errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}],
+                    "extensions": {"cost": {"requestedQueryCost": cost, "actualQueryCost": None, "throttleStatus": bucket.status()}},
+                }, operation, True
+            bucket.available -= cost
+        executor = Executor(self, store, document, variables)
+        try:
+            data = executor.run()
+        except (GraphQLError, KeyError, TypeError, ValueError) as exc:
+            return {"errors": [{"message": str(exc)}]}, operation, False
+        actual = min(cost, max(1, executor.actual_cost)) if document.operation != "mutation" else cost
+        with self.lock:
+            bucket.refill()
+            bucket.available = min(bucket.size, bucket.available + cost - actual)
+            status = bucket.status()
+        return {
+            "data": data,
+            "extensions": {"cost": {"requestedQueryCost": cost, "actualQueryCost": actual, "throttleStatus": status}},
+        }, operation, False
+
+    def rest(self, store: str, resource: str) -> dict | None:
+        shop = self.shop(store)
+        if resource == "policies.json":
+            return {
+                "policies": [
+                    {"title": policy["title"], "policy_type": policy["type"].lower().removesuffix("_policy") + "_policy", "url": policy["url"], "body": policy["body"]}
+                    for policy in shop["shopPolicies"]
+                ],
+            }
+        if resource == "shipping_zones.json":
+            return {
+                "shipping_zones": [
+                    {
+                        "name": "Domestic",
+                        "countries": [{"code": "US", "provinces": [{"code": "CA"}, {"code": "NY"}]}],
+                        "price_based_shipping_rates": [{"name": "Standard", "price": "5.00"}, {"name": "Express", "price": "15.00"}],
+                    },
+                    {
+                        "name": "International",
+                        "countries": [{"code": "CA", "provinces": []}, {"code": "GB", "provinces": []}],
+                        "weight_based_shipping_rates": [{"name": "International", "price": "25.00"}],
+                    },
+                ],
+            }
+        return None
+
+
+def make_handler(state: StubState) -> type[BaseHTTPRequestHandler]:
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+            pass
+
+        def route(self) -> tuple[str, str]:
+            """``(store, resource)`` for ``/<store>/admin/api/<version>/<resource>`` (store ``default`` without a prefix)."""
+            parts = self.path.split("?", 1)[0].strip("/").split("/")
+            if "admin" in parts:
+                position = parts.index("admin")
+                store = "/".join(parts[:position]) or "default"
+                return store, parts[-1]
+            if len(parts) >= 3 and parts[-2] == "bulk":
+                return parts[0], "bulk/" + parts[-1]
+            return "default", "/".join(parts)
+
+        def send_body(self, status: int, body: bytes, content_type: str = "application/json", counted: Callable[[int], None] | None = None) -> int:
+            """Send ``body``; ``counted`` gets the bytes sent before the client can see the reply."""
+            if "gzip" in (self.headers.get("Accept-Encoding") or "") and len(body) > 512:
+                body = gzip.compress(body, compresslevel=5)
+                encoding = "gzip"
+            else:
+                encoding = None
+            if counted is not None:
+                counted(len(body))
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return len(body)
+
+        def send_json(self, status: int, payload: object, counted: Callable[[int], None] | None = None) -> int:
+            return self.send_body(status, json.dumps(payload, separators=(",", ":")).encode("utf-8"), counted=counted)
+
+        def do_GET(self) -> None:  # noqa: N802
+            store, resource = self.route()
+            if resource == "_stats":
+                with state.lock:
+                    self.send_json(200, state.stats)
+                return
+            if resource.startswith("bulk/"):
+                number = gid_number(resource.removesuffix(".jsonl")) or 0
+                self.send_response(200)
+                self.send_header("Content-Type", "application/jsonl")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                sent = 0
+                for chunk in state.bulk_results(store, number):
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+                    sent += len(chunk)
+                self.wfile.write(b"0\r\n\r\n")
+                state.count(store, "bulk-download", sent)
+                return
+            state.delay()
+            payload = state.rest(store, resource)
+
+            def counted(sent: int) -> None:
+                state.count(store, f"rest:{resource}", sent)
+
+            if payload is None:
+                self.send_json(404, {"errors": "Not Found"}, counted)
+            else:
+                self.send_json(200, payload, counted)
+
+        def do_POST(self) -> None:  # noqa: N802
+            store, resource = self.route()
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length)
+            if resource == "_reset":
+                state.reset_stats()
+                self.send_json(200, {"reset": True})
+                return
+            if resource != "graphql.json":
+                self.send_json(404, {"errors": "Not Found"})
+                return
+            try:
+                request = json.loads(raw)
+            except ValueError:
+                self.send_json(400, {"errors": "Invalid JSON"})
+                return
+            state.delay()
+            response, operation, throttled = state.graphql(store, request if isinstance(request, dict) else {})
+            cost = ((response.get("extensions") or {}).get("cost") or {}).get("actualQueryCost") or 0
+            self.send_json(200, response, lambda sent: state.count(store, f"graphql:{operation}", sent, throttled, cost))
+
+    return StubHandler
+
+
+def start_server(state: StubState, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve ``state`` on a background thread; ``port=0`` picks a free port."""
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    state.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="stub-admin", daemon=True).start()
+    return server
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve a synthetic Shopify Admin API catalog")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", default=DEFAULT_PORT, type=int, help="Port to listen on")
+    parser.add_argument("--products", default=DEFAULT_PRODUCTS, type=int, help="Products in the synthetic catalog")
+    parser.add_argument("--variants", default=DEFAULT_VARIANTS, help="Variants per product: a count (3) or an inclusive range (1-8)")
+    parser.add_argument("--images", default=3, type=int, help="Images per product")
+    parser.add_argument("--locations", default=2, type=int, help="Inventory locations per variant")
+    parser.add_argument("--seed", default=1, type=int, help="Seed for the generated catalog")
+    parser.add_argument("--bucket-size", default=DEFAULT_BUCKET_SIZE, type=float, help="Query cost bucket size per store")
+    parser.add_argument("--restore-rate", default=DEFAULT_RESTORE_RATE, type=float, help="Query cost points restored per second")
+    parser.add_argument("--max-query-cost", default=MAX_QUERY_COST, type=int, help="Single-query cost limit (0 disables it)")
+    parser.add_argument("--latency-ms", default=0.0, type=float, help="Fixed delay added to every API response")
+    parser.add_argument("--jitter-ms", default=0.0, type=float, help="Random extra delay of up to this many milliseconds")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    catalog = SyntheticCatalog(args.products, args.variants, args.images, locations=args.locations, seed=args.seed)
+    state = StubState(catalog, args.bucket_size, args.restore_rate, args.latency_ms, args.jitter_ms, args.max_query_cost)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    state.base_url = f"http://{args.host}:{server.server_address[1]}"
+    print(f"Serving {args.products} synthetic products on {state.base_url}/<store_id>/admin/api/<version>/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,534 @@
+"""Smoke tests for the snapshot modules, leases, scheduler and webhooks, and
+for crawls against the synthetic Admin API stub.
+
+Run with ``python -m unittest discover -s platforms/shopify/bench -p "test_*.py"``
+(or pytest). Tests that import ``pipeline/main.py`` are skipped without
+``supabase`` and ``python-dotenv``.
+"""
+
+from __future__ import annotations
+
+import base64
+import datetime as dt
+import hashlib
+import hmac
+import importlib.util
+import json
+import math
+import os
+import pathlib
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[3]))
+import fetch_admin  # noqa: E402
+import webhooks  # noqa: E402
+from common.changeset import ChangeSetRecorder, changes_path, load_digest, read_change_counts  # noqa: E402
+from common.checkpoint import PaginationCheckpoint  # noqa: E402
+from common.framed_snapshot import FramedSnapshot, FramedSnapshotWriter, index_path  # noqa: E402
+from common.scheduler import Cadence, RefreshScheduler  # noqa: E402
+from common.snapshot_history import SnapshotHistory  # noqa: E402
+from common.snapshot_reader import SnapshotReader  # noqa: E402
+from common.snapshot_writer import SnapshotWriter  # noqa: E402
+from common.store_leases import SQLiteStoreLeases  # noqa: E402
+from stub_admin import MAX_QUERY_COST, StubState, SyntheticCatalog, start_server  # noqa: E402
+
+SHOPIFY_DIR = pathlib.Path(__file__).resolve().parents[1]
+STORE = "smoke"
+# Large enough that nothing is throttled; the tests count requests, not waits.
+UNTHROTTLED = 1e12
+
+
+def sample_snapshot(products: int = 3, extensions: object = None) -> dict:
+    """A small raw-admin snapshot (the stub's catalog nodes are cyclic, so not usable here)."""
+    edges = []
+    for number in range(1, products + 1):
+        variants = [
+            {"node": {"id": f"gid://shopify/ProductVariant/{number}{index}", "sku": f"SKU-{number}-{index}", "price": f"{number}.{index}0", "inventoryQuantity": index, "selectedOptions": []}}
+            for index in range(number)
+        ]
+        node = {
+            "id": f"gid://shopify/Product/{number}",
+            "handle": f"product-{number}",
+            "title": f"Produkt {number} – Größe",
+            "tags": [],
+            "totalInventory": sum(range(number)),
+            "updatedAt": f"2025-01-0{number}T00:00:00Z",
+            "variants": {"edges": variants},
+        }
+        edges.append({"cursor": f"c{number}", "node": node})
+    snapshot = {
+        "data": {
+            "products": {"edges": edges, "pageInfo": {"endCursor": edges[-1]["cursor"] if edges else None, "hasNextPage": False}},
+            "shop": {"name": "Smoke", "primaryDomain": {"host": "smoke.example.com"}},
+        }
+    }
+    if extensions is not None:
+        snapshot["extensions"] = extensions
+    return snapshot
+
+
+def write_json_snapshot(directory: pathlib.Path, name: str, snapshot: dict) -> pathlib.Path:
+    writer = SnapshotWriter(directory)
+    data = snapshot["data"]
+    writer.write_edges(data["products"]["edges"])
+    writer.finish(data["shop"], data["products"]["pageInfo"], snapshot.get("extensions"))
+    return writer.commit(directory / name)
+
+
+def load_pipeline():
+    spec = importlib.util.spec_from_file_location("pipeline_main", SHOPIFY_DIR / "pipeline" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class StubTestCase(unittest.TestCase):
+    """Starts a stub for the class and points every Admin API call at it."""
+
+    products = 60
+    variants = "1-8"
+    locations = 2
+    max_query_cost = MAX_QUERY_COST
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.catalog = SyntheticCatalog(cls.products, cls.variants, locations=cls.locations)
+        cls.state = StubState(cls.catalog, UNTHROTTLED, UNTHROTTLED, 0.0, 0.0, cls.max_query_cost)
+        cls.server = start_server(cls.state)
+        cls.env = mock.patch.dict(os.environ, {"SHOPIFY_ADMIN_BASE_URL": f"{cls.state.base_url}/{{store_id}}"})
+        cls.env.start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        fetch_admin.CLIENT.close()
+        cls.env.stop()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        self.state.reset_stats()
+
+    def requests(self, operation: str) -> int:
+        with self.state.lock:
+            return self.state.stats.get(STORE, {}).get(operation, {}).get("requests", 0)
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("supabase") and importlib.util.find_spec("dotenv"),
+    "pipeline/main.py needs supabase and python-dotenv",
+)
+class PipelineRequestCountTest(StubTestCase):
+    products = 200
+
+    def test_requests_drop_against_per_product_variant_queries(self) -> None:
+        main = load_pipeline()
+        self.addCleanup(main.ADMIN_CLIENT.close)
+        products = main.fetch_all_products(STORE, "smoke-token")
+        self.assertEqual(len(products), self.products)
+
+        # The old crawl read 100 products per FetchProducts and then sent one
+        # FetchProductVariants per product.
+        baseline = math.ceil(self.products / 100) + self.products
+        catalog_requests = self.requests("graphql:FetchProducts") + self.requests("graphql:FetchVariantBatch")
+        inventory_requests = self.requests("graphql:FetchInventoryBatch")
+        self.assertEqual(self.requests("graphql:FetchVariantBatch"), 0)
+        self.assertLessEqual(catalog_requests * 15, baseline)
+        self.assertLessEqual((catalog_requests + inventory_requests) * 6, baseline)
+
+    def test_max_cost_shrinks_inline_variants_before_products(self) -> None:
+        main = load_pipeline()
+        self.addCleanup(main.ADMIN_CLIENT.close)
+        products = main.fetch_all_products(STORE, "smoke-token", page_size=12, variant_page_size=50)
+        self.assertEqual(len(products), self.products)
+        # Shrinking the product page instead would leave one product per request.
+        self.assertLess(self.requests("graphql:FetchProducts"), self.products // 4)
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("supabase") and importlib.util.find_spec("dotenv"),
+    "pipeline/main.py needs supabase and python-dotenv",
+)
+class PipelineInventoryTest(StubTestCase):
+    products = 12
+    variants = "40-60"
+    locations = 25
+
+    def test_overflow_variants_and_levels_are_complete(self) -> None:
+        main = load_pipeline()
+        self.addCleanup(main.ADMIN_CLIENT.close)
+        products = main.fetch_all_products(STORE, "smoke-token")
+        self.assertEqual(len(products), self.products)
+
+        for number, product in enumerate(products, 1):
+            expected = self.catalog.product(number)["variants"]
+            variants = product.to_row(with_variants=True)["variants"]
+            self.assertEqual([variant["id"] for variant in variants], [variant["id"] for variant in expected])
+            for variant, source in zip(variants, expected):
+                self.assertEqual(
+                    [level["quantities"][0]["quantity"] for level in variant["inventoryItem"]["inventoryLevels"]],
+                    [level["quantities"][0]["quantity"] for level in source["inventoryItem"]["inventoryLevels"]],
+                )
+        # Each overflow query carries the next variant page of several products.
+        self.assertLess(self.requests("graphql:FetchVariantBatch"), self.products)
+
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.directory = pathlib.Path(temp.name)
+
+
+class SnapshotWriterTest(TempDirTestCase):
+    def test_output_matches_json_dump(self) -> None:
+        for snapshot in (sample_snapshot(), sample_snapshot(extensions={"cost": {"actualQueryCost": 12}}), sample_snapshot(0)):
+            path = write_json_snapshot(self.directory, "snapshot.json", snapshot)
+            expected = json.dumps(snapshot, indent=2, sort_keys=True) + "\n"
+            self.assertEqual(path.read_bytes(), expected.encode("utf-8"))
+
+    def test_abort_leaves_nothing(self) -> None:
+        writer = SnapshotWriter(self.directory)
+        writer.write_edges(sample_snapshot()["data"]["products"]["edges"])
+        writer.abort()
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+
+class SnapshotReaderTest(TempDirTestCase):
+    def assert_reads(self, path: pathlib.Path, snapshot: dict) -> None:
+        reader = SnapshotReader(path, chunk_size=64)
+        self.assertEqual(list(reader.iter_edges()), snapshot["data"]["products"]["edges"])
+        self.assertEqual(reader.shop(), snapshot["data"]["shop"])
+        self.assertEqual(reader.page_info(), snapshot["data"]["products"]["pageInfo"])
+        self.assertEqual(reader.extensions(), snapshot.get("extensions"))
+
+    def test_sorted_snapshot_reads_sections_from_the_tail(self) -> None:
+        snapshot = sample_snapshot(extensions={"cost": {"actualQueryCost": 12}})
+        path = write_json_snapshot(self.directory, "snapshot.json", snapshot)
+        self.assertIsNotNone(SnapshotReader(path)._tail())
+        self.assert_reads(path, snapshot)
+
+    def test_other_layouts_fall_back_to_a_forward_scan(self) -> None:
+        snapshot = sample_snapshot()
+        reordered = {"data": {"shop": snapshot["data"]["shop"], "products": {"pageInfo": snapshot["data"]["products"]["pageInfo"], "edges": snapshot["data"]["products"]["edges"]}}}
+        path = self.directory / "unsorted.json"
+        path.write_text(json.dumps(reordered), encoding="utf-8")
+        self.assertIsNone(SnapshotReader(path)._tail())
+        self.assert_reads(path, snapshot)
+
+    def test_filters(self) -> None:
+        path = write_json_snapshot(self.directory, "snapshot.json", sample_snapshot())
+        products = SnapshotReader(path).iter_products(updated_since="2025-01-02T00:00:00Z")
+        self.assertEqual([node["handle"] for node in products], ["product-2", "product-3"])
+
+
+class FramedSnapshotTest(TempDirTestCase):
+    def test_round_trip_and_lookups(self) -> None:
+        snapshot = sample_snapshot(40, extensions={"bulkOperation": {"cursors": False}})
+        writer = FramedSnapshotWriter(self.directory)
+        data = snapshot["data"]
+        writer.write_edges(data["products"]["edges"])
+        writer.finish(data["shop"], data["products"]["pageInfo"], snapshot["extensions"])
+        path = writer.commit(self.directory / "snapshot.jsonl.gz")
+        self.assertTrue(index_path(path).is_file())
+
+        framed = FramedSnapshot(path)
+        self.assertEqual(framed.load(), snapshot)
+        self.assertEqual(framed.product(35)["handle"], "product-35")
+        self.assertEqual(framed.product_by_handle("product-2")["id"], "gid://shopify/Product/2")
+        self.assertEqual(framed.product_by_sku("SKU-7-3")["handle"], "product-7")
+        self.assertIsNone(framed.product(41))
+        self.assertEqual(SnapshotReader(path).shop(), data["shop"])
+
+
+class ChangeSetTest(TempDirTestCase):
+    def commit(self, name: str, snapshot: dict, previous: pathlib.Path | None) -> pathlib.Path:
+        path = write_json_snapshot(self.directory, name, snapshot)
+        recorder = ChangeSetRecorder(self.directory)
+        recorder.write_edges(snapshot["data"]["products"]["edges"])
+        recorder.finish(None, None)
+        recorder.commit(path, previous)
+        return path
+
+    def test_change_log_between_snapshots(self) -> None:
+        first = self.commit("20250101T000000Z.json", sample_snapshot(), None)
+        self.assertEqual(read_change_counts(first), {"product_added": 3, "variant_added": 6})
+
+        snapshot = sample_snapshot(4)
+        edges = snapshot["data"]["products"]["edges"]
+        del edges[0]  # product 1 removed
+        edges[0]["node"]["updatedAt"] = "2025-02-01T00:00:00Z"  # volatile: not a change
+        edges[1]["node"]["variants"]["edges"][0]["node"]["price"] = "9.99"
+        second = self.commit("20250102T000000Z.json", snapshot, first)
+
+        self.assertEqual(set(load_digest(second)), {f"gid://shopify/Product/{number}" for number in (2, 3, 4)})
+        records = [json.loads(line) for line in changes_path(second).read_text(encoding="utf-8").splitlines()]
+        self.assertEqual(records[-1]["from"], "20250101T000000Z")
+        self.assertEqual(records[-1]["counts"], {"product_added": 1, "variant_added": 4, "variant_modified": 1, "product_removed": 1, "variant_removed": 1})
+        modified = [record for record in records if record.get("change") == "modified"]
+        self.assertEqual(modified[0]["fields"], {"price": ["3.00", "9.99"]})
+
+
+class SnapshotHistoryTest(TempDirTestCase):
+    def test_rebuild_and_prune(self) -> None:
+        history = SnapshotHistory(self.directory / "history")
+        versions = []
+        for day, products in enumerate((3, 4, 5), start=1):
+            snapshot = sample_snapshot(products)
+            path = write_json_snapshot(self.directory, f"2025010{day}T000000Z.json", snapshot)
+            recorder = history.recorder()
+            recorder.write_edges(snapshot["data"]["products"]["edges"])
+            recorder.finish(snapshot["data"]["shop"], snapshot["data"]["products"]["pageInfo"])
+            recorder.commit(path)
+            versions.append((path, snapshot))
+        self.assertEqual(history.versions(), ["20250101T000000Z", "20250102T000000Z", "20250103T000000Z"])
+
+        for path, _ in versions:
+            rebuilt = history.rebuild_to(path.stem, self.directory / "rebuilt.json")
+            self.assertEqual(rebuilt.read_bytes(), path.read_bytes())
+
+        # Products 1-4 are shared with the kept version; only the old page infos differ.
+        self.assertEqual(history.prune(1), 0)
+        self.assertEqual(history.versions(), ["20250103T000000Z"])
+        self.assertEqual(len(list((self.directory / "history" / "objects").glob("*/*.json.gz"))), 6)
+
+
+class PaginationCheckpointTest(TempDirTestCase):
+    def test_resume_after_interruption(self) -> None:
+        directory = self.directory / "checkpoint"
+        fingerprint = {"query": "FetchProducts"}
+        checkpoint = PaginationCheckpoint(directory, dt.timedelta(hours=1), fingerprint)
+        self.assertIsNone(checkpoint.load())
+        checkpoint.record([{"id": 1}, {"id": 2}], "c2", True)
+        checkpoint.record([{"id": 3}], "c3", True, pages=2)
+        checkpoint.commit()
+        # A page recorded after the last commit is truncated on resume.
+        checkpoint.record([{"id": 4}], "c4", True, pages=3)
+
+        resumed = PaginationCheckpoint(directory, dt.timedelta(hours=1), fingerprint)
+        state = resumed.load()
+        self.assertEqual((state["cursor"], state["pages"]), ("c3", 2))
+        self.assertEqual(list(resumed.iter_batches(2)), [[{"id": 1}, {"id": 2}], [{"id": 3}]])
+
+    def test_stale_checkpoints_are_discarded(self) -> None:
+        directory = self.directory / "checkpoint"
+        PaginationCheckpoint(directory, dt.timedelta(hours=1), {"query": "a"}).record([{"id": 1}], "c1", True)
+        self.assertIsNone(PaginationCheckpoint(directory, dt.timedelta(hours=1), {"query": "b"}).load())
+        self.assertFalse(directory.exists())
+
+        PaginationCheckpoint(directory, dt.timedelta(hours=1)).record([{"id": 1}], None, False)
+        self.assertIsNone(PaginationCheckpoint(directory, dt.timedelta(hours=1)).load())
+
+
+class StoreLeasesTest(TempDirTestCase):
+    def leases(self, worker_id: str, **kwargs: float) -> SQLiteStoreLeases:
+        return SQLiteStoreLeases(self.directory / "leases.sqlite3", worker_id=worker_id, **kwargs)
+
+    def test_workers_split_stores(self) -> None:
+        first, second = self.leases("first"), self.leases("second")
+        first.ensure(["a", "b"])
+        self.assertTrue(first.claim("a"))
+        self.assertFalse(second.claim("a"))
+        self.assertTrue(second.claim("b"))
+        self.assertEqual(first.renew(), [])
+
+        first.release("a", "success")
+        self.assertFalse(first.holds("a"))
+        # Completed less than refresh_interval ago.
+        self.assertFalse(second.claim("a"))
+
+    def test_failure_backs_off_without_completing(self) -> None:
+        first = self.leases("first", failure_backoff=3600)
+        first.ensure(["a", "b"])
+        self.assertTrue(first.claim("a"))
+        first.release("a", "failed")
+        self.assertFalse(self.leases("second").claim("a"))
+        rows = {row["store_id"]: row for row in first.rows()}
+        self.assertEqual((rows["a"]["completed_at"], rows["a"]["last_state"]), (0, "failed"))
+
+        quick = self.leases("quick", failure_backoff=0)
+        self.assertTrue(quick.claim("b"))
+        quick.release("b", "failed")
+        self.assertTrue(self.leases("third").claim("b"))
+
+    def test_expired_lease_is_taken_over(self) -> None:
+        first = self.leases("first", ttl=0)
+        first.ensure(["a"])
+        self.assertTrue(first.claim("a"))
+        time.sleep(0.01)
+        self.assertTrue(self.leases("second").claim("a"))
+        self.assertEqual(first.renew(), ["a"])
+        self.assertFalse(first.holds("a"))
+
+
+class RefreshSchedulerTest(TempDirTestCase):
+    cadences = {
+        "catalog": Cadence(minimum=60, initial=600, maximum=3600),
+        "shop": Cadence(minimum=30, initial=300, maximum=1800),
+    }
+
+    def test_most_overdue_task_runs_first(self) -> None:
+        scheduler = RefreshScheduler(self.cadences)
+        scheduler.sync(["a", "b"], now=0)
+        self.assertIn(scheduler.next_due(now=0), {("a", "catalog"), ("b", "catalog")})
+        self.assertEqual(scheduler.next_due(busy=["a"], now=0), ("b", "catalog"))
+        self.assertEqual(scheduler.complete("a", "catalog", changed=True, now=0), 300)
+        self.assertEqual(scheduler.complete("b", "catalog", changed=False, now=0), 900)
+        self.assertIsNone(scheduler.next_due(now=1))
+        self.assertEqual(scheduler.seconds_until_next(now=0), 300)
+        # Equally late tasks go by due time, then store and task name.
+        self.assertEqual(scheduler.next_due(now=600), ("a", "catalog"))
+        self.assertEqual(scheduler.complete("a", "catalog", changed=True, now=600), 150)
+        self.assertEqual(scheduler.complete("a", "shop", changed=False, now=600), 450)
+        self.assertEqual(scheduler.next_due(now=600), ("b", "shop"))
+
+        scheduler.sync(["b"], now=600)
+        self.assertIsNone(scheduler.next_due(busy=["b"], now=2000))
+
+    def test_state_survives_restarts(self) -> None:
+        path = self.directory / ".schedule.json"
+        scheduler = RefreshScheduler(self.cadences, path)
+        scheduler.sync(["a"], now=0)
+        scheduler.complete("a", "catalog", changed=False, now=0)
+        scheduler.save()
+        restored = RefreshScheduler(self.cadences, path)
+        self.assertIsNone(restored.next_due(now=200))
+        self.assertEqual(restored.next_due(now=600), ("a", "shop"))
+        self.assertEqual(restored.complete("a", "catalog", changed=None, now=900), 900)
+
+
+def signed(secret: str, payload: dict) -> tuple[bytes, str]:
+    body = json.dumps(payload).encode("utf-8")
+    return body, base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii")
+
+
+class WebhookTest(StubTestCase):
+    products = 20
+    max_query_cost = 0  # fetch_admin's full query with variants(first: 50) is over the limit
+    secret = "smoke-secret"
+
+    def setUp(self) -> None:
+        super().setUp()
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.directory = pathlib.Path(temp.name)
+        self.output = self.directory / "raw-admin"
+        self.stores = [{"store_id": STORE, "admin_token": "smoke-token", "webhook_secret": self.secret}]
+        logging = mock.patch.object(fetch_admin, "LOG_TO_STDOUT", False), mock.patch.object(fetch_admin, "LOG_DIR", self.directory / "log")
+        for patch in logging:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(fetch_admin.close_logging)
+
+    def receiver(self, **kwargs: object) -> webhooks.WebhookReceiver:
+        return webhooks.WebhookReceiver(self.stores, self.output, quiet_seconds=0, page_size=10, **kwargs)
+
+    def deliver(self, receiver: webhooks.WebhookReceiver, topic: str, payload: dict, webhook_id: str) -> str:
+        body, signature = signed(self.secret, payload)
+        return receiver.receive(topic, f"{STORE}.myshopify.com", signature, body, webhook_id)
+
+    def seed_snapshot(self) -> pathlib.Path:
+        """A crawl of the stub with product 1 stale, product 3 missing and a product the stub does not have."""
+        snapshot = fetch_admin.fetch_admin(STORE, "smoke-token", 10)
+        edges = snapshot["data"]["products"]["edges"]
+        edges[0]["node"]["title"] = "Stale title"
+        del edges[2]
+        edges.append({"cursor": "gone", "node": {**edges[-1]["node"], "id": "gid://shopify/Product/999"}})
+        return fetch_admin.write_snapshot(STORE, snapshot, self.output, 5)
+
+    def newest_edges(self) -> dict[str, dict]:
+        path = fetch_admin.latest_snapshot_path(self.output / STORE)
+        return {edge["node"]["id"]: edge for edge in SnapshotReader(path).iter_edges()}
+
+    def test_recorded_deliveries_replay_against_the_stub(self) -> None:
+        seeded = self.seed_snapshot()
+        before = self.newest_edges()
+        inventory_item = before["gid://shopify/Product/2"]["node"]["variants"]["edges"][0]["node"]["inventoryItem"]["id"]
+        record_path = self.directory / "hooks.jsonl"
+        recorder = self.receiver(record_path=record_path)
+        self.assertEqual(self.deliver(recorder, "products/update", {"id": 1, "admin_graphql_api_id": "gid://shopify/Product/1"}, "w1"), "queued")
+        self.assertEqual(self.deliver(recorder, "products/update", {"id": 3}, "w2"), "queued")
+        self.assertEqual(self.deliver(recorder, "products/delete", {"id": 999}, "w3"), "queued")
+        self.assertEqual(self.deliver(recorder, "inventory_levels/update", {"inventory_item_id": int(inventory_item.rsplit("/", 1)[-1])}, "w4"), "queued")
+        self.assertEqual(self.deliver(recorder, "products/update", {"id": 1}, "w1"), "duplicate")
+        self.assertEqual(len(record_path.read_text(encoding="utf-8").splitlines()), 4)
+
+        self.state.reset_stats()
+        self.assertEqual(webhooks.replay(self.receiver(), record_path), 0)
+        after = self.newest_edges()
+        self.assertNotEqual(fetch_admin.latest_snapshot_path(self.output / STORE), seeded)
+        self.assertEqual(after["gid://shopify/Product/1"]["node"]["title"], "Product 1")
+        self.assertEqual(after["gid://shopify/Product/1"]["cursor"], before["gid://shopify/Product/1"]["cursor"])
+        self.assertIn("gid://shopify/Product/3", after)
+        self.assertNotIn("gid://shopify/Product/999", after)
+        self.assertEqual(set(after), {f"gid://shopify/Product/{number}" for number in range(1, self.products + 1)})
+        # Products 1, 2 and 3 are re-fetched in one search query.
+        self.assertEqual(self.requests("graphql:FetchAdmin"), 1)
+
+    def test_rejected_delivery_can_be_retried(self) -> None:
+        receiver = self.receiver()
+        body, signature = signed(self.secret, {"title": "no id"})
+        with self.assertRaises(webhooks.WebhookRejected):
+            receiver.receive("products/update", STORE, signature, body, "w1")
+        with self.assertRaises(webhooks.WebhookRejected):
+            receiver.receive("products/update", STORE, "bad-signature", signed(self.secret, {"id": 1})[0], "w1")
+        self.assertEqual(self.deliver(receiver, "products/update", {"id": 1}, "w1"), "queued")
+        self.assertEqual(self.deliver(receiver, "shop/update", {}, "w2"), "ignored")
+        self.assertEqual(self.deliver(receiver, "shop/update", {}, "w2"), "duplicate")
+
+    def test_failed_batches_are_requeued_then_dropped(self) -> None:
+        self.seed_snapshot()
+        receiver = self.receiver()
+        self.deliver(receiver, "products/update", {"id": 1}, "w1")
+        with mock.patch.object(receiver, "apply", side_effect=fetch_admin.ShopifyError("boom")) as apply:
+            self.assertEqual(receiver.flush(), 1)
+            # An event arriving while the batch was out is merged into the retry.
+            self.deliver(receiver, "products/delete", {"id": 2}, "w2")
+            for _ in range(webhooks.MAX_PATCH_ATTEMPTS - 1):
+                self.assertEqual(receiver.flush(), 1)
+            self.assertEqual(receiver.flush(force=True), 0)
+        self.assertEqual(apply.call_count, webhooks.MAX_PATCH_ATTEMPTS)
+        self.assertEqual(apply.call_args.args[1], {"gid://shopify/Product/1": "refresh", "gid://shopify/Product/2": "delete"})
+
+        self.deliver(receiver, "products/update", {"id": 1}, "w3")
+        self.assertEqual(receiver.flush(), 0)
+        self.assertEqual(self.newest_edges()["gid://shopify/Product/1"]["node"]["title"], "Product 1")
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class ShopExtrasTest(StubTestCase):
+    products = 20
+    max_query_cost = 0  # as in WebhookTest
+
+    def setUp(self) -> None:
+        super().setUp()
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.output = pathlib.Path(temp.name) / "raw-admin"
+        self.store = {"store_id": STORE, "admin_token": "smoke-token", "return_window_days": 30}
+        logging = mock.patch.object(fetch_admin, "LOG_TO_STDOUT", False), mock.patch.object(fetch_admin, "LOG_DIR", pathlib.Path(temp.name) / "log")
+        for patch in logging:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(fetch_admin.close_logging)
+
+    def test_extras_reuse_the_crawled_and_probed_shop(self) -> None:
+        path = fetch_admin.process_store(self.store, self.output, 10, 5)
+        shop = SnapshotReader(path).shop()
+        self.assertIn("policyUrls", shop)
+        self.assertEqual(self.requests("graphql:FetchShop"), 0)
+
+        for task in ("shop", "policies"):
+            self.state.reset_stats()
+            with mock.patch.object(fetch_admin, "latest_shop_section", return_value={**shop, "name": "Moved", "policyUrls": {}}):
+                self.assertTrue(fetch_admin.refresh_store(self.store, task, self.output, 10, 5))
+            self.assertEqual(self.requests("graphql:FetchShop"), 1 if task == "shop" else 0)
+            self.assertEqual(self.requests("rest:policies.json"), 1)
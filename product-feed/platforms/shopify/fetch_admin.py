@@ -5,20 +5,82 @@ from __future__ import annotations
 
 import argparse
 import datetime as dt
+import hashlib
 import json
+import os
 import pathlib
+import signal
 import sys
-import urllib.error
-import urllib.request
-import ssl
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
 from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Callable, TextIO
 from urllib.parse import urlparse, urlunparse
 
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[2]))
+from common.shopify_client import AdminAPIError, ShopifyAdminClient, admin_api_url as client_api_url  # noqa: E402
+from common.checkpoint import PaginationCheckpoint  # noqa: E402
+from common.changeset import CHANGES_SUFFIX, ChangeSetRecorder, digest_path, read_change_counts  # noqa: E402
+from common.framed_snapshot import (  # noqa: E402
+    FramedSnapshot,
+    FramedSnapshotWriter,
+    index_path,
+    is_framed_snapshot,
+    require_compression,
+)
+from common.scheduler import Cadence, RefreshScheduler  # noqa: E402
+from common.snapshot_catalog import CATALOG_FILENAME, SnapshotCatalog  # noqa: E402
+from common.snapshot_history import HistoryRecorder, SnapshotHistory  # noqa: E402
+from common.snapshot_reader import SnapshotReader  # noqa: E402
+from common.snapshot_writer import SnapshotWriter  # noqa: E402
+from common.telemetry import RunMetrics  # noqa: E402
+from common.throttle import MAX_PAGE_SIZE, ThrottleController, error_codes, query_cost_key  # noqa: E402
+
 API_VERSION = "2025-07"  # See https://shopify.dev/docs/api/usage/versioning
 HISTORY_VERSION_RETENTION = 30
 DEFAULT_PAGE_SIZE = 50
+DEFAULT_MAX_WORKERS = 1
 VARIANT_PAGE_SIZE = 50
-VARIANT_FRAGMENT = """
+VARIANT_BATCH_SIZE = 10  # products per aliased variant-overflow query
+BULK_POLL_INTERVAL_SECONDS = 5.0
+BULK_TIMEOUT_SECONDS = 4 * 60 * 60
+# Per-connection limits of GRAPHQL_QUERY; bulk results are trimmed to match.
+BULK_CONNECTION_LIMITS = {"images": 10, "collections": 10, "inventoryLevels": 10}
+ID_SWEEP_PAGE_SIZE = 250
+# Re-read products updated shortly before the watermark to cover search index lag.
+INCREMENTAL_OVERLAP = dt.timedelta(minutes=10)
+INCREMENTAL_ID_FILTER_CHUNK = 50
+DEFAULT_PARTITIONS = 1
+MAX_PARTITIONS = 16
+PARTITION_KEYS = ("id", "created_at")
+PARTITION_SAMPLES_PER_SPLIT = 4  # productsCount probes per split point
+PARTITION_MAX_SAMPLES = 32
+THROTTLE_MAX_RETRIES = 5
+FIELD_PROFILES = ("full", "commerce", "inventory")
+INVENTORY_LEVEL_FIELDS = """
+    inventoryLevels(first: 10) {
+      edges {
+        node {
+          location {
+            name
+            address {
+                zip
+            }
+          }
+          quantities(names: "on_hand") { 
+            name
+            quantity
+          }
+        }
+      }
+    }"""
+# Variant selections per field profile. Lean runs are merged into the newest
+# full snapshot, so every profile selects a subset of "full".
+VARIANT_FRAGMENTS = {
+    "full": """
 fragment VariantFields on ProductVariant {
   id
   title
@@ -37,49 +99,207 @@ fragment VariantFields on ProductVariant {
         value
         unit
       }
+    }""" + INVENTORY_LEVEL_FIELDS + """
+  }
+}
+
+""",
+    "commerce": """
+fragment VariantFields on ProductVariant {
+  id
+  title
+  price
+  inventoryQuantity
+  barcode
+  sku
+  selectedOptions { name value }
+}
+
+""",
+    "inventory": """
+fragment VariantFields on ProductVariant {
+  id
+  sku
+  inventoryQuantity
+  inventoryItem {
+    id
+    tracked""" + INVENTORY_LEVEL_FIELDS + """
+  }
+}
+
+""",
+}
+VARIANT_FRAGMENT = VARIANT_FRAGMENTS["full"]
+PRODUCT_FRAGMENTS = {
+    "full": """
+fragment ProductFields on Product {
+  id
+  handle
+  title
+  description
+  descriptionHtml
+  vendor
+  productType
+  tags
+  category {
+    fullName
+    id
+  }
+  featuredImage {
+    url
+    altText
+  }
+  images(first: 10) {
+    edges {
+      node {
+        url
+        altText
+      }
     }
-    inventoryLevels(first: 10) {
-      edges {
-        node {
-          location {
-            name
-            address {
-                zip
-            }
-          }
-          quantities(names: "on_hand") { 
-            name
-            quantity
-          }
-        }
+  }
+  collections(first: 10) {
+    edges {
+      node {
+        id
+        handle
+        title
       }
     }
   }
+  updatedAt
+  totalInventory
+  metafield(namespace: "custom", key: "material") {
+    value
+  }
+}
+""",
+    "commerce": """
+fragment ProductFields on Product {
+  id
+  handle
+  title
+  vendor
+  productType
+  tags
+  updatedAt
+  totalInventory
+}
+""",
+    "inventory": """
+fragment ProductFields on Product {
+  id
+  handle
+  updatedAt
+  totalInventory
+}
+""",
 }
-
-"""
 BASE_DIR = pathlib.Path(__file__).resolve().parents[2]
 DEFAULT_OUTPUT_DIR = BASE_DIR / "data/shopify/raw-admin"
+HISTORY_DIR_NAME = "history"
+CHECKPOINT_DIR_NAME = ".checkpoint"
+DEFAULT_RESUME_WINDOW_MINUTES = 6 * 60
+SNAPSHOT_FORMATS = ("json", "gzip", "zstd")
+SNAPSHOT_GLOBS = ("*.json", "*.jsonl.gz", "*.jsonl.zst")
+# Daemon refresh cadences (seconds): shortened after a run that found changes, lengthened otherwise.
+# A new store starts with the first (a catalog crawl covers the others).
+REFRESH_CADENCES = {
+    "catalog": Cadence(minimum=15 * 60, initial=60 * 60, maximum=24 * 60 * 60),
+    "inventory": Cadence(minimum=5 * 60, initial=15 * 60, maximum=6 * 60 * 60),
+    "shop": Cadence(minimum=60 * 60, initial=6 * 60 * 60, maximum=7 * 24 * 60 * 60),
+    "policies": Cadence(minimum=60 * 60, initial=12 * 60 * 60, maximum=7 * 24 * 60 * 60),
+}
+SHOP_EXTRA_FIELDS = ("policyUrls", "shippingRates")
+SCHEDULE_FILENAME = ".schedule.json"
+DAEMON_POLL_SECONDS = 5.0
+DAEMON_METRICS_SECONDS = 60 * 60
 DEFAULT_CONFIG_PATH = BASE_DIR / "platforms/shopify/shops.json"
 LOG_DIR = pathlib.Path("/tmp/integrations/product-feed/shopify/log")
 LOG_LATEST = LOG_DIR / "admin-latest.log"
 LOG_SINKS: list[pathlib.Path] = []
+LOG_HANDLES: list[TextIO] = []
+RUN_STAMP: str | None = None
 LOG_TO_STDOUT = False
 LOG_RETENTION = 30
+LOG_LOCK = threading.Lock()
+STORE_LOCKS: dict[str, threading.Lock] = {}
+STORE_LOCKS_GUARD = threading.Lock()
+THROTTLES: dict[str, ThrottleController] = {}
+METRICS = RunMetrics()
+CLIENT = ShopifyAdminClient(observer=METRICS.record_request)
 
-GRAPHQL_QUERY = VARIANT_FRAGMENT + """
-query FetchAdmin($first: Int!, $after: String) {
-  shop {
+
+def profile_operation(base: str, profile: str) -> str:
+    """Operation name per profile, so cost tracking keeps profiles apart."""
+    return base if profile == "full" else f"{base}{profile.title()}"
+
+
+@lru_cache(maxsize=None)
+def products_query(profile: str = "full") -> str:
+    """Paged catalog query selecting the fields of ``profile``."""
+    return VARIANT_FRAGMENTS[profile] + PRODUCT_FRAGMENTS[profile] + f"""
+query {profile_operation("FetchAdmin", profile)}($first: Int!, $after: String, $query: String) {{
+  shop {{
     id
     name
     myshopifyDomain
     contactEmail
     currencyCode
-    primaryDomain {
+    primaryDomain {{
       url
       host
+    }}
+  }}
+  products(first: $first, after: $after, query: $query) {{
+    pageInfo {{
+      hasNextPage
+      endCursor
+    }}
+    edges {{
+      cursor
+      node {{
+        ...ProductFields
+        variants(first: 50) {{
+          edges {{
+            node {{
+              ...VariantFields
+            }}
+          }}
+          pageInfo {{
+            hasNextPage
+            endCursor
+          }}
+        }}
+      }}
+    }}
+  }}
+}}
+"""
+
+
+GRAPHQL_QUERY = products_query("full")
+
+PRODUCT_VARIANTS_QUERY = VARIANT_FRAGMENT + """
+query FetchProductVariants($id: ID!, $first: Int!, $after: String) {
+  product(id: $id) {
+    variants(first: $first, after: $after) {
+      edges {
+        node {
+          ...VariantFields
+        }
+      }
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
     }
   }
+}
+"""
+
+
+PRODUCT_IDS_QUERY = """
+query FetchProductIds($first: Int!, $after: String) {
   products(first: $first, after: $after) {
     pageInfo {
       hasNextPage
@@ -87,6 +307,82 @@ query FetchAdmin($first: Int!, $after: String) {
     }
     edges {
       cursor
+      node {
+        id
+      }
+    }
+  }
+}
+"""
+
+PARTITION_BOUNDS_QUERY = """
+query FetchPartitionBounds($sortKey: ProductSortKeys!) {
+  first: products(first: 1, sortKey: $sortKey) {
+    edges {
+      node {
+        id
+        createdAt
+      }
+    }
+  }
+  last: products(first: 1, sortKey: $sortKey, reverse: true) {
+    edges {
+      node {
+        id
+        createdAt
+      }
+    }
+  }
+  productsCount(limit: null) {
+    count
+  }
+}
+"""
+
+# Inventory refreshes page inventory items rather than products: cost follows
+# the variants that exist instead of every product's variants(first: 50) slot.
+INVENTORY_ITEMS_QUERY = """
+query FetchInventoryItems($first: Int!, $after: String) {
+  inventoryItems(first: $first, after: $after) {
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+    edges {
+      node {
+        id
+        variant {
+          id
+          inventoryQuantity
+        }""" + INVENTORY_LEVEL_FIELDS + """
+      }
+    }
+  }
+}
+"""
+
+SHOP_QUERY = """
+query FetchShop {
+  shop {
+    id
+    name
+    myshopifyDomain
+    contactEmail
+    currencyCode
+    primaryDomain {
+      url
+      host
+    }
+  }
+}
+"""
+
+# Bulk operations ignore pagination arguments and flatten nested connections
+# into JSONL lines linked by __parentId; __typename tells the children apart.
+BULK_PRODUCTS_QUERY = """
+{
+  products {
+    edges {
       node {
         id
         handle
@@ -104,17 +400,19 @@ query FetchAdmin($first: Int!, $after: String) {
           url
           altText
         }
-        images(first: 10) {
+        images {
           edges {
             node {
+              __typename
               url
               altText
             }
           }
         }
-        collections(first: 10) {
+        collections {
           edges {
             node {
+              __typename
               id
               handle
               title
@@ -126,16 +424,48 @@ query FetchAdmin($first: Int!, $after: String) {
         metafield(namespace: "custom", key: "material") {
           value
         }
-        variants(first: 50) {
+        variants {
           edges {
             node {
-              ...VariantFields
+              __typename
+              id
+              title
+              price
+              inventoryQuantity
+              barcode
+              sku
+              selectedOptions { name value }
+              inventoryItem {
+                id
+                tracked
+                countryCodeOfOrigin
+                harmonizedSystemCode
+                measurement {
+                  weight {
+                    value
+                    unit
+                  }
+                }
+                inventoryLevels {
+                  edges {
+                    node {
+                      __typename
+                      location {
+                        name
+                        address {
+                          zip
+                        }
+                      }
+                      quantities(names: "on_hand") {
+                        name
+                        quantity
+                      }
+                    }
+                  }
+                }
+              }
             }
           }
-          pageInfo {
-            hasNextPage
-            endCursor
-          }
         }
       }
     }
@@ -143,64 +473,84 @@ query FetchAdmin($first: Int!, $after: String) {
 }
 """
 
-PRODUCT_VARIANTS_QUERY = VARIANT_FRAGMENT + """
-query FetchProductVariants($id: ID!, $first: Int!, $after: String) {
-  product(id: $id) {
-    variants(first: $first, after: $after) {
-      edges {
-        node {
-          ...VariantFields
-        }
-      }
-      pageInfo {
-        hasNextPage
-        endCursor
-      }
+BULK_RUN_MUTATION = """
+mutation RunBulkSnapshot($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation {
+      id
+      status
+    }
+    userErrors {
+      field
+      message
     }
   }
 }
 """
 
-
-
-
-
-
-
+BULK_STATUS_QUERY = """
+query BulkSnapshotStatus($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation {
+      id
+      status
+      errorCode
+      objectCount
+      url
+      partialDataUrl
+    }
+  }
+}
+"""
 
 
 def prepare_logging(use_stdout: bool) -> None:
-    """Configure log sinks for the current run."""
-    global LOG_TO_STDOUT, LOG_SINKS
+    """Configure log sinks for the current run; sink files stay open until ``close_logging``."""
+    global LOG_TO_STDOUT, RUN_STAMP
+    close_logging()
     LOG_TO_STDOUT = use_stdout
-    LOG_SINKS.clear()
+    RUN_STAMP = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
     if LOG_TO_STDOUT:
         return
     LOG_DIR.mkdir(parents=True, exist_ok=True)
-    run_stamp = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-    run_file = LOG_DIR / f"admin-{run_stamp}.log"
-    run_file.touch(exist_ok=True)
-    LOG_LATEST.write_text("", encoding="utf-8")
-    LOG_SINKS.extend([run_file, LOG_LATEST])
+    run_file = LOG_DIR / f"admin-{RUN_STAMP}.log"
+    with LOG_LOCK:
+        LOG_SINKS.extend([run_file, LOG_LATEST])
+        LOG_HANDLES.extend([
+            run_file.open("a", encoding="utf-8", buffering=1),
+            LOG_LATEST.open("w", encoding="utf-8", buffering=1),
+        ])
+
+
+def close_logging() -> None:
+    with LOG_LOCK:
+        for handle in LOG_HANDLES:
+            handle.close()
+        LOG_HANDLES.clear()
+        LOG_SINKS.clear()
 
 
 class ShopifyError(RuntimeError):
     """Generic failure raised when Shopify rejects a request."""
 
 
+class QueryCostError(ShopifyError):
+    """Raised when a query requests more cost than the store can ever grant; retry it smaller."""
+
+
 def log(message: str) -> None:
     timestamp = dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
     line = f"{timestamp} {message}"
-    if LOG_TO_STDOUT:
-        print(line)
-        return
-    if not LOG_SINKS:
-        LOG_DIR.mkdir(parents=True, exist_ok=True)
-        default_target = LOG_DIR / "admin.log"
-        default_target.touch(exist_ok=True)
-        LOG_SINKS.append(default_target)
-    for sink in LOG_SINKS:
-        with sink.open("a", encoding="utf-8") as handle:
+    with LOG_LOCK:
+        if LOG_TO_STDOUT:
+            print(line, flush=True)
+            return
+        if not LOG_HANDLES:
+            LOG_DIR.mkdir(parents=True, exist_ok=True)
+            default_target = LOG_DIR / "admin.log"
+            LOG_SINKS.append(default_target)
+            LOG_HANDLES.append(default_target.open("a", encoding="utf-8", buffering=1))
+        for handle in LOG_HANDLES:
             handle.write(line + "\n")
 
 
@@ -231,23 +581,62 @@ def load_shops(config_path: pathlib.Path) -> list[dict]:
                 "Each enabled store needs 'return_window_days' greater than zero"
             )
         store["return_window_days"] = window_days
+        if store.get("profile") is not None and store["profile"] not in FIELD_PROFILES:
+            raise ShopifyError(
+                f"Store 'profile' must be one of {', '.join(FIELD_PROFILES)}"
+            )
+        if store.get("partitions") is not None:
+            if not isinstance(store["partitions"], int) or store["partitions"] < 1:
+                raise ShopifyError("Store 'partitions' must be a positive integer")
+        if store.get("partition_key") is not None and store["partition_key"] not in PARTITION_KEYS:
+            raise ShopifyError(
+                f"Store 'partition_key' must be one of {', '.join(PARTITION_KEYS)}"
+            )
     return enabled
 
 
-def build_request(
+def throttle_for(store_id: str) -> ThrottleController:
+    with STORE_LOCKS_GUARD:
+        throttle = THROTTLES.get(store_id)
+        if throttle is None:
+            throttle = THROTTLES[store_id] = ThrottleController()
+        return throttle
+
+
+def admin_api_url(store_id: str, resource: str) -> str:
+    return client_api_url(store_id, resource, API_VERSION)
+
+
+def post_graphql(
     store_id: str,
     token: str,
     variables: dict,
     query: str = GRAPHQL_QUERY,
-) -> urllib.request.Request:
-    url = f"https://{store_id}.myshopify.com/admin/api/{API_VERSION}/graphql.json"
-    body = json.dumps({"query": query, "variables": variables}).encode("utf-8")
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": token,
-        "Accept": "application/json",
-    }
-    return urllib.request.Request(url=url, data=body, headers=headers, method="POST")
+) -> dict:
+    try:
+        return CLIENT.post_graphql(
+            admin_api_url(store_id, "graphql.json"),
+            token,
+            query,
+            variables,
+            label=store_id,
+            operation=f"graphql:{query_cost_key(query)}",
+        )
+    except AdminAPIError as exc:
+        log(f"Request error: {exc}")
+        raise ShopifyError(str(exc)) from exc
+
+
+def get_rest(store_id: str, token: str, resource: str) -> dict:
+    try:
+        return CLIENT.get_json(
+            admin_api_url(store_id, resource),
+            token,
+            label=store_id,
+            operation=f"rest:{resource}",
+        )
+    except AdminAPIError as exc:
+        raise ShopifyError(str(exc)) from exc
 
 
 def execute_query(
@@ -255,112 +644,159 @@ def execute_query(
     token: str,
     variables: dict,
     query: str = GRAPHQL_QUERY,
+    cost_units: int | None = None,
 ) -> dict:
-    request = build_request(store_id, token, variables, query=query)
-    try:
-        with urllib.request.urlopen(request, timeout=30) as response:
-            payload = response.read().decode("utf-8")
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8", errors="replace")
-        raise ShopifyError(f"{store_id}: HTTP {exc.code} {detail[:200]}") from exc
-    except urllib.error.URLError as exc:
-        reason = exc.reason
-        log(f"Request error: urllib.URLError reason={reason!r}")
-        if isinstance(reason, ssl.SSLCertVerificationError) or "CERTIFICATE_VERIFY_FAILED" in str(reason):
-            raise ShopifyError(f"{store_id}: TLS certificate validation failed. Verify your system certificate bundle.") from exc
-        raise ShopifyError(f"{store_id}: {reason}") from exc
+    """Run a GraphQL query, pacing it on the store's cost bucket.
+
+    ``cost_units`` is what the query's cost scales with (defaults to ``first``).
+    """
+    throttle = throttle_for(store_id)
+    cost_key = query_cost_key(query)
+    first = cost_units if cost_units is not None else variables.get("first")
+    operation = f"graphql:{cost_key}"
+    attempt = 0
+    while True:
+        waited, reservation = throttle.acquire(cost_key, first)
+        if waited:
+            METRICS.record_throttle_wait(store_id, operation, waited)
+        try:
+            parsed = post_graphql(store_id, token, variables, query=query)
+        except BaseException:
+            throttle.release(reservation)
+            raise
+        extensions = parsed.get("extensions")
+        throttle.observe(cost_key, first, extensions, reservation)
+        cost = (extensions or {}).get("cost") if isinstance(extensions, dict) else None
+        if isinstance(cost, dict):
+            METRICS.record_cost(store_id, operation, cost.get("requestedQueryCost"), cost.get("actualQueryCost"))
+
+        errors = parsed.get("errors") or (parsed.get("data") or {}).get("errors")
+        codes = error_codes(errors)
+        if "MAX_COST_EXCEEDED" in codes or ("THROTTLED" in codes and throttle.exceeds_bucket(cost_key, first)):
+            raise QueryCostError(f"{store_id}: {cost_key} requests more cost than the store allows")
+        if "THROTTLED" in codes and attempt < THROTTLE_MAX_RETRIES:
+            attempt += 1
+            METRICS.record_retry(store_id, operation)
+            if throttle.restore_rate is None:
+                # No throttleStatus to pace on; fall back to exponential backoff.
+                time.sleep(2 ** attempt)
+            log(f"Throttled by {store_id} on {cost_key}; retry {attempt}/{THROTTLE_MAX_RETRIES}")
+            continue
+        if errors:
+            raise ShopifyError(f"{store_id}: GraphQL errors {errors}")
+        return parsed
 
-    try:
-        parsed = json.loads(payload)
-    except json.JSONDecodeError as exc:
-        raise ShopifyError(f"{store_id}: Shopify returned invalid JSON ({exc})") from exc
 
-    errors = parsed.get("errors") or parsed.get("data", {}).get("errors")
-    if errors:
-        raise ShopifyError(f"{store_id}: GraphQL errors {errors}")
-    return parsed
+def fetch_admin(
+    store_id: str,
+    token: str,
+    page_size: int,
+    search_query: str | None = None,
+    on_page: Callable[[dict | None, list, dict], None] | None = None,
+    after: str | None = None,
+    profile: str = "full",
+) -> dict:
+    """Crawl products page by page, starting after cursor ``after`` if given.
 
+    ``profile`` selects which product and variant fields are requested.
 
-def fetch_admin(store_id: str, token: str, page_size: int) -> dict:
-    cursor = None
+    With ``on_page`` each page's edges are handed to the callback (together
+    with the shop info and the page's ``pageInfo``) instead of being
+    collected, and the returned snapshot's edge list stays empty.
+
+    A page's variant overflow and delivery run on a helper thread while the
+    next page is requested; pages are still delivered one at a time, in order.
+    """
+    cursor = after
     edges: list[dict] = []
     shop_info = None
     extensions = None
     last_cursor = None
+    query = products_query(profile)
 
-    while True:
-        variables = {"first": page_size, "after": cursor}
-        parsed = execute_query(store_id, token, variables)
-        data = parsed.get("data")
-        if not isinstance(data, dict):
-            raise ShopifyError(f"{store_id}: response missing 'data'")
-
-        extensions = parsed.get("extensions") or extensions
+    def deliver(page_shop: dict | None, page_edges: list, overflow: dict[str, dict], page_info: dict) -> None:
+        fetch_variant_overflow(store_id, token, overflow, profile)
+        if on_page is not None:
+            on_page(page_shop, page_edges, page_info)
+        else:
+            edges.extend(page_edges)
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"overflow-{store_id}") as executor:
+        pending = None
+        while True:
+            variables = {"first": page_size, "after": cursor}
+            if search_query:
+                variables["query"] = search_query
+            try:
+                parsed = execute_query(store_id, token, variables, query=query)
+            except QueryCostError:
+                if page_size <= 1:
+                    raise
+                page_size = max(1, page_size // 2)
+                log(f"Query cost too high for {store_id}; retrying page with page size {page_size}")
+                continue
+            data = parsed.get("data")
+            if not isinstance(data, dict):
+                raise ShopifyError(f"{store_id}: response missing 'data'")
 
-        if shop_info is None:
-            shop_info = data.get("shop")
+            extensions = parsed.get("extensions") or extensions
 
-        products = data.get("products") or {}
-        batch_edges = products.get("edges") or []
-        processed_edges: list[dict] = []
+            if shop_info is None:
+                shop_info = data.get("shop")
 
-        for edge in batch_edges:
-            if not isinstance(edge, dict):
-                processed_edges.append(edge)
-                continue
+            products = data.get("products") or {}
+            batch_edges = products.get("edges") or []
+            processed_edges: list[dict] = []
 
-            node = edge.get("node")
-            if not isinstance(node, dict):
-                processed_edges.append(edge)
-                continue
+            overflow: dict[str, dict] = {}
+            for edge in batch_edges:
+                if not isinstance(edge, dict):
+                    processed_edges.append(edge)
+                    continue
 
-            product_id = node.get("id")
-            variants = node.get("variants")
-            if isinstance(variants, dict) and product_id:
-                variant_edges = variants.get("edges") or []
-                if not isinstance(variant_edges, list):
-                    variant_edges = []
-
-                page_info = variants.get("pageInfo") or {}
-                if not isinstance(page_info, dict):
-                    page_info = {}
-
-                has_next = bool(page_info.get("hasNextPage"))
-                end_cursor = page_info.get("endCursor")
-
-                while has_next:
-                    extra_edges, page_info = fetch_product_variants(
-                        store_id,
-                        token,
-                        product_id,
-                        end_cursor,
-                        VARIANT_PAGE_SIZE,
-                    )
-                    if extra_edges:
-                        variant_edges.extend(extra_edges)
-                    if not extra_edges and page_info.get("endCursor") == end_cursor:
-                        break
-                    has_next = bool(page_info.get("hasNextPage"))
-                    end_cursor = page_info.get("endCursor")
-
-                variants["edges"] = variant_edges
-                variants["pageInfo"] = {
-                    "hasNextPage": False,
-                    "endCursor": end_cursor,
-                }
+                node = edge.get("node")
+                if not isinstance(node, dict):
+                    processed_edges.append(edge)
+                    continue
 
-            processed_edges.append(edge)
+                product_id = node.get("id")
+                variants = node.get("variants")
+                if isinstance(variants, dict) and product_id:
+                    variant_edges = variants.get("edges") or []
+                    if not isinstance(variant_edges, list):
+                        variant_edges = []
+
+                    page_info = variants.get("pageInfo") or {}
+                    if not isinstance(page_info, dict):
+                        page_info = {}
+
+                    variants["edges"] = variant_edges
+                    variants["pageInfo"] = {
+                        "hasNextPage": False,
+                        "endCursor": page_info.get("endCursor"),
+                    }
+                    if page_info.get("hasNextPage"):
+                        overflow[product_id] = variants
 
-        edges.extend(processed_edges)
+                processed_edges.append(edge)
 
-        page_info = products.get("pageInfo") or {}
-        if page_info.get("hasNextPage"):
-            cursor = page_info.get("endCursor")
-            if not cursor:
-                raise ShopifyError(f"{store_id}: missing endCursor for next page")
-        else:
-            last_cursor = page_info.get("endCursor")
-            break
+            page_info = products.get("pageInfo") or {}
+            if pending is not None:
+                pending.result()
+            pending = executor.submit(deliver, shop_info, processed_edges, overflow, page_info)
+
+            if page_info.get("hasNextPage"):
+                cursor = page_info.get("endCursor")
+                if not cursor:
+                    raise ShopifyError(f"{store_id}: missing endCursor for next page")
+                next_page_size = throttle_for(store_id).suggest_page_size(query_cost_key(query), page_size)
+                if next_page_size != page_size:
+                    log(f"Adjusting page size for {store_id} from {page_size} to {next_page_size}")
+                    page_size = next_page_size
+            else:
+                last_cursor = page_info.get("endCursor")
+                break
+        pending.result()
 
     snapshot = {
         "data": {
@@ -379,27 +815,715 @@ def fetch_admin(store_id: str, token: str, page_size: int) -> dict:
     return snapshot
 
 
-def fetch_shop_policies(store_id: str, token: str, preferred_domain: str | None = None) -> dict[str, str]:
-    url = f"https://{store_id}.myshopify.com/admin/api/{API_VERSION}/policies.json"
-    request = urllib.request.Request(
-        url=url,
-        headers={"Accept": "application/json", "X-Shopify-Access-Token": token},
-        method="GET",
+@lru_cache(maxsize=None)
+def partition_count_query(count: int) -> str:
+    """Aliased ``productsCount`` for ``count`` search filters in one request."""
+    params = ", ".join(f"$q{i}: String" for i in range(count))
+    selections = "\n".join(f"  c{i}: productsCount(query: $q{i}, limit: null) {{\n    count\n  }}" for i in range(count))
+    return f"query FetchPartitionCounts({params}) {{\n{selections}\n}}\n"
+
+
+def partition_value(key: str, node: object) -> int | None:
+    """Numeric position of a product on the partition key: its numeric ID or ``createdAt`` epoch seconds."""
+    if not isinstance(node, dict):
+        return None
+    if key == "id":
+        number = str(node.get("id") or "").rsplit("/", 1)[-1]
+        return int(number) if number.isdigit() else None
+    created_at = node.get("createdAt")
+    if not isinstance(created_at, str):
+        return None
+    try:
+        return int(dt.datetime.fromisoformat(created_at.replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return None
+
+
+def partition_bound(key: str, value: int) -> str:
+    if key == "id":
+        return str(value)
+    return "'" + dt.datetime.fromtimestamp(value, dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") + "'"
+
+
+def partition_filters(key: str, splits: list[int]) -> list[str]:
+    """Disjoint search filters covering everything, in key order; the outer ranges are open-ended."""
+    bounds = [partition_bound(key, split) for split in splits]
+    filters = [f"{key}:<={bounds[0]}"]
+    filters.extend(f"{key}:>{low} AND {key}:<={high}" for low, high in zip(bounds, bounds[1:]))
+    filters.append(f"{key}:>{bounds[-1]}")
+    return filters
+
+
+def plan_partitions(store_id: str, token: str, partitions: int, page_size: int, key: str = "id") -> list[str | None]:
+    """Search filters splitting the catalog into up to ``partitions`` ranges of similar size.
+
+    One request reads the lowest and highest product on ``key`` plus the total
+    count, a second counts the products at or below evenly spaced sample
+    points; split points are interpolated from those cumulative counts.
+    Returns ``[None]`` (one unfiltered crawl) when splitting is not worth it.
+    """
+    sort_key = "ID" if key == "id" else "CREATED_AT"
+    parsed = execute_query(store_id, token, {"sortKey": sort_key}, query=PARTITION_BOUNDS_QUERY)
+    data = parsed.get("data")
+    if not isinstance(data, dict):
+        raise ShopifyError(f"{store_id}: partition bounds response missing 'data'")
+    ends = []
+    for alias in ("first", "last"):
+        edges = (data.get(alias) or {}).get("edges") or []
+        ends.append(partition_value(key, edges[0].get("node")) if edges and isinstance(edges[0], dict) else None)
+    low, high = ends
+    total = (data.get("productsCount") or {}).get("count")
+    if low is None or high is None or high <= low or not isinstance(total, int):
+        return [None]
+    partitions = min(partitions, MAX_PARTITIONS, -(-total // max(1, page_size)))
+    if partitions <= 1:
+        return [None]
+
+    samples = min(PARTITION_MAX_SAMPLES, partitions * PARTITION_SAMPLES_PER_SPLIT)
+    points = sorted({low + (high - low) * index // samples for index in range(1, samples)} - {low, high})
+    cumulative = [(low, 0)]
+    if points:
+        variables = {f"q{index}": f"{key}:<={partition_bound(key, point)}" for index, point in enumerate(points)}
+        counts = execute_query(store_id, token, variables, query=partition_count_query(len(points)), cost_units=len(points)).get("data")
+        if not isinstance(counts, dict):
+            raise ShopifyError(f"{store_id}: partition count response missing 'data'")
+        for index, point in enumerate(points):
+            count = (counts.get(f"c{index}") or {}).get("count")
+            if isinstance(count, int):
+                cumulative.append((point, count))
+    cumulative.append((high, total))
+
+    splits: list[int] = []
+    for part in range(1, partitions):
+        target = total * part / partitions
+        for (point_a, count_a), (point_b, count_b) in zip(cumulative, cumulative[1:]):
+            if count_a < target <= count_b:
+                split = point_a + int((point_b - point_a) * (target - count_a) / (count_b - count_a))
+                if low <= split < high and (not splits or split > splits[-1]):
+                    splits.append(split)
+                break
+    if not splits:
+        return [None]
+    return partition_filters(key, splits)
+
+
+def fetch_admin_partitioned(
+    store_id: str,
+    token: str,
+    page_size: int,
+    partitions: int,
+    on_page: Callable[[dict | None, list, dict | None], None],
+    profile: str = "full",
+    key: str = "id",
+) -> dict:
+    """Crawl disjoint ``key`` ranges of one store concurrently, delivering pages in range order.
+
+    Every range is a regular paged crawl with a ``products(query:)`` filter;
+    they share the store's ThrottleController, so together they stay within
+    its cost budget. Pages of the range being delivered stream straight to
+    ``on_page`` (with ``None`` page info: the per-range cursors do not
+    checkpoint); later ranges spill their pages to a temporary JSONL file
+    each, replayed when their turn comes, so memory stays at one page per
+    range. With ``id`` ranges the product order matches a serial crawl.
+    """
+    filters = plan_partitions(store_id, token, partitions, page_size, key)
+    if len(filters) == 1:
+        return fetch_admin(store_id, token, page_size, on_page=on_page, profile=profile)
+    log(f"Crawling {store_id} in {len(filters)} {key} ranges: {'; '.join(filters)}")
+    condition = threading.Condition()
+    current = [0]  # the range being delivered; only ever advances
+    buffered: list[list[tuple]] = [[] for _ in filters]
+    finished = [False] * len(filters)
+    aborted = threading.Event()
+    spill_dir = tempfile.TemporaryDirectory(prefix=f"partitions-{store_id}-")
+    spill_paths = [pathlib.Path(spill_dir.name) / f"{index}.jsonl" for index in range(len(filters))]
+    spills: list[TextIO | None] = [None] * len(filters)
+
+    def collect(index: int) -> Callable[[dict | None, list, dict], None]:
+        def collect_page(page_shop: dict | None, edges: list, page_info: dict) -> None:
+            if aborted.is_set():
+                raise ShopifyError(f"{store_id}: partitioned crawl aborted")
+            with condition:
+                if index == current[0]:
+                    buffered[index].append((page_shop, edges))
+                    condition.notify_all()
+                    return
+            line = json.dumps([page_shop, edges], ensure_ascii=False) + "\n"
+            # Decide and write under the lock, so a range that just became current
+            # cannot see a page in memory ahead of one still being spilled.
+            with condition:
+                if index == current[0]:
+                    buffered[index].append((page_shop, edges))
+                else:
+                    if spills[index] is None:
+                        spills[index] = spill_paths[index].open("w", encoding="utf-8")
+                    spills[index].write(line)
+                    spills[index].flush()
+                condition.notify_all()
+        return collect_page
+
+    def crawl(index: int, search_query: str) -> dict:
+        try:
+            return fetch_admin(store_id, token, page_size, search_query=search_query, on_page=collect(index), profile=profile)
+        finally:
+            with condition:
+                finished[index] = True
+                condition.notify_all()
+
+    snapshots: list[dict] = []
+    try:
+        with ThreadPoolExecutor(max_workers=len(filters), thread_name_prefix=f"partition-{store_id}") as executor:
+            futures = [executor.submit(crawl, index, search_query) for index, search_query in enumerate(filters)]
+            try:
+                for index, future in enumerate(futures):
+                    with condition:
+                        current[0] = index
+                        spill, spills[index] = spills[index], None
+                    if spill is not None:
+                        spill.close()
+                        with spill_paths[index].open("r", encoding="utf-8") as handle:
+                            for line in handle:
+                                page_shop, edges = json.loads(line)
+                                on_page(page_shop, edges, None)
+                        spill_paths[index].unlink()
+                    while True:
+                        with condition:
+                            while not buffered[index] and not finished[index]:
+                                failed = next((other for other in futures if other.done() and other.exception()), None)
+                                if failed is not None:
+                                    failed.result()
+                                condition.wait(1.0)
+                            pages, buffered[index] = buffered[index], []
+                            done = finished[index]
+                        for page_shop, edges in pages:
+                            on_page(page_shop, edges, None)
+                        if done:
+                            break
+                    snapshots.append(future.result())
+            except BaseException:
+                aborted.set()
+                raise
+    finally:
+        for spill in spills:
+            if spill is not None:
+                spill.close()
+        spill_dir.cleanup()
+
+    snapshot = snapshots[0]
+    snapshot["data"]["products"]["pageInfo"] = snapshots[-1]["data"]["products"]["pageInfo"]
+    if snapshots[-1].get("extensions") is not None:
+        snapshot["extensions"] = snapshots[-1]["extensions"]
+    return snapshot
+
+
+@lru_cache(maxsize=None)
+def variant_batch_query(count: int, profile: str = "full") -> str:
+    """Aliased query fetching the next variant page for ``count`` products at once."""
+    params = ", ".join(f"$id{i}: ID!, $after{i}: String" for i in range(count))
+    selections = "\n".join(
+        f"""  p{i}: product(id: $id{i}) {{
+    variants(first: $first, after: $after{i}) {{
+      edges {{
+        node {{
+          ...VariantFields
+        }}
+      }}
+      pageInfo {{
+        hasNextPage
+        endCursor
+      }}
+    }}
+  }}"""
+        for i in range(count)
     )
+    operation = profile_operation("FetchVariantBatch", profile)
+    return VARIANT_FRAGMENTS[profile] + f"query {operation}($first: Int!, {params}) {{\n{selections}\n}}\n"
+
+
+def fetch_variant_overflow(store_id: str, token: str, pending: dict[str, dict], profile: str = "full") -> None:
+    """Page the remaining variants of every product in ``pending`` using batched aliased queries.
+
+    ``pending`` maps product IDs to their ``variants`` connection, whose
+    ``pageInfo.endCursor`` is the next cursor; connections are completed in place.
+    """
+    throttle = throttle_for(store_id)
+    cost_key = query_cost_key(variant_batch_query(1, profile))
+    width = VARIANT_BATCH_SIZE
+    while pending:
+        width = max(1, min(throttle.suggest_page_size(cost_key, width), VARIANT_BATCH_SIZE))
+        batch = list(pending.items())[:width]
+        variables: dict = {"first": VARIANT_PAGE_SIZE}
+        for index, (product_id, variants) in enumerate(batch):
+            variables[f"id{index}"] = product_id
+            variables[f"after{index}"] = variants["pageInfo"]["endCursor"]
+        try:
+            parsed = execute_query(
+                store_id,
+                token,
+                variables,
+                query=variant_batch_query(len(batch), profile),
+                cost_units=len(batch),
+            )
+        except QueryCostError:
+            if width <= 1:
+                raise
+            width = max(1, width // 2)
+            continue
+        data = parsed.get("data")
+        if not isinstance(data, dict):
+            raise ShopifyError(f"{store_id}: variant batch response missing 'data'")
+
+        for index, (product_id, variants) in enumerate(batch):
+            product = data.get(f"p{index}")
+            connection = product.get("variants") if isinstance(product, dict) else None
+            if not isinstance(connection, dict):
+                # Product vanished mid-crawl; keep what was already collected.
+                del pending[product_id]
+                continue
+            extra_edges = connection.get("edges") or []
+            page_info = connection.get("pageInfo") or {}
+            if not isinstance(extra_edges, list):
+                extra_edges = []
+            if not isinstance(page_info, dict):
+                page_info = {}
+            end_cursor = variants["pageInfo"]["endCursor"]
+            variants["edges"].extend(extra_edges)
+            if not extra_edges and page_info.get("endCursor") == end_cursor:
+                del pending[product_id]
+                continue
+            variants["pageInfo"]["endCursor"] = page_info.get("endCursor")
+            if not page_info.get("hasNextPage"):
+                del pending[product_id]
+
+
+def fetch_product_ids(store_id: str, token: str) -> tuple[list[tuple[str, str | None]], str | None]:
+    """Sweep every product ID (with its cursor) in default order; cheap enough to detect deletions."""
+    cursor = None
+    entries: list[tuple[str, str | None]] = []
+    while True:
+        variables = {"first": ID_SWEEP_PAGE_SIZE, "after": cursor}
+        parsed = execute_query(store_id, token, variables, query=PRODUCT_IDS_QUERY)
+        data = parsed.get("data")
+        if not isinstance(data, dict):
+            raise ShopifyError(f"{store_id}: product ID response missing 'data'")
+        products = data.get("products") or {}
+        for edge in products.get("edges") or []:
+            node = edge.get("node") if isinstance(edge, dict) else None
+            if isinstance(node, dict) and node.get("id"):
+                entries.append((node["id"], edge.get("cursor")))
+        page_info = products.get("pageInfo") or {}
+        if not page_info.get("hasNextPage"):
+            return entries, page_info.get("endCursor")
+        cursor = page_info.get("endCursor")
+        if not cursor:
+            raise ShopifyError(f"{store_id}: missing endCursor for next page of product IDs")
+
+
+def fetch_inventory_items(store_id: str, token: str, page_size: int) -> dict[str, dict]:
+    """Current stock per variant ID: ``{"inventoryQuantity", "inventoryItemId", "inventoryLevels"}``."""
+    items: dict[str, dict] = {}
+    cursor = None
+    cost_key = query_cost_key(INVENTORY_ITEMS_QUERY)
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    while True:
+        try:
+            parsed = execute_query(store_id, token, {"first": page_size, "after": cursor}, query=INVENTORY_ITEMS_QUERY)
+        except QueryCostError:
+            if page_size <= 1:
+                raise
+            page_size = max(1, page_size // 2)
+            log(f"Query cost too high for {store_id}; retrying inventory page with page size {page_size}")
+            continue
+        data = parsed.get("data")
+        if not isinstance(data, dict):
+            raise ShopifyError(f"{store_id}: inventory item response missing 'data'")
+        connection = data.get("inventoryItems") or {}
+        for edge in connection.get("edges") or []:
+            node = edge.get("node") if isinstance(edge, dict) else None
+            variant = node.get("variant") if isinstance(node, dict) else None
+            if not isinstance(variant, dict) or not variant.get("id"):
+                # Items without a variant belong to deleted or non-product inventory.
+                continue
+            items[str(variant["id"])] = {
+                "inventoryQuantity": variant.get("inventoryQuantity"),
+                "inventoryItemId": node.get("id"),
+                "inventoryLevels": node.get("inventoryLevels"),
+            }
+        page_info = connection.get("pageInfo") or {}
+        if not page_info.get("hasNextPage"):
+            return items
+        cursor = page_info.get("endCursor")
+        if not cursor:
+            raise ShopifyError(f"{store_id}: missing endCursor for next page of inventory items")
+        page_size = throttle_for(store_id).suggest_page_size(cost_key, page_size)
+
+
+def patch_inventory(edges: list[dict], items: dict[str, dict]) -> tuple[int, int]:
+    """Overwrite variant stock in ``edges`` from ``items`` in place; returns (variants matched, variants changed).
+
+    A product whose variants changed gets its ``totalInventory`` recomputed
+    from the tracked variants. Variants without a fetched item keep their values.
+    """
+    matched = changed = 0
+    for edge in edges:
+        node = edge.get("node") if isinstance(edge, dict) else None
+        variants = node.get("variants") if isinstance(node, dict) else None
+        product_changed = False
+        for variant_edge in (variants.get("edges") if isinstance(variants, dict) else None) or []:
+            variant = variant_edge.get("node") if isinstance(variant_edge, dict) else None
+            item = items.get(str(variant.get("id"))) if isinstance(variant, dict) else None
+            if item is None:
+                continue
+            matched += 1
+            inventory_item = variant.get("inventoryItem")
+            before = (variant.get("inventoryQuantity"), inventory_item.get("inventoryLevels") if isinstance(inventory_item, dict) else None)
+            variant["inventoryQuantity"] = item["inventoryQuantity"]
+            if isinstance(inventory_item, dict) and inventory_item.get("id") in (None, item["inventoryItemId"]):
+                inventory_item["inventoryLevels"] = item["inventoryLevels"]
+            after = (variant.get("inventoryQuantity"), inventory_item.get("inventoryLevels") if isinstance(inventory_item, dict) else None)
+            if after != before:
+                changed += 1
+                product_changed = True
+        if product_changed:
+            node["totalInventory"] = sum(
+                variant_edge["node"].get("inventoryQuantity") or 0
+                for variant_edge in variants["edges"]
+                if isinstance(variant_edge, dict) and isinstance(variant_edge.get("node"), dict)
+                and (variant_edge["node"].get("inventoryItem") or {}).get("tracked") is not False
+            )
+    return matched, changed
+
+
+def refresh_inventory(
+    store: dict,
+    output_dir: pathlib.Path,
+    page_size: int,
+    history_retention: int,
+    dedup_history: bool = False,
+    change_log: bool = True,
+    sqlite_catalog: bool = False,
+) -> pathlib.Path | None:
+    """Patch current stock into the store's newest snapshot in place; failures are logged, not raised.
+
+    Only inventory items are fetched. The snapshot keeps its name (and
+    format); its ``extensions.inventoryRefresh`` records when and how much was
+    refreshed, and its digest, change log, history manifest and catalog rows
+    are rewritten to match.
+    """
+    store_id = store["store_id"]
+    store_dir = output_dir / store_id
+    path = latest_snapshot_path(store_dir)
+    if path is None:
+        log(f"No snapshot to refresh inventory for {store_id}; run a catalog crawl first")
+        return None
+    log(f"Refreshing inventory for {store_id} in {path.name}")
     try:
-        with urllib.request.urlopen(request, timeout=30) as response:
-            payload = response.read().decode("utf-8")
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8", errors="replace")
-        raise ShopifyError(f"{store_id}: HTTP {exc.code} {detail[:200]}") from exc
-    except urllib.error.URLError as exc:
-        reason = exc.reason
-        raise ShopifyError(f"{store_id}: {reason}") from exc
+        items = fetch_inventory_items(store_id, store["admin_token"], page_size)
+        snapshot = load_snapshot(path)
+    except ShopifyError as exc:
+        log(f"Failed {store_id}: {exc}")
+        return None
+    data = snapshot.get("data") or {}
+    products = data.get("products") or {}
+    edges = products.get("edges") or []
+    matched, changed = patch_inventory(edges, items)
+    extensions = snapshot.get("extensions") if isinstance(snapshot.get("extensions"), dict) else {}
+    extensions["inventoryRefresh"] = {
+        "refreshedAt": dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "variants": matched,
+        "changed": changed,
+    }
+    snapshot_format = "json" if not is_framed_snapshot(path) else FramedSnapshot(path).compression
+    writer, recorder, changes, catalog = open_sinks(store_dir, snapshot_format, dedup_history, change_log, sqlite_catalog)
+    sinks = [sink for sink in (writer, recorder, changes, catalog) if sink is not None]
+    try:
+        for sink in sinks:
+            sink.write_edges(edges)
+            sink.finish(data.get("shop"), products.get("pageInfo"), extensions)
+        commit_snapshot(writer, output_dir, store_id, history_retention, recorder, changes, catalog, replace=path)
+    except BaseException:
+        for sink in sinks:
+            sink.abort()
+        raise
+    log(f"Refreshed inventory in {path} ({matched} variants, {changed} changed, {len(items) - matched} items not in the snapshot)")
+    return path
+
+
+def snapshot_paths(store_dir: pathlib.Path) -> list[pathlib.Path]:
+    """Visible snapshots in any format, oldest first (names start with the UTC stamp)."""
+    if not store_dir.is_dir():
+        return []
+    return sorted(
+        (
+            p for pattern in SNAPSHOT_GLOBS for p in store_dir.glob(pattern)
+            if p.is_file() and not p.name.startswith(".")
+        ),
+        key=lambda p: p.name,
+    )
+
+
+def latest_snapshot_path(store_dir: pathlib.Path) -> pathlib.Path | None:
+    snapshots = snapshot_paths(store_dir)
+    return snapshots[-1] if snapshots else None
+
+
+def load_snapshot(path: pathlib.Path) -> dict:
+    try:
+        if is_framed_snapshot(path):
+            return FramedSnapshot(path).load()
+        with path.open("r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError, RuntimeError) as exc:
+        raise ShopifyError(f"Unable to read snapshot {path}: {exc}") from exc
+
+
+def snapshot_product_edges(snapshot: dict) -> list[dict]:
+    products = (snapshot.get("data") or {}).get("products") or {}
+    edges = products.get("edges") or []
+    return [
+        edge for edge in edges
+        if isinstance(edge, dict) and isinstance(edge.get("node"), dict) and edge["node"].get("id")
+    ]
+
+
+def incremental_watermark(edges: list[dict]) -> str | None:
+    latest = None
+    for edge in edges:
+        updated_at = edge["node"].get("updatedAt")
+        if not isinstance(updated_at, str):
+            continue
+        try:
+            parsed = dt.datetime.fromisoformat(updated_at.replace("Z", "+00:00"))
+        except ValueError:
+            continue
+        if latest is None or parsed > latest:
+            latest = parsed
+    if latest is None:
+        return None
+    return (latest - INCREMENTAL_OVERLAP).astimezone(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def fetch_admin_incremental(
+    store_id: str,
+    token: str,
+    page_size: int,
+    store_dir: pathlib.Path,
+) -> dict:
+    """Re-fetch products updated since the newest snapshot and merge them into its edges.
+
+    Falls back to a full crawl when there is no usable previous snapshot.
+    """
+    previous_path = latest_snapshot_path(store_dir)
+    previous_edges = snapshot_product_edges(load_snapshot(previous_path)) if previous_path else []
+    watermark = incremental_watermark(previous_edges)
+    if watermark is None:
+        log(f"No previous snapshot with updatedAt for {store_id}; running a full crawl")
+        return fetch_admin(store_id, token, page_size)
+
+    # Sweep IDs before querying changes so products created in between land in the changed set.
+    product_ids, last_cursor = fetch_product_ids(store_id, token)
+    changed = fetch_admin(store_id, token, page_size, search_query=f"updated_at:>='{watermark}'")
+    changed_edges = {edge["node"]["id"]: edge for edge in snapshot_product_edges(changed)}
+    previous = {edge["node"]["id"]: edge for edge in previous_edges}
+
+    missing = [pid for pid, _ in product_ids if pid not in changed_edges and pid not in previous]
+    for start in range(0, len(missing), INCREMENTAL_ID_FILTER_CHUNK):
+        chunk = missing[start:start + INCREMENTAL_ID_FILTER_CHUNK]
+        id_filter = " OR ".join(f"id:{pid.rsplit('/', 1)[-1]}" for pid in chunk)
+        backfill = fetch_admin(store_id, token, page_size, search_query=id_filter)
+        changed_edges.update((edge["node"]["id"], edge) for edge in snapshot_product_edges(backfill))
+
+    edges: list[dict] = []
+    seen: set[str] = set()
+    for product_id, cursor in product_ids:
+        edge = changed_edges.get(product_id) or previous.get(product_id)
+        if edge is None:
+            continue
+        edge["cursor"] = cursor
+        edges.append(edge)
+        seen.add(product_id)
+    for product_id, edge in changed_edges.items():
+        if product_id not in seen:
+            edges.append(edge)
+            seen.add(product_id)
+
+    removed = sum(1 for product_id in previous if product_id not in seen)
+    log(
+        f"Incremental update for {store_id} since {watermark}: "
+        f"{len(changed_edges)} changed, {removed} removed, {len(edges)} total"
+    )
+
+    data = changed.get("data") or {}
+    data["products"] = {
+        "edges": edges,
+        "pageInfo": {
+            "hasNextPage": False,
+            "endCursor": last_cursor,
+        },
+    }
+    changed["data"] = data
+    return changed
+
 
+def fetch_shop(store_id: str, token: str) -> dict | None:
+    parsed = execute_query(store_id, token, {}, query=SHOP_QUERY)
+    data = parsed.get("data")
+    if not isinstance(data, dict):
+        raise ShopifyError(f"{store_id}: shop response missing 'data'")
+    shop = data.get("shop")
+    return shop if isinstance(shop, dict) else None
+
+
+def start_bulk_operation(store_id: str, token: str, query: str = BULK_PRODUCTS_QUERY) -> str:
+    parsed = execute_query(store_id, token, {"query": query}, query=BULK_RUN_MUTATION)
+    payload = (parsed.get("data") or {}).get("bulkOperationRunQuery") or {}
+    user_errors = payload.get("userErrors") or []
+    if user_errors:
+        raise ShopifyError(f"{store_id}: bulk operation rejected {user_errors}")
+    operation = payload.get("bulkOperation") or {}
+    operation_id = operation.get("id")
+    if not operation_id:
+        raise ShopifyError(f"{store_id}: bulk operation response missing 'id'")
+    return operation_id
+
+
+def wait_for_bulk_operation(
+    store_id: str,
+    token: str,
+    operation_id: str,
+    poll_interval: float = BULK_POLL_INTERVAL_SECONDS,
+    timeout: float = BULK_TIMEOUT_SECONDS,
+) -> dict:
+    deadline = time.monotonic() + timeout
+    last_status = None
+    while True:
+        parsed = execute_query(store_id, token, {"id": operation_id}, query=BULK_STATUS_QUERY)
+        operation = (parsed.get("data") or {}).get("node")
+        if not isinstance(operation, dict):
+            raise ShopifyError(f"{store_id}: bulk operation {operation_id} not found")
+        status = operation.get("status")
+        if status != last_status:
+            log(f"Bulk operation for {store_id} is {status} ({operation.get('objectCount') or 0} objects)")
+            last_status = status
+        if status == "COMPLETED":
+            return operation
+        if status in {"FAILED", "CANCELED", "CANCELING", "EXPIRED"}:
+            raise ShopifyError(
+                f"{store_id}: bulk operation {status.lower()} (errorCode={operation.get('errorCode')})"
+            )
+        if time.monotonic() >= deadline:
+            raise ShopifyError(f"{store_id}: bulk operation did not finish within {int(timeout)}s")
+        time.sleep(poll_interval)
+
+
+def iter_bulk_results(store_id: str, url: str):
+    """Stream the JSONL result file of a completed bulk operation through the pooled client."""
     try:
-        parsed = json.loads(payload)
-    except json.JSONDecodeError as exc:
-        raise ShopifyError(f"{store_id}: Shopify returned invalid JSON ({exc})") from exc
+        for raw_line in CLIENT.iter_lines(url, label=store_id, operation="bulk:download"):
+            line = raw_line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as exc:
+                raise ShopifyError(f"{store_id}: invalid bulk result line ({exc})") from exc
+    except AdminAPIError as exc:
+        raise ShopifyError(f"{store_id}: bulk result download failed ({exc})") from exc
+
+
+def rebuild_bulk_edges(records) -> list[dict]:
+    """Fold flattened bulk JSONL records back into the paged snapshot's product edges."""
+    edges: list[dict] = []
+    products: dict[str, dict] = {}
+    variants: dict[str, dict] = {}
+
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        parent_id = record.pop("__parentId", None)
+        typename = record.pop("__typename", None)
+
+        if parent_id is None:
+            record["images"] = {"edges": []}
+            record["collections"] = {"edges": []}
+            record["variants"] = {
+                "edges": [],
+                "pageInfo": {"hasNextPage": False, "endCursor": None},
+            }
+            product_id = record.get("id")
+            if product_id:
+                products[product_id] = record
+            edges.append({"cursor": None, "node": record})
+            continue
+
+        if typename == "InventoryLevel":
+            variant = variants.get(parent_id)
+            if variant is None:
+                continue
+            inventory_item = variant.get("inventoryItem")
+            if not isinstance(inventory_item, dict):
+                continue
+            level_edges = inventory_item.setdefault("inventoryLevels", {"edges": []})["edges"]
+            if len(level_edges) < BULK_CONNECTION_LIMITS["inventoryLevels"]:
+                level_edges.append({"node": record})
+            continue
+
+        product = products.get(parent_id)
+        if product is None:
+            continue
+        if typename == "ProductVariant":
+            inventory_item = record.get("inventoryItem")
+            if isinstance(inventory_item, dict):
+                inventory_item["inventoryLevels"] = {"edges": []}
+            variant_id = record.get("id")
+            if variant_id:
+                variants[variant_id] = record
+            product["variants"]["edges"].append({"node": record})
+        elif typename == "Image":
+            image_edges = product["images"]["edges"]
+            if len(image_edges) < BULK_CONNECTION_LIMITS["images"]:
+                image_edges.append({"node": record})
+        elif typename == "Collection":
+            collection_edges = product["collections"]["edges"]
+            if len(collection_edges) < BULK_CONNECTION_LIMITS["collections"]:
+                collection_edges.append({"node": record})
+
+    return edges
+
+
+def fetch_admin_bulk(store_id: str, token: str) -> dict:
+    shop_info = fetch_shop(store_id, token)
+    operation_id = start_bulk_operation(store_id, token)
+    log(f"Started bulk operation {operation_id} for {store_id}")
+    operation = wait_for_bulk_operation(store_id, token, operation_id)
+    url = operation.get("url")
+    edges = rebuild_bulk_edges(iter_bulk_results(store_id, url)) if url else []
+    return {
+        "data": {
+            "shop": shop_info,
+            "products": {
+                "edges": edges,
+                "pageInfo": {
+                    "hasNextPage": False,
+                    "endCursor": None,
+                },
+            },
+        },
+        # Bulk results carry no cursors: edge cursors and every endCursor are null,
+        # so a bulk snapshot cannot seed a cursor-based resume.
+        "extensions": {
+            "bulkOperation": {
+                "id": operation.get("id") or operation_id,
+                "status": operation.get("status"),
+                "objectCount": operation.get("objectCount"),
+                "cursors": False,
+            },
+        },
+    }
+
+
+def fetch_shop_policies(store_id: str, token: str, preferred_domain: str | None = None) -> dict[str, str]:
+    parsed = get_rest(store_id, token, "policies.json")
 
     policies = parsed.get("policies")
     if policies is None:
@@ -487,26 +1611,7 @@ def fetch_shipping_rates(
     token: str,
     fallback_currency: str | None = None,
 ) -> list[str]:
-    url = f"https://{store_id}.myshopify.com/admin/api/{API_VERSION}/shipping_zones.json"
-    request = urllib.request.Request(
-        url=url,
-        headers={"Accept": "application/json", "X-Shopify-Access-Token": token},
-        method="GET",
-    )
-    try:
-        with urllib.request.urlopen(request, timeout=30) as response:
-            payload = response.read().decode("utf-8")
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8", errors="replace")
-        raise ShopifyError(f"{store_id}: HTTP {exc.code} {detail[:200]}") from exc
-    except urllib.error.URLError as exc:
-        reason = exc.reason
-        raise ShopifyError(f"{store_id}: {reason}") from exc
-
-    try:
-        parsed = json.loads(payload)
-    except json.JSONDecodeError as exc:
-        raise ShopifyError(f"{store_id}: Shopify returned invalid JSON ({exc})") from exc
+    parsed = get_rest(store_id, token, "shipping_zones.json")
 
     zones = parsed.get("shipping_zones")
     if zones is None:
@@ -571,21 +1676,106 @@ def fetch_shipping_rates(
     return entries
 
 
-def store_snapshot(base_dir: pathlib.Path, store_id: str, payload: dict, history_retention: int) -> pathlib.Path:
+def store_lock(store_id: str) -> threading.Lock:
+    """Return the lock guarding writes to a store's snapshot directory."""
+    with STORE_LOCKS_GUARD:
+        lock = STORE_LOCKS.get(store_id)
+        if lock is None:
+            lock = STORE_LOCKS[store_id] = threading.Lock()
+        return lock
+
+
+def new_snapshot_writer(store_dir: pathlib.Path, snapshot_format: str) -> SnapshotWriter | FramedSnapshotWriter:
+    if snapshot_format == "json":
+        return SnapshotWriter(store_dir)
+    return FramedSnapshotWriter(store_dir, snapshot_format)
+
+
+def commit_snapshot(
+    writer: SnapshotWriter | FramedSnapshotWriter,
+    base_dir: pathlib.Path,
+    store_id: str,
+    history_retention: int,
+    recorder: HistoryRecorder | None = None,
+    changes: ChangeSetRecorder | None = None,
+    catalog: SnapshotCatalog | None = None,
+    replace: pathlib.Path | None = None,
+) -> pathlib.Path:
+    """Move a finished snapshot into place under the store's timestamped name and prune old ones.
+
+    With a history ``recorder`` only the newest full JSON is kept; older
+    versions live on as manifests in the store's deduplicated history.
+    ``changes`` writes the digest and change log against the previous snapshot,
+    and ``catalog`` stamps the rows it loaded into the store's SQLite catalog.
+    ``replace`` rewrites that existing snapshot in place instead.
+    """
     store_dir = base_dir / store_id
-    store_dir.mkdir(parents=True, exist_ok=True)
-    timestamp = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
-    snapshot_path = store_dir / f"{timestamp}.json"
-    with snapshot_path.open("w", encoding="utf-8") as handle:
-        json.dump(payload, handle, indent=2, sort_keys=True)
-        handle.write("\n")
-    prune_snapshots(store_dir, history_retention)
+    with store_lock(store_id):
+        store_dir.mkdir(parents=True, exist_ok=True)
+        if replace is not None:
+            snapshot_path = replace
+            older = [path for path in snapshot_paths(store_dir) if path.name < replace.name]
+            previous_path = older[-1] if older else None
+        else:
+            previous_path = latest_snapshot_path(store_dir)
+            timestamp = dt.datetime.now(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            stamp = timestamp
+            suffix = 0
+            while any(store_dir.glob(f"{stamp}.*")):
+                # Two writes for the same store within one second; "_N" sorts after the bare stamp.
+                suffix += 1
+                stamp = f"{timestamp}_{suffix}"
+            snapshot_path = store_dir / f"{stamp}{writer.suffix}"
+        writer.commit(snapshot_path)
+        if changes is not None:
+            try:
+                changes.commit(snapshot_path, previous_path)
+            except (OSError, ValueError, RuntimeError) as exc:
+                log(f"Change log unavailable for {store_id}: {exc}")
+        prune_change_logs(store_dir, history_retention)
+        if catalog is not None:
+            catalog.commit(snapshot_path)
+            catalog.prune(history_retention)
+            catalog.close()
+        if recorder is None:
+            prune_snapshots(store_dir, history_retention)
+        else:
+            recorder.commit(snapshot_path)
+            prune_snapshots(store_dir, 1)
+            recorder.history.prune(history_retention)
     return snapshot_path
 
 
+def store_snapshot(
+    base_dir: pathlib.Path,
+    store_id: str,
+    payload: dict,
+    history_retention: int,
+    snapshot_format: str = "json",
+) -> pathlib.Path:
+    data = payload.get("data") or {}
+    products = data.get("products") or {}
+    writer = new_snapshot_writer(base_dir / store_id, snapshot_format)
+    try:
+        writer.write_edges(products.get("edges") or [])
+        writer.finish(data.get("shop"), products.get("pageInfo"), payload.get("extensions"))
+        return commit_snapshot(writer, base_dir, store_id, history_retention)
+    except BaseException:
+        writer.abort()
+        raise
+
+
 def prune_snapshots(store_dir: pathlib.Path, history_retention: int) -> None:
-    snapshots = sorted(p for p in store_dir.glob("*.json") if p.is_file())
-    for old_path in snapshots[:-history_retention]:
+    for old_path in snapshot_paths(store_dir)[:-history_retention]:
+        old_path.unlink(missing_ok=True)
+        index_path(old_path).unlink(missing_ok=True)
+        digest_path(old_path).unlink(missing_ok=True)
+
+
+def prune_change_logs(store_dir: pathlib.Path, history_retention: int) -> None:
+    """Change logs are small, so they follow ``history_retention`` even when snapshots are deduplicated."""
+    change_logs = sorted(p for p in store_dir.glob(f"*{CHANGES_SUFFIX}") if not p.name.startswith("."))
+    for old_path in change_logs[:-history_retention]:
         old_path.unlink(missing_ok=True)
 
 
@@ -594,134 +1784,680 @@ def prune_logs() -> None:
         return
     if not LOG_DIR.exists():
         return
-    log_files = sorted(
-        p for p in LOG_DIR.glob("admin-*.log")
-        if p.is_file() and p.name != LOG_LATEST.name
-    )
-    for old_path in log_files[:-LOG_RETENTION]:
-        old_path.unlink(missing_ok=True)
+    for pattern in ("admin-*.log", "admin-*.metrics.json"):
+        log_files = sorted(
+            p for p in LOG_DIR.glob(pattern)
+            if p.is_file() and p.name != LOG_LATEST.name
+        )
+        for old_path in log_files[:-LOG_RETENTION]:
+            old_path.unlink(missing_ok=True)
+
+
+def primary_domain_parts(shop_info: object) -> tuple[str | None, str | None]:
+    """Return the shop's primary domain as ``(url, host)``, deriving the URL from the host if needed."""
+    if not isinstance(shop_info, dict):
+        return None, None
+    primary_domain = shop_info.get("primaryDomain")
+    if not isinstance(primary_domain, dict):
+        return None, None
+    primary_domain_url = primary_domain.get("url")
+    primary_domain_host = primary_domain.get("host")
+    if not primary_domain_url and primary_domain_host:
+        primary_domain_url = f"https://{primary_domain_host}"
+    return primary_domain_url, primary_domain_host
+
+
+def apply_storefront_urls(
+    edges: list,
+    store_id: str,
+    primary_domain_url: str | None,
+    primary_domain_host: str | None,
+) -> list:
+    """Fill ``productUrl`` and ``variantUrl`` on a page of product edges in place."""
+    for edge in edges:
+        if not isinstance(edge, dict):
+            continue
+        node = edge.get("node")
+        if not isinstance(node, dict):
+            continue
 
+        product_url = node.get("onlineStoreUrl") or node.get("productUrl")
+        handle = node.get("handle")
 
-def run(config_path: pathlib.Path, output_dir: pathlib.Path, page_size: int, history_retention: int) -> None:
-    stores = load_shops(config_path)
-    log(f"Starting Admin API snapshot run for {len(stores)} store(s)")
-    for store in stores:
-        store_id = store["store_id"]
-        token = store["admin_token"]
-        log(f"Fetching Admin API data for {store_id}")
-        try:
-            snapshot = fetch_admin(store_id, token, page_size)
-        except ShopifyError as exc:
-            log(f"Failed {store_id}: {exc}")
-            continue
+        if not product_url:
+            base_url = primary_domain_url
+            if not base_url and primary_domain_host:
+                base_url = f"https://{primary_domain_host}"
+            if not base_url:
+                if store_id.endswith(".myshopify.com"):
+                    base_url = f"https://{store_id}"
+                else:
+                    base_url = f"https://{store_id}.myshopify.com"
+            if not handle:
+                continue
+            product_url = f"{base_url.rstrip('/')}/products/{handle}"
 
-        shop_info = snapshot.get("data", {}).get("shop") if isinstance(snapshot, dict) else None
-        primary_domain_url = None
-        primary_domain_host = None
-        if isinstance(shop_info, dict):
-            primary_domain = shop_info.get("primaryDomain")
-            if isinstance(primary_domain, dict):
-                primary_domain_url = primary_domain.get("url")
-                primary_domain_host = primary_domain.get("host")
-                if not primary_domain_url and primary_domain_host:
-                    primary_domain_url = f"https://{primary_domain_host}"
+        node.setdefault("productUrl", product_url)
 
-        shop_section = snapshot.setdefault("data", {}).setdefault("shop", {})
+        variants_section = node.get("variants")
+        if isinstance(variants_section, dict):
+            variant_edges = variants_section.get("edges") or []
+            if isinstance(variant_edges, list):
+                base_variant_url = product_url.split("?")[0]
+                for variant_edge in variant_edges:
+                    if not isinstance(variant_edge, dict):
+                        continue
+                    variant_node = variant_edge.get("node")
+                    if not isinstance(variant_node, dict):
+                        continue
+                    variant_id = variant_node.get("id")
+                    if not variant_id:
+                        continue
+                    variant_identifier = str(variant_id).split("/")[-1]
+                    variant_node["variantUrl"] = (
+                        f"{base_variant_url}?variant={variant_identifier}"
+                    )
+    return edges
+
+
+def merge_node(base: object, lean: object) -> object:
+    """Overlay a lean-profile value onto the same value from a full snapshot (dicts merge, the rest is replaced)."""
+    if isinstance(base, dict) and isinstance(lean, dict):
+        merged = dict(base)
+        for key, value in lean.items():
+            merged[key] = merge_node(base.get(key), value)
+        return merged
+    return lean
+
+
+def merge_lean_edge(edge: object, base_nodes: dict[str, dict]) -> object:
+    """Fill a lean-profile product edge with the fields its profile skipped, matching variants by ID."""
+    node = edge.get("node") if isinstance(edge, dict) else None
+    if not isinstance(node, dict):
+        return edge
+    base = base_nodes.get(node.get("id"))
+    if base is None:
+        return edge
+    merged = merge_node({k: v for k, v in base.items() if k != "variants"}, {k: v for k, v in node.items() if k != "variants"})
+    variants = node.get("variants")
+    if isinstance(variants, dict):
+        base_variants = {
+            variant_edge["node"].get("id"): variant_edge["node"]
+            for variant_edge in (base.get("variants") or {}).get("edges") or []
+            if isinstance(variant_edge, dict) and isinstance(variant_edge.get("node"), dict)
+        }
+        variant_edges = []
+        for variant_edge in variants.get("edges") or []:
+            variant = variant_edge.get("node") if isinstance(variant_edge, dict) else None
+            if isinstance(variant, dict) and variant.get("id") in base_variants:
+                variant_edge = {**variant_edge, "node": merge_node(base_variants[variant["id"]], variant)}
+            variant_edges.append(variant_edge)
+        merged["variants"] = {**variants, "edges": variant_edges}
+    elif "variants" in base:
+        merged["variants"] = base["variants"]
+    return {**edge, "node": merged}
+
+
+def lean_base_nodes(store_id: str, store_dir: pathlib.Path) -> dict[str, dict] | None:
+    """Product nodes of the newest snapshot keyed by ID, or None when there is none to merge into."""
+    previous_path = latest_snapshot_path(store_dir)
+    if previous_path is None:
+        return None
+    try:
+        edges = snapshot_product_edges(load_snapshot(previous_path))
+    except ShopifyError as exc:
+        log(f"Unable to load {previous_path.name} for {store_id}: {exc}")
+        return None
+    return {edge["node"]["id"]: edge["node"] for edge in edges if isinstance(edge.get("node"), dict) and edge["node"].get("id")}
 
-        try:
-            policies = fetch_shop_policies(store_id, token, primary_domain_url)
-        except ShopifyError as exc:
-            log(f"Policies unavailable for {store_id}: {exc}")
+
+def fetch_shop_extras(store_id: str, token: str, shop_info: dict | None) -> dict:
+    """``policyUrls`` and ``shippingRates`` for the shop section; failures are logged and omitted.
+
+    ``shop_info`` (as returned with the crawl) supplies the primary domain and
+    currency the two requests need.
+    """
+    extras: dict = {}
+    primary_domain_url, _ = primary_domain_parts(shop_info)
+
+    try:
+        policies = fetch_shop_policies(store_id, token, primary_domain_url)
+    except ShopifyError as exc:
+        log(f"Policies unavailable for {store_id}: {exc}")
+    else:
+        extras["policyUrls"] = policies
+
+    currency_code = None
+    if isinstance(shop_info, dict):
+        currency_code = shop_info.get("currencyCode")
+
+    try:
+        shipping_rates = fetch_shipping_rates(store_id, token, currency_code)
+    except ShopifyError as exc:
+        log(f"Shipping rates unavailable for {store_id}: {exc}")
+    else:
+        if shipping_rates:
+            extras["shippingRates"] = shipping_rates
+    return extras
+
+
+def open_sinks(
+    store_dir: pathlib.Path,
+    snapshot_format: str = "json",
+    dedup_history: bool = False,
+    change_log: bool = True,
+    sqlite_catalog: bool = False,
+) -> tuple[SnapshotWriter | FramedSnapshotWriter, HistoryRecorder | None, ChangeSetRecorder | None, SnapshotCatalog | None]:
+    """Snapshot writer plus the optional history, change log and catalog sinks for one store."""
+    writer = new_snapshot_writer(store_dir, snapshot_format)
+    recorder = SnapshotHistory(store_dir / HISTORY_DIR_NAME).recorder() if dedup_history else None
+    changes = ChangeSetRecorder(store_dir) if change_log else None
+    catalog = SnapshotCatalog(store_dir / CATALOG_FILENAME) if sqlite_catalog else None
+    return writer, recorder, changes, catalog
+
+
+def log_changes(store_id: str, changes: ChangeSetRecorder | None) -> None:
+    if changes is not None and changes.counts:
+        summary = ", ".join(f"{count} {kind.replace('_', ' ')}" for kind, count in sorted(changes.counts.items()))
+        log(f"Changes for {store_id}: {summary}")
+
+
+def write_snapshot(
+    store_id: str,
+    snapshot: dict,
+    output_dir: pathlib.Path,
+    history_retention: int,
+    dedup_history: bool = False,
+    snapshot_format: str = "json",
+    change_log: bool = True,
+    sqlite_catalog: bool = False,
+) -> pathlib.Path:
+    """Persist an assembled snapshot through the same sinks (history, change log, catalog) as a crawl."""
+    data = snapshot.get("data") or {}
+    products = data.get("products") or {}
+    writer, recorder, changes, catalog = open_sinks(output_dir / store_id, snapshot_format, dedup_history, change_log, sqlite_catalog)
+    sinks = [sink for sink in (writer, recorder, changes, catalog) if sink is not None]
+    try:
+        for sink in sinks:
+            sink.write_edges(products.get("edges") or [])
+            sink.finish(data.get("shop"), products.get("pageInfo"), snapshot.get("extensions"))
+        path = commit_snapshot(writer, output_dir, store_id, history_retention, recorder, changes, catalog)
+    except BaseException:
+        for sink in sinks:
+            sink.abort()
+        raise
+    log(f"Saved {path} ({writer.edge_count} products)")
+    log_changes(store_id, changes)
+    return path
+
+
+def refresh_shop_snapshot(store_id: str, token: str, store_dir: pathlib.Path, shop_info: dict | None = None) -> dict:
+    """The newest snapshot with a new shop section (extras are added by the caller).
+
+    ``shop_info`` is used when given; otherwise the shop is fetched.
+    """
+    previous_path = latest_snapshot_path(store_dir)
+    if previous_path is None:
+        raise ShopifyError(f"{store_id}: no snapshot to refresh the shop section of")
+    snapshot = load_snapshot(previous_path)
+    data = snapshot.setdefault("data", {})
+    data["shop"] = dict(shop_info) if shop_info is not None else fetch_shop(store_id, token) or {}
+    snapshot.pop("extensions", None)
+    return snapshot
+
+
+def latest_shop_section(store_dir: pathlib.Path) -> dict | None:
+    path = latest_snapshot_path(store_dir)
+    if path is None:
+        return None
+    try:
+        return SnapshotReader(path).shop()
+    except (OSError, ValueError, RuntimeError) as exc:
+        raise ShopifyError(f"Unable to read snapshot {path}: {exc}") from exc
+
+
+def snapshot_extensions(path: pathlib.Path) -> dict:
+    try:
+        return SnapshotReader(path).extensions() or {}
+    except (OSError, ValueError, RuntimeError) as exc:
+        raise ShopifyError(f"Unable to read snapshot {path}: {exc}") from exc
+
+
+def shop_section_changed(store: dict, output_dir: pathlib.Path, task: str) -> tuple[bool | None, dict | None, dict | None]:
+    """Probe shop metadata (``shop``) or policies/shipping (``policies``) against the newest snapshot.
+
+    Returns whether it changed (``None`` when nothing could be fetched to
+    compare) with the shop info and the extras to write if so, so the refresh
+    does not fetch them again.
+    """
+    store_id = store["store_id"]
+    token = store["admin_token"]
+    previous = latest_shop_section(output_dir / store_id)
+    if task == "shop":
+        shop_info = current = fetch_shop(store_id, token) or {}
+        extras = None
+    else:
+        # The newest snapshot's shop section has the domain and currency policies and shipping need.
+        shop_info = previous
+        extras = current = {key: value for key, value in fetch_shop_extras(store_id, token, previous).items() if key in SHOP_EXTRA_FIELDS}
+    if not current:
+        return None, shop_info, extras
+    if previous is None:
+        return True, shop_info, extras
+    return any(previous.get(key) != value for key, value in current.items()), shop_info, extras
+
+
+def refresh_store(
+    store: dict,
+    task: str,
+    output_dir: pathlib.Path,
+    page_size: int,
+    history_retention: int,
+    mode: str = "paged",
+    dedup_history: bool = False,
+    snapshot_format: str = "json",
+    change_log: bool = True,
+    sqlite_catalog: bool = False,
+    resume_window: int = DEFAULT_RESUME_WINDOW_MINUTES,
+    profile: str = "full",
+    partitions: int = DEFAULT_PARTITIONS,
+    partition_key: str = "id",
+) -> bool | None:
+    """Run one scheduled daemon task; True when it found changes, None when it failed or cannot tell.
+
+    ``catalog`` is a regular crawl in the run's mode, ``inventory`` patches
+    current stock into the newest snapshot; ``shop`` and ``policies`` probe the
+    shop-level data and only write a snapshot (``shop`` mode) when it moved.
+    """
+    options = {
+        "dedup_history": dedup_history,
+        "snapshot_format": snapshot_format,
+        "change_log": change_log,
+        "sqlite_catalog": sqlite_catalog,
+        "resume_window": resume_window,
+        "profile": profile,
+        "partitions": partitions,
+        "partition_key": partition_key,
+    }
+    if task == "catalog":
+        path = process_store(store, output_dir, page_size, history_retention, mode, **options)
+    elif task == "inventory":
+        path = refresh_inventory(store, output_dir, page_size, history_retention, dedup_history, change_log, sqlite_catalog)
+        if path is None:
+            return None
+        refresh = snapshot_extensions(path).get("inventoryRefresh") or {}
+        return bool(refresh.get("changed"))
+    else:
+        changed, shop_info, extras = shop_section_changed(store, output_dir, task)
+        if not changed:
+            return changed
+        log(f"Shop-level data changed for {store['store_id']} ({task})")
+        path = process_store(store, output_dir, page_size, history_retention, "shop", shop_info=shop_info, shop_extras=extras, **options)
+        return None if path is None else True
+    if path is None:
+        return None
+    counts = read_change_counts(path)
+    return None if counts is None else bool(counts)
+
+
+def process_store(
+    store: dict,
+    output_dir: pathlib.Path,
+    page_size: int,
+    history_retention: int,
+    mode: str = "paged",
+    dedup_history: bool = False,
+    snapshot_format: str = "json",
+    change_log: bool = True,
+    sqlite_catalog: bool = False,
+    resume_window: int = DEFAULT_RESUME_WINDOW_MINUTES,
+    profile: str = "full",
+    partitions: int = DEFAULT_PARTITIONS,
+    partition_key: str = "id",
+    shop_info: dict | None = None,
+    shop_extras: dict | None = None,
+) -> pathlib.Path | None:
+    """Fetch, enrich and persist one store; failures are logged, not raised.
+
+    A lean field ``profile`` (the store's ``profile`` in shops.json wins over
+    the run's) only refreshes its fields; every node is merged into the newest
+    snapshot so the output keeps the full shape.
+
+    Paged crawls stream each page to the snapshot file as it arrives and, when
+    ``resume_window`` (minutes) is positive, checkpoint each page so a failed
+    crawl resumes from its last cursor on the next attempt. With
+    ``partitions`` above one (the store's ``partitions`` wins), a paged crawl
+    splits the catalog into ``partition_key`` ranges crawled concurrently and
+    does not checkpoint. Bulk and
+    incremental results are written in one pass once assembled; ``shop`` mode
+    re-fetches only the shop section and rewrites the newest snapshot's products;
+    ``inventory`` mode patches current stock into the newest snapshot in place.
+
+    ``shop_info`` and ``shop_extras`` (policy URLs and shipping rates) are
+    shop-level data a probe already fetched; ``shop`` mode uses them instead of
+    fetching them again.
+    """
+    if mode == "inventory":
+        return refresh_inventory(store, output_dir, page_size, history_retention, dedup_history, change_log, sqlite_catalog)
+    store_id = store["store_id"]
+    token = store["admin_token"]
+    profile = store.get("profile") or profile
+    partitions = store.get("partitions") or partitions
+    partition_key = store.get("partition_key") or partition_key
+    partitioned = mode == "paged" and partitions > 1
+    base_nodes = None
+    if profile != "full":
+        if mode != "paged":
+            log(f"Field profile {profile} only applies to paged crawls; fetching {store_id} in full")
+            profile = "full"
         else:
-            shop_section["policyUrls"] = policies
+            base_nodes = lean_base_nodes(store_id, output_dir / store_id)
+            if base_nodes is None:
+                log(f"No previous snapshot for {store_id} to merge a {profile} crawl into; fetching in full")
+                profile = "full"
+    log(f"Fetching Admin API data for {store_id} ({mode}, {profile} profile)")
+    writer, recorder, changes, catalog = open_sinks(output_dir / store_id, snapshot_format, dedup_history, change_log, sqlite_catalog)
+    sinks = [sink for sink in (writer, recorder, changes, catalog) if sink is not None]
+    checkpoint = None
+    if mode == "paged" and not partitioned and resume_window > 0:
+        checkpoint = PaginationCheckpoint(
+            output_dir / store_id / CHECKPOINT_DIR_NAME,
+            dt.timedelta(minutes=resume_window),
+            {"api_version": API_VERSION, "query": hashlib.sha256(products_query(profile).encode("utf-8")).hexdigest()},
+        )
+    # Policies and shipping rates need the shop's domain and currency, which come
+    # with the first page, so they run alongside the rest of the crawl.
+    shop_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"shop-{store_id}")
+    extras_futures: list[Future] = []
+
+    def start_shop_extras(page_shop: dict | None) -> None:
+        if shop_extras is None and not extras_futures:
+            extras_futures.append(shop_executor.submit(fetch_shop_extras, store_id, token, page_shop))
 
-        currency_code = None
-        if isinstance(shop_info, dict):
-            currency_code = shop_info.get("currencyCode")
+    try:
+        def write_page(page_shop: dict | None, edges: list, page_info: dict | None = None) -> None:
+            start_shop_extras(page_shop)
+            if base_nodes is not None:
+                edges = [merge_lean_edge(edge, base_nodes) for edge in edges]
+            apply_storefront_urls(edges, store_id, *primary_domain_parts(page_shop))
+            for sink in sinks:
+                sink.write_edges(edges)
+            if checkpoint is not None and page_info is not None:
+                checkpoint.record(
+                    edges,
+                    page_info.get("endCursor"),
+                    bool(page_info.get("hasNextPage")),
+                    shop=page_shop,
+                )
 
         try:
-            shipping_rates = fetch_shipping_rates(store_id, token, currency_code)
+            if mode == "bulk":
+                snapshot = fetch_admin_bulk(store_id, token)
+            elif mode == "incremental":
+                snapshot = fetch_admin_incremental(store_id, token, page_size, output_dir / store_id)
+            elif mode == "shop":
+                snapshot = refresh_shop_snapshot(store_id, token, output_dir / store_id, shop_info)
+            elif partitioned:
+                snapshot = fetch_admin_partitioned(store_id, token, page_size, partitions, write_page, profile, partition_key)
+            else:
+                resumed = checkpoint.load() if checkpoint is not None else None
+                if resumed is None:
+                    snapshot = fetch_admin(store_id, token, page_size, on_page=write_page, profile=profile)
+                else:
+                    for batch in checkpoint.iter_batches():
+                        for sink in sinks:
+                            sink.write_edges(batch)
+                    log(f"Resuming {store_id} from checkpoint {resumed['updated_at']} after {writer.edge_count} products")
+                    snapshot = fetch_admin(store_id, token, page_size, on_page=write_page, after=resumed.get("cursor"), profile=profile)
         except ShopifyError as exc:
-            log(f"Shipping rates unavailable for {store_id}: {exc}")
-        else:
-            if shipping_rates:
-                shop_section["shippingRates"] = shipping_rates
+            log(f"Failed {store_id}: {exc}")
+            for sink in sinks:
+                sink.abort()
+            if checkpoint is not None:
+                # Resume from the last page written, not the last periodic commit.
+                checkpoint.commit()
+            return None
+
+        shop_info = snapshot.get("data", {}).get("shop") if isinstance(snapshot, dict) else None
+        products_section = snapshot.get("data", {}).get("products") or {}
+        if mode != "paged":
+            write_page(shop_info, products_section.get("edges") or [])
+
+        shop_section = snapshot.setdefault("data", {}).setdefault("shop", {})
+        start_shop_extras(shop_info)
+        shop_section.update(shop_extras if shop_extras is not None else extras_futures[0].result())
 
         return_window = store["return_window_days"]
         shop_section["returnWindowDays"] = return_window
 
-        products_section = snapshot.get("data", {}).get("products")
-        if isinstance(products_section, dict):
-            edges = products_section.get("edges") or []
-            for edge in edges:
-                if not isinstance(edge, dict):
-                    continue
-                node = edge.get("node")
-                if not isinstance(node, dict):
-                    continue
-
-                product_url = node.get("onlineStoreUrl") or node.get("productUrl")
-                handle = node.get("handle")
-
-                if not product_url:
-                    base_url = primary_domain_url
-                    if not base_url and primary_domain_host:
-                        base_url = f"https://{primary_domain_host}"
-                    if not base_url:
-                        if store_id.endswith(".myshopify.com"):
-                            base_url = f"https://{store_id}"
-                        else:
-                            base_url = f"https://{store_id}.myshopify.com"
-                    if not handle:
-                        continue
-                    product_url = f"{base_url.rstrip('/')}/products/{handle}"
-
-                node.setdefault("productUrl", product_url)
-
-                variants_section = node.get("variants")
-                if isinstance(variants_section, dict):
-                    variant_edges = variants_section.get("edges") or []
-                    if isinstance(variant_edges, list):
-                        base_variant_url = product_url.split("?")[0]
-                        for variant_edge in variant_edges:
-                            if not isinstance(variant_edge, dict):
-                                continue
-                            variant_node = variant_edge.get("node")
-                            if not isinstance(variant_node, dict):
-                                continue
-                            variant_id = variant_node.get("id")
-                            if not variant_id:
-                                continue
-                            variant_identifier = str(variant_id).split("/")[-1]
-                            variant_node["variantUrl"] = (
-                                f"{base_variant_url}?variant={variant_identifier}"
-                            )
-        path = store_snapshot(output_dir, store_id, snapshot, history_retention)
-        log(f"Saved {path}")
+        for sink in sinks:
+            sink.finish(shop_section, products_section.get("pageInfo"), snapshot.get("extensions"))
+        path = commit_snapshot(writer, output_dir, store_id, history_retention, recorder, changes, catalog)
+        if checkpoint is not None:
+            checkpoint.clear()
+    except BaseException:
+        for sink in sinks:
+            sink.abort()
+        raise
+    finally:
+        shop_executor.shutdown(wait=False)
+    log(f"Saved {path} ({writer.edge_count} products)")
+    log_changes(store_id, changes)
+    return path
+
+
+def run(
+    config_path: pathlib.Path,
+    output_dir: pathlib.Path,
+    page_size: int,
+    history_retention: int,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    mode: str = "paged",
+    dedup_history: bool = False,
+    snapshot_format: str = "json",
+    change_log: bool = True,
+    sqlite_catalog: bool = False,
+    resume_window: int = DEFAULT_RESUME_WINDOW_MINUTES,
+    profile: str = "full",
+    partitions: int = DEFAULT_PARTITIONS,
+    partition_key: str = "id",
+) -> None:
+    stores = load_shops(config_path)
+    workers = max(1, min(max_workers, len(stores)))
+    log(f"Starting Admin API snapshot run for {len(stores)} store(s) with {workers} worker(s)")
+    store_args = (
+        output_dir, page_size, history_retention, mode, dedup_history,
+        snapshot_format, change_log, sqlite_catalog, resume_window, profile,
+        partitions, partition_key,
+    )
+    if workers == 1:
+        for store in stores:
+            try:
+                process_store(store, *store_args)
+            except Exception as exc:  # noqa: BLE001
+                log(f"Failed {store['store_id']}: unexpected {type(exc).__name__}: {exc}")
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="store") as executor:
+            futures = {
+                executor.submit(process_store, store, *store_args): store["store_id"]
+                for store in stores
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as exc:  # noqa: BLE001
+                    log(f"Failed {futures[future]}: unexpected {type(exc).__name__}: {exc}")
+    write_run_metrics(RUN_STAMP, mode)
+    CLIENT.close()
     log("Admin API snapshot run complete")
 
 
+def write_run_metrics(stamp: str | None, mode: str) -> None:
+    """Log the telemetry table and write it to ``admin-<stamp>.metrics.json``."""
+    for row in METRICS.table():
+        log(row)
+    stamp = stamp or dt.datetime.now(dt.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    try:
+        metrics_path = METRICS.write_json(LOG_DIR / f"admin-{stamp}.metrics.json", run=stamp, mode=mode)
+    except OSError as exc:
+        log(f"Unable to write run metrics: {exc}")
+    else:
+        log(f"Run metrics written to {metrics_path}")
+
+
+def run_daemon(
+    config_path: pathlib.Path,
+    output_dir: pathlib.Path,
+    page_size: int,
+    history_retention: int,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    mode: str = "paged",
+    dedup_history: bool = False,
+    snapshot_format: str = "json",
+    change_log: bool = True,
+    sqlite_catalog: bool = False,
+    resume_window: int = DEFAULT_RESUME_WINDOW_MINUTES,
+    profile: str = "full",
+    partitions: int = DEFAULT_PARTITIONS,
+    partition_key: str = "id",
+) -> None:
+    """Refresh stores on adaptive per-task cadences until SIGTERM or Ctrl-C.
+
+    ``shops.json`` is reloaded whenever it changes (new stores are due at
+    once, removed ones are dropped). At most ``max_workers`` tasks run at a
+    time and at most one per store; the most overdue task (relative to its
+    interval) goes first. Schedules persist in ``<output>/.schedule.json``.
+    """
+    store_args = (
+        output_dir, page_size, history_retention, mode, dedup_history,
+        snapshot_format, change_log, sqlite_catalog, resume_window, profile,
+        partitions, partition_key,
+    )
+    workers = max(1, max_workers)
+    scheduler = RefreshScheduler(REFRESH_CADENCES, output_dir / SCHEDULE_FILENAME)
+    stores: dict[str, dict] = {}
+    config_mtime = None
+    running: dict[Future, tuple[str, str]] = {}
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    metrics_due = time.monotonic() + DAEMON_METRICS_SECONDS
+    log(f"Starting Admin API refresh daemon with {workers} worker(s)")
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refresh")
+    try:
+        while not stop.is_set():
+            try:
+                mtime = config_path.stat().st_mtime_ns
+            except OSError:
+                if config_mtime is None:
+                    raise
+                mtime = config_mtime
+            if mtime != config_mtime:
+                try:
+                    loaded = load_shops(config_path)
+                except (OSError, ValueError, ShopifyError) as exc:
+                    if config_mtime is None:
+                        raise
+                    log(f"Keeping the previous store list; unable to reload {config_path}: {exc}")
+                else:
+                    stores = {store["store_id"]: store for store in loaded}
+                    scheduler.sync(stores)
+                    scheduler.save()
+                    log(f"Loaded {len(stores)} store(s) from {config_path}")
+                config_mtime = mtime
+
+            for future in [future for future in running if future.done()]:
+                store_id, task = running.pop(future)
+                try:
+                    changed = future.result()
+                except ShopifyError as exc:
+                    log(f"Failed {task} refresh for {store_id}: {exc}")
+                    changed = None
+                except Exception as exc:  # noqa: BLE001
+                    log(f"Failed {task} refresh for {store_id}: unexpected {type(exc).__name__}: {exc}")
+                    changed = None
+                interval = scheduler.complete(store_id, task, changed)
+                if task == "catalog" and changed is not None:
+                    # A full crawl also refreshed stock and the shop section.
+                    for covered in ("inventory", "shop", "policies"):
+                        scheduler.defer(store_id, covered)
+                scheduler.save()
+                outcome = "failed" if changed is None else ("changed" if changed else "unchanged")
+                log(f"{task.capitalize()} refresh for {store_id} {outcome}; next in {interval / 60:.0f} min")
+
+            busy = {store_id for store_id, _ in running.values()}
+            while len(running) < workers:
+                job = scheduler.next_due(busy)
+                if job is None:
+                    break
+                store_id, task = job
+                running[executor.submit(refresh_store, stores[store_id], task, *store_args)] = job
+                busy.add(store_id)
+
+            if time.monotonic() >= metrics_due:
+                write_run_metrics(None, "daemon")
+                METRICS.reset()
+                metrics_due = time.monotonic() + DAEMON_METRICS_SECONDS
+            if running:
+                wait(list(running), timeout=DAEMON_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            else:
+                stop.wait(DAEMON_POLL_SECONDS)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if running:
+            log(f"Stopping; waiting for {len(running)} running refresh(es)")
+        executor.shutdown(wait=True, cancel_futures=True)
+        scheduler.save()
+        write_run_metrics(None, "daemon")
+        CLIENT.close()
+        log("Admin API refresh daemon stopped")
+
+
 def parse_args(argv: list[str]) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Fetch Shopify Admin JSON snapshots")
     parser.add_argument("--config", default=DEFAULT_CONFIG_PATH, type=pathlib.Path, help="Path to shops.json secrets file")
     parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, type=pathlib.Path, help="Directory to store Shopify Admin API snapshots")
     parser.add_argument("--page-size", default=DEFAULT_PAGE_SIZE, type=int, help="Products per request page")
+    parser.add_argument("--profile", choices=FIELD_PROFILES, default="full", help="GraphQL field profile for paged crawls; lean profiles are merged into the newest snapshot (a store's 'profile' in shops.json overrides this)")
     parser.add_argument("--history-retention", default=HISTORY_VERSION_RETENTION, type=int, help="Snapshots to retain per store")
+    parser.add_argument("--dedup-history", action="store_true", help="Keep history as deduplicated manifests under <store>/history and only the newest full JSON snapshot")
+    parser.add_argument("--format", dest="snapshot_format", choices=SNAPSHOT_FORMATS, default="json", help="Snapshot file format: indented JSON, or gzip/zstd-framed JSONL with a product/handle/SKU index")
+    parser.add_argument("--no-change-log", dest="change_log", action="store_false", help="Skip the per-snapshot digest and change log against the previous snapshot")
+    parser.add_argument("--sqlite", dest="sqlite_catalog", action="store_true", help="Also load each snapshot into <store>/catalog.sqlite3 (WAL mode, indexed by SKU, barcode, handle and updatedAt)")
+    parser.add_argument("--resume-window", default=DEFAULT_RESUME_WINDOW_MINUTES, type=int, help="Minutes a paged crawl checkpoint stays resumable after a failure (0 disables checkpoints)")
+    parser.add_argument("--partitions", default=DEFAULT_PARTITIONS, type=int, help=f"Split each paged crawl into up to this many id/created_at ranges fetched concurrently (at most {MAX_PARTITIONS}; a store's 'partitions' in shops.json overrides this)")
+    parser.add_argument("--partition-key", choices=PARTITION_KEYS, default="id", help="Product field the --partitions ranges are split on (a store's 'partition_key' overrides this)")
+    parser.add_argument("--max-workers", default=DEFAULT_MAX_WORKERS, type=int, help="Stores to fetch concurrently (Shopify rate limits are per store)")
+    parser.add_argument("--daemon", action="store_true", help="Keep running: reload the config when it changes and refresh each store's catalog, inventory, shop metadata and policies/shipping on adaptive cadences (--max-workers caps concurrent refreshes)")
+    mode_group = parser.add_mutually_exclusive_group()
+    mode_group.add_argument("--bulk", dest="mode", action="store_const", const="bulk", help="Snapshot the catalog with a Bulk Operations query instead of cursor pagination")
+    mode_group.add_argument("--incremental", dest="mode", action="store_const", const="incremental", help="Only re-fetch products updated since the newest snapshot and merge them into it")
+    mode_group.add_argument("--inventory", dest="mode", action="store_const", const="inventory", help="Only fetch inventory items (variant quantities and per-location on_hand) and patch them into the newest snapshot in place")
+    parser.set_defaults(mode="paged")
     parser.add_argument("--log-to-stdout", action="store_true", help="Print log lines instead of writing to /tmp/integrations/product-feed/shopify/log")
     return parser.parse_args(argv)
 
 
 def main(argv: list[str]) -> int:
     args = parse_args(argv)
+    if args.snapshot_format != "json":
+        try:
+            require_compression(args.snapshot_format)
+        except RuntimeError as exc:
+            print(exc, file=sys.stderr)
+            return 2
     prepare_logging(args.log_to_stdout)
     try:
-        run(args.config, args.output, args.page_size, args.history_retention)
+        target = run_daemon if args.daemon else run
+        target(args.config, args.output, args.page_size, args.history_retention, args.max_workers, args.mode, args.dedup_history, args.snapshot_format, args.change_log, args.sqlite_catalog, args.resume_window, args.profile, args.partitions, args.partition_key)
     except ShopifyError as exc:
         log(f"Run failed: {exc}")
         print(exc, file=sys.stderr)
         prune_logs()
+        close_logging()
         return 1
     prune_logs()
+    close_logging()
     return 0
 
 
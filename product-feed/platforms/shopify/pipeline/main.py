@@ -3,20 +3,58 @@
 from __future__ import annotations
 
 import argparse
-import json
+import hashlib
+import itertools
+import pathlib
+import threading
+import time
 import uuid
 import os
 import sys
-from typing import Any
-from urllib import error, request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator
 
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 from dotenv import load_dotenv
 from supabase import Client, create_client
 
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[3]))
+from common.catalog_model import Product  # noqa: E402
+from common.checkpoint import PaginationCheckpoint  # noqa: E402
+from common.snapshot_history import content_hash  # noqa: E402
+from common.shopify_client import ShopifyAdminClient, admin_api_url  # noqa: E402
+from common.store_leases import (  # noqa: E402
+    DEFAULT_FAILURE_BACKOFF_SECONDS,
+    DEFAULT_LEASE_TTL_SECONDS,
+    DEFAULT_REFRESH_INTERVAL_SECONDS,
+    SQLiteStoreLeases,
+    StoreLeases,
+    SupabaseStoreLeases,
+)
+from common.throttle import ThrottleController, error_codes  # noqa: E402
+
 API_VERSION = "2025-07"
 DEFAULT_SUCCESS_VERSION_RETENTION = 10
+DEFAULT_CHECKPOINT_DIR = "/tmp/integrations/product-feed/shopify/checkpoints/pipeline"
+DEFAULT_CHECKPOINT_MAX_AGE_MINUTES = 6 * 60
+STORE_PAGE_SIZE = 500
+# Starting sizes only: each later query is scaled from the requestedQueryCost
+# Shopify reports for the previous one, to fill the 1000-point single-query
+# limit. Inline variants leave out the inventory item (about 2 points each);
+# items and their levels are read per page of variants by FetchInventoryBatch.
+PRODUCT_PAGE_SIZE = 10
+INLINE_VARIANT_PAGE_SIZE = 10
+VARIANT_PAGE_SIZE = 50
+VARIANT_BATCH_SIZE = 5  # products per aliased variant-overflow query
+INVENTORY_LEVEL_PAGE_SIZE = 20  # most levels per item and query, as in the old per-product query
+INVENTORY_BATCH_SIZE = 10  # variants per aliased inventory query
+THROTTLE_MAX_RETRIES = 5
+ADMIN_CLIENT = ShopifyAdminClient()
+THROTTLES: dict[str, ThrottleController] = {}
+THROTTLES_GUARD = threading.Lock()
 
 SHOP_INFO_QUERY = """
 query FetchShopInfo {
@@ -114,8 +152,39 @@ query DeliveryZoneList {
 }
 """
 
-PRODUCTS_QUERY = """
-query FetchProducts($first: Int!, $after: String) {
+VARIANT_FIELDS = """
+fragment VariantFields on ProductVariant {
+  id
+  title
+  sku
+  barcode
+  price
+  inventoryQuantity
+  selectedOptions {
+    name
+    value
+  }
+}
+"""
+
+INVENTORY_ITEM_FIELDS = """
+fragment InventoryItemFields on InventoryItem {
+  id
+  tracked
+  measurement {
+    weight {
+      value
+      unit
+    }
+  }
+}
+"""
+
+# The first page of variants comes inline with each product; only products
+# with more variants than that need the batched overflow query below. Their
+# inventory items come from inventory_batch_query once the page is complete.
+PRODUCTS_QUERY = VARIANT_FIELDS + """
+query FetchProducts($first: Int!, $after: String, $variantsFirst: Int!) {
   products(first: $first, after: $after) {
     pageInfo {
       hasNextPage
@@ -147,56 +216,14 @@ query FetchProducts($first: Int!, $after: String) {
             }
           }
         }
-      }
-    }
-  }
-}
-"""
-
-PRODUCT_VARIANTS_QUERY = """
-query FetchProductVariants($id: ID!, $first: Int!, $after: String) {
-  product(id: $id) {
-    variants(first: $first, after: $after) {
-      pageInfo {
-        hasNextPage
-        endCursor
-      }
-      edges {
-        node {
-          id
-          title
-          sku
-          barcode
-          price
-          inventoryQuantity
-          selectedOptions {
-            name
-            value
+        variants(first: $variantsFirst) {
+          pageInfo {
+            hasNextPage
+            endCursor
           }
-          inventoryItem {
-            id
-            tracked
-            measurement {
-              weight {
-                value
-                unit
-              }
-            }
-            inventoryLevels(first: 20) {
-              edges {
-                node {
-                  location {
-                    name
-                    address {
-                      zip
-                    }
-                  }
-                  quantities(names: "on_hand") {
-                    name
-                    quantity
-                  }
-                }
-              }
+          edges {
+            node {
+              ...VariantFields
             }
           }
         }
@@ -207,63 +234,156 @@ query FetchProductVariants($id: ID!, $first: Int!, $after: String) {
 """
 
 
+@lru_cache(maxsize=None)
+def variant_batch_query(count: int) -> str:
+    """Aliased query fetching the next variant page for ``count`` products at once."""
+    params = ", ".join(f"$id{i}: ID!, $after{i}: String" for i in range(count))
+    selections = "\n".join(
+        f"""  p{i}: product(id: $id{i}) {{
+    variants(first: $first, after: $after{i}) {{
+      pageInfo {{
+        hasNextPage
+        endCursor
+      }}
+      edges {{
+        node {{
+          ...VariantFields
+        }}
+      }}
+    }}
+  }}"""
+        for i in range(count)
+    )
+    return VARIANT_FIELDS + f"query FetchVariantBatch($first: Int!, {params}) {{\n{selections}\n}}\n"
+
+
+@lru_cache(maxsize=None)
+def inventory_batch_query(count: int) -> str:
+    """Aliased query fetching the inventory item and next page of levels for ``count`` variants."""
+    params = ", ".join(f"$id{i}: ID!, $after{i}: String" for i in range(count))
+    selections = "\n".join(
+        f"""  v{i}: node(id: $id{i}) {{
+    ... on ProductVariant {{
+      inventoryItem {{
+        ...InventoryItemFields
+        inventoryLevels(first: $first, after: $after{i}) {{
+          pageInfo {{
+            hasNextPage
+            endCursor
+          }}
+          edges {{
+            node {{
+              location {{
+                name
+                address {{
+                  zip
+                }}
+              }}
+              quantities(names: "on_hand") {{
+                name
+                quantity
+              }}
+            }}
+          }}
+        }}
+      }}
+    }}
+  }}"""
+        for i in range(count)
+    )
+    return INVENTORY_ITEM_FIELDS + f"query FetchInventoryBatch($first: Int!, {params}) {{\n{selections}\n}}\n"
+
+
 def fetch_shopify_stores(
     base_url: str,
     api_key: str,
     table: str,
-) -> list[tuple[str, str, str]]:
+    page_size: int = STORE_PAGE_SIZE,
+) -> Iterator[list[tuple[str, str, str]]]:
+    """Shopify stores from the claim-state table, yielded a page of ``page_size`` rows at a time."""
     client: Client = create_client(base_url, api_key)
-    response = (
-        client.table(table)
-        .select(
-            "store_id, domain:store_info->>myshopifyDomain, access_token:store_info->>accessToken"
+    start = 0
+    while True:
+        response = (
+            client.table(table)
+            .select(
+                "store_id, domain:store_info->>myshopifyDomain, access_token:store_info->>accessToken"
+            )
+            .neq("store_info->>myshopifyDomain", "")
+            .eq("platform_id", "shopify")
+            .is_("deletion_requested_at", None)
+            .order("store_id")
+            .range(start, start + page_size - 1)
+            .execute()
         )
-        .neq("store_info->>myshopifyDomain", "")
-        .eq("platform_id", "shopify")
-        .is_("deletion_requested_at", None)
-        .execute()
-    )
 
-    records = response.data or []
-    mapping: list[tuple[str, str, str]] = []
-    for record in records:
-        if not isinstance(record, dict):
-            continue
-        store_id = record.get("store_id")
-        domain = record.get("domain")
-        access_token = record.get("access_token")
-        if isinstance(store_id, str) and isinstance(domain, str) and domain.strip():
-            token_value = access_token.strip() if isinstance(access_token, str) else ""
-            mapping.append((store_id, domain.strip(), token_value))
-    return mapping
+        records = response.data or []
+        mapping: list[tuple[str, str, str]] = []
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            store_id = record.get("store_id")
+            domain = record.get("domain")
+            access_token = record.get("access_token")
+            if isinstance(store_id, str) and isinstance(domain, str) and domain.strip():
+                token_value = access_token.strip() if isinstance(access_token, str) else ""
+                mapping.append((store_id, domain.strip(), token_value))
+        if mapping:
+            yield mapping
+        if len(records) < page_size:
+            return
+        start += page_size
 
-def _shop_admin_graphql_url(domain: str) -> str:
-    host = domain.strip()
-    return f"https://{host}/admin/api/{API_VERSION}/graphql.json"
 
+def throttle_for(domain: str) -> ThrottleController:
+    with THROTTLES_GUARD:
+        throttle = THROTTLES.get(domain)
+        if throttle is None:
+            throttle = THROTTLES[domain] = ThrottleController()
+        return throttle
 
-def fetch_shop_info(domain: str, token: str) -> dict[str, Any]:
-    url = _shop_admin_graphql_url(domain)
-    payload = json.dumps({'query': SHOP_INFO_QUERY, 'variables': {}}).encode('utf-8')
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-        'X-Shopify-Access-Token': token,
-    }
-    request_obj = request.Request(url=url, data=payload, headers=headers, method='POST')
-    try:
-        with request.urlopen(request_obj, timeout=30) as response:
-            body = response.read().decode('utf-8')
-    except error.HTTPError as exc:
-        detail = exc.read().decode('utf-8', errors='replace')
-        raise RuntimeError(f"{domain}: HTTP {exc.code} {detail}") from exc
-    except error.URLError as exc:
-        raise RuntimeError(f"{domain}: network error {exc.reason}") from exc
 
-    try:
-        payload = json.loads(body)
-    except json.JSONDecodeError as exc:
-        raise RuntimeError(f"{domain}: invalid JSON response ({exc})") from exc
+def _shop_graphql(
+    domain: str,
+    token: str,
+    query: str,
+    variables: dict[str, Any],
+    operation: str,
+    cost_units: int | None = None,
+) -> dict[str, Any]:
+    """POST a GraphQL query through the pooled Admin client, paced on the store's cost bucket.
+
+    ``cost_units`` is what the query's cost scales with (defaults to ``first``).
+    A ``THROTTLED`` reply is retried once the bucket has restored enough for it;
+    other errors are left to the caller.
+    """
+    throttle = throttle_for(domain)
+    first = cost_units if cost_units is not None else variables.get("first")
+    for attempt in range(THROTTLE_MAX_RETRIES + 1):
+        _, reservation = throttle.acquire(operation, first)
+        try:
+            payload = ADMIN_CLIENT.post_graphql(
+                admin_api_url(domain, "graphql.json", API_VERSION),
+                token,
+                query,
+                variables,
+                label=domain,
+                operation=f"graphql:{operation}",
+            )
+        except BaseException:
+            throttle.release(reservation)
+            raise
+        throttle.observe(operation, first, payload.get("extensions"), reservation)
+        if "THROTTLED" not in error_codes(payload.get("errors")) or throttle.exceeds_bucket(operation, first):
+            return payload
+        if throttle.restore_rate is None:
+            # No throttleStatus to pace on; fall back to exponential backoff.
+            time.sleep(2 ** attempt)
+    return payload
+
+
+def fetch_shop_info(domain: str, token: str) -> dict[str, Any]:
+    payload = _shop_graphql(domain, token, SHOP_INFO_QUERY, {}, "FetchShopInfo")
 
     data = payload.get('data')
     if not isinstance(data, dict):
@@ -275,27 +395,7 @@ def fetch_shop_info(domain: str, token: str) -> dict[str, Any]:
 
 
 def fetch_delivery_profiles(domain: str, token: str) -> dict[str, Any]:
-    url = _shop_admin_graphql_url(domain)
-    payload = json.dumps({'query': DELIVERY_PROFILES_QUERY, 'variables': {}}).encode('utf-8')
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-        'X-Shopify-Access-Token': token,
-    }
-    request_obj = request.Request(url=url, data=payload, headers=headers, method='POST')
-    try:
-        with request.urlopen(request_obj, timeout=30) as response:
-            body = response.read().decode('utf-8')
-    except error.HTTPError as exc:
-        detail = exc.read().decode('utf-8', errors='replace')
-        raise RuntimeError(f"{domain}: HTTP {exc.code} {detail}") from exc
-    except error.URLError as exc:
-        raise RuntimeError(f"{domain}: network error {exc.reason}") from exc
-
-    try:
-        payload = json.loads(body)
-    except json.JSONDecodeError as exc:
-        raise RuntimeError(f"{domain}: invalid JSON response ({exc})") from exc
+    payload = _shop_graphql(domain, token, DELIVERY_PROFILES_QUERY, {}, "DeliveryZoneList")
 
     data = payload.get('data')
     if not isinstance(data, dict):
@@ -306,224 +406,207 @@ def fetch_delivery_profiles(domain: str, token: str) -> dict[str, Any]:
     return profiles
 
 
-def fetch_product_variants(
-    domain: str,
-    token: str,
-    product_id: str | None,
-    page_size: int = 100,
-) -> list[dict[str, Any]]:
-    if not isinstance(product_id, str) or not product_id:
-        return []
-
-    url = _shop_admin_graphql_url(domain)
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-Shopify-Access-Token": token,
-    }
-    variants: list[dict[str, Any]] = []
-    cursor: str | None = None
+def _fit_to_max_cost(errors: object, size: int) -> int | None:
+    """A smaller ``size`` that should fit the query cost limit, or None unless ``errors`` is MAX_COST_EXCEEDED."""
+    for error in errors if isinstance(errors, list) else ():
+        extensions = error.get("extensions") if isinstance(error, dict) else None
+        if not isinstance(extensions, dict) or extensions.get("code") != "MAX_COST_EXCEEDED":
+            continue
+        cost, max_cost = extensions.get("cost"), extensions.get("maxCost")
+        if isinstance(cost, (int, float)) and isinstance(max_cost, (int, float)) and cost > 0:
+            return max(1, min(size - 1, int(size * max_cost / cost)))
+        return max(1, size // 2)
+    return None
 
-    while True:
-        variables: dict[str, Any] = {"id": product_id, "first": page_size}
-        if cursor:
-            variables["after"] = cursor
 
-        payload = json.dumps({"query": PRODUCT_VARIANTS_QUERY, "variables": variables}).encode("utf-8")
-        request_obj = request.Request(url=url, data=payload, headers=headers, method="POST")
-        try:
-            with request.urlopen(request_obj, timeout=30) as response:
-                body = response.read().decode("utf-8")
-        except error.HTTPError as exc:
-            detail = exc.read().decode("utf-8", errors="replace")
-            raise RuntimeError(f"{domain}: HTTP {exc.code} {detail}") from exc
-        except error.URLError as exc:
-            raise RuntimeError(f"{domain}: network error {exc.reason}") from exc
+def fetch_variant_overflow(
+    domain: str,
+    token: str,
+    pending: dict[str, dict],
+    page_size: int = VARIANT_PAGE_SIZE,
+    width: int = VARIANT_BATCH_SIZE,
+) -> tuple[int, int]:
+    """Page the remaining variants of every product in ``pending`` with batched aliased queries.
+
+    ``pending`` maps product IDs to their ``variants`` connection, whose
+    ``pageInfo.endCursor`` is the next cursor; connections are completed in place.
+    Returns the ``(page_size, width)`` for the next call: the batch width is
+    scaled from the measured cost of the last query.
+    """
+    throttle = throttle_for(domain)
+    while pending:
+        batch = list(pending.items())[:width]
+        variables: dict[str, Any] = {"first": page_size}
+        for index, (product_id, variants) in enumerate(batch):
+            variables[f"id{index}"] = product_id
+            variables[f"after{index}"] = variants["pageInfo"]["endCursor"]
 
-        try:
-            payload = json.loads(body)
-        except json.JSONDecodeError as exc:
-            raise RuntimeError(f"{domain}: invalid JSON response ({exc})") from exc
+        payload = _shop_graphql(
+            domain, token, variant_batch_query(len(batch)), variables, "FetchVariantBatch", cost_units=len(batch)
+        )
 
         errors = payload.get("errors")
         if errors:
+            # Narrow the batch first, then the variant page, until the query fits the cost limit.
+            if width > 1 and (fitted := _fit_to_max_cost(errors, width)) is not None:
+                width = fitted
+                continue
+            if page_size > 1 and (fitted := _fit_to_max_cost(errors, page_size)) is not None:
+                page_size = fitted
+                continue
             raise RuntimeError(f"{domain}: GraphQL errors {errors}")
 
         data = payload.get("data")
         if not isinstance(data, dict):
             raise RuntimeError(f"{domain}: missing 'data' in variants response")
 
-        product = data.get("product")
-        if not isinstance(product, dict):
-            raise RuntimeError(f"{domain}: missing 'product' in variants response")
-
-        variants_payload = product.get("variants")
-        if not isinstance(variants_payload, dict):
-            raise RuntimeError(f"{domain}: missing 'variants' in response")
+        for index, (product_id, variants) in enumerate(batch):
+            product = data.get(f"p{index}")
+            connection = product.get("variants") if isinstance(product, dict) else None
+            if not isinstance(connection, dict):
+                # Product vanished mid-crawl; keep what was already collected.
+                del pending[product_id]
+                continue
 
-        edges = variants_payload.get("edges")
-        if not isinstance(edges, list):
-            raise RuntimeError(f"{domain}: missing variant 'edges' in response")
+            edges = connection.get("edges")
+            if not isinstance(edges, list):
+                raise RuntimeError(f"{domain}: missing variant 'edges' in response")
+            page_info = connection.get("pageInfo")
+            if not isinstance(page_info, dict):
+                raise RuntimeError(f"{domain}: missing variant 'pageInfo' in response")
 
-        for edge in edges:
-            if not isinstance(edge, dict):
-                continue
-            node = edge.get("node")
-            if not isinstance(node, dict):
+            variants["edges"].extend(edges)
+            if not page_info.get("hasNextPage"):
+                del pending[product_id]
                 continue
 
-            price_value = node.get("price")
-            price_str = str(price_value) if price_value is not None else None
-
-            selected_options = []
-            options_payload = node.get("selectedOptions")
-            if isinstance(options_payload, list):
-                for option in options_payload:
-                    if isinstance(option, dict):
-                        selected_options.append(
-                            {
-                                "name": option.get("name"),
-                                "value": option.get("value"),
-                            }
-                        )
-
-            inventory_item_payload = node.get("inventoryItem")
-            inventory_item: dict[str, Any] | None = None
-            if isinstance(inventory_item_payload, dict):
-                measurement_payload = inventory_item_payload.get("measurement") or {}
-                weight_payload = None
-                if isinstance(measurement_payload, dict):
-                    weight_payload = measurement_payload.get("weight")
-                weight = None
-                if isinstance(weight_payload, dict):
-                    weight = {
-                        "value": weight_payload.get("value"),
-                        "unit": weight_payload.get("unit"),
-                    }
-
-                inventory_levels_payload = inventory_item_payload.get("inventoryLevels")
-                inventory_levels: list[dict[str, Any]] = []
-                if isinstance(inventory_levels_payload, dict):
-                    level_edges = inventory_levels_payload.get("edges")
-                    if isinstance(level_edges, list):
-                        for level_edge in level_edges:
-                            if not isinstance(level_edge, dict):
-                                continue
-                            level_node = level_edge.get("node")
-                            if not isinstance(level_node, dict):
-                                continue
-                            location_payload = level_node.get("location")
-                            location: dict[str, Any] | None = None
-                            if isinstance(location_payload, dict):
-                                address_payload = location_payload.get("address")
-                                address = None
-                                if isinstance(address_payload, dict):
-                                    address = {
-                                        "address1": address_payload.get("address1"),
-                                        "address2": address_payload.get("address2"),
-                                        "city": address_payload.get("city"),
-                                        "provinceCode": address_payload.get("provinceCode"),
-                                        "countryCode": address_payload.get("countryCode"),
-                                        "zip": address_payload.get("zip"),
-                                    }
-                                location = {
-                                    "name": location_payload.get("name"),
-                                    "address": address,
-                                }
-
-                            quantities_payload = level_node.get("quantities")
-                            quantities: list[dict[str, Any]] = []
-                            if isinstance(quantities_payload, list):
-                                for quantity in quantities_payload:
-                                    if isinstance(quantity, dict):
-                                        quantities.append(
-                                            {
-                                                "name": quantity.get("name"),
-                                                "quantity": quantity.get("quantity"),
-                                            }
-                                        )
-
-                            inventory_levels.append(
-                                {
-                                    "location": location,
-                                    "quantities": quantities,
-                                }
-                            )
-
-                inventory_item = {
-                    "id": inventory_item_payload.get("id"),
-                    "tracked": inventory_item_payload.get("tracked"),
-                    "measurement": {"weight": weight} if weight is not None else None,
-                    "inventoryLevels": inventory_levels,
-                }
+            cursor_value = page_info.get("endCursor")
+            if not isinstance(cursor_value, str) or not cursor_value:
+                raise RuntimeError(f"{domain}: missing 'endCursor' for next page of variants")
+            variants["pageInfo"]["endCursor"] = cursor_value
+        width = throttle.suggest_page_size("FetchVariantBatch", width)
+    return page_size, width
 
-            variants.append(
-                {
-                    "id": node.get("id"),
-                    "price": price_str,
-                    "title": node.get("title"),
-                    "sku": node.get("sku"),
-                    "barcode": node.get("barcode"),
-                    "inventoryQuantity": node.get("inventoryQuantity"),
-                    "selectedOptions": selected_options,
-                    "inventoryItem": inventory_item,
-                }
-            )
 
-        page_info = variants_payload.get("pageInfo")
-        if not isinstance(page_info, dict):
-            raise RuntimeError(f"{domain}: missing variant 'pageInfo' in response")
+def fetch_inventory_items(
+    domain: str,
+    token: str,
+    pending: dict[str, dict],
+    level_page_size: int = INVENTORY_LEVEL_PAGE_SIZE,
+    width: int = INVENTORY_BATCH_SIZE,
+    drain: bool = True,
+) -> tuple[int, int]:
+    """Fill in the ``inventoryItem`` of the variants in ``pending``, with all their levels, through batched aliased queries.
+
+    ``pending`` maps variant IDs to variant nodes; each is removed once its item
+    is complete, and a partly read item's ``inventoryLevels.pageInfo.endCursor``
+    is its next cursor. Unless ``drain``, fewer than ``width`` variants are left
+    in ``pending`` to be topped up with the next page's variants.
+    Returns the ``(level_page_size, width)`` for the next call: the level page
+    follows the most levels any item has had, and the batch width is scaled
+    from the measured cost of the last query.
+    """
+    throttle = throttle_for(domain)
+    most = 0
+    while pending and (drain or len(pending) >= width):
+        batch = list(pending.items())[:width]
+        variables: dict[str, Any] = {"first": level_page_size}
+        for index, (variant_id, variant) in enumerate(batch):
+            known = variant.get("inventoryItem")
+            variables[f"id{index}"] = variant_id
+            variables[f"after{index}"] = known["inventoryLevels"]["pageInfo"]["endCursor"] if known else None
+
+        payload = _shop_graphql(
+            domain, token, inventory_batch_query(len(batch)), variables, "FetchInventoryBatch", cost_units=len(batch)
+        )
 
-        has_next_page = bool(page_info.get("hasNextPage"))
-        cursor_value = page_info.get("endCursor")
+        errors = payload.get("errors")
+        if errors:
+            if width > 1 and (fitted := _fit_to_max_cost(errors, width)) is not None:
+                width = fitted
+                continue
+            if level_page_size > 1 and (fitted := _fit_to_max_cost(errors, level_page_size)) is not None:
+                level_page_size = fitted
+                continue
+            raise RuntimeError(f"{domain}: GraphQL errors {errors}")
 
-        if not has_next_page:
-            break
+        data = payload.get("data")
+        if not isinstance(data, dict):
+            raise RuntimeError(f"{domain}: missing 'data' in inventory response")
+
+        for index, (variant_id, variant) in enumerate(batch):
+            node = data.get(f"v{index}")
+            item = node.get("inventoryItem") if isinstance(node, dict) else None
+            if not isinstance(item, dict):
+                # Variant vanished mid-crawl; keep it as it was listed.
+                del pending[variant_id]
+                continue
 
-        if not isinstance(cursor_value, str) or not cursor_value:
-            raise RuntimeError(f"{domain}: missing 'endCursor' for next page of variants")
+            levels = item.get("inventoryLevels")
+            if not isinstance(levels, dict) or not isinstance(levels.get("edges"), list):
+                raise RuntimeError(f"{domain}: missing 'inventoryLevels' in response")
+            page_info = levels.get("pageInfo")
+            if not isinstance(page_info, dict):
+                raise RuntimeError(f"{domain}: missing inventory level 'pageInfo' in response")
+
+            known = variant.get("inventoryItem")
+            if known:
+                known["inventoryLevels"]["edges"].extend(levels["edges"])
+                known["inventoryLevels"]["pageInfo"] = page_info
+            else:
+                variant["inventoryItem"] = known = item
+            if page_info.get("hasNextPage"):
+                cursor_value = page_info.get("endCursor")
+                if not isinstance(cursor_value, str) or not cursor_value:
+                    raise RuntimeError(f"{domain}: missing 'endCursor' for next page of inventory levels")
+                continue
 
-        cursor = cursor_value
+            most = max(most, len(known["inventoryLevels"]["edges"]))
+            del pending[variant_id]
 
-    return variants
+        if most:
+            level_page_size = min(most, INVENTORY_LEVEL_PAGE_SIZE)
+        width = throttle.suggest_page_size("FetchInventoryBatch", width)
+    return level_page_size, width
 
 
 def fetch_all_products(
     domain: str,
     token: str,
-    page_size: int = 100,
-) -> list[dict[str, Any]]:
-    url = _shop_admin_graphql_url(domain)
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-Shopify-Access-Token": token,
-    }
-    simplified_products: list[dict[str, Any]] = []
+    page_size: int = PRODUCT_PAGE_SIZE,
+    checkpoint: PaginationCheckpoint | None = None,
+    variant_page_size: int = INLINE_VARIANT_PAGE_SIZE,
+) -> list[Product]:
+    simplified_products: list[Product] = []
     cursor: str | None = None
+    overflow_page_size, overflow_width = VARIANT_PAGE_SIZE, VARIANT_BATCH_SIZE
+    level_page_size, inventory_width = INVENTORY_LEVEL_PAGE_SIZE, INVENTORY_BATCH_SIZE
+    inventory: dict[str, dict] = {}
+    held: deque[tuple[list[dict], list[str], str | None, bool]] = deque()
+    throttle = throttle_for(domain)
+
+    # Resume from the last committed page of an interrupted crawl.
+    state = checkpoint.load() if checkpoint is not None else None
+    if state is not None:
+        simplified_products.extend(Product.from_row(item) for item in checkpoint.iter_items())
+        cursor = state.get("cursor")
 
     while True:
-        variables: dict[str, Any] = {"first": page_size}
+        variables: dict[str, Any] = {"first": page_size, "variantsFirst": variant_page_size}
         if cursor:
             variables["after"] = cursor
-        payload = json.dumps({"query": PRODUCTS_QUERY, "variables": variables}).encode("utf-8")
-        request_obj = request.Request(url=url, data=payload, headers=headers, method="POST")
-        try:
-            with request.urlopen(request_obj, timeout=30) as response:
-                body = response.read().decode("utf-8")
-        except error.HTTPError as exc:
-            detail = exc.read().decode("utf-8", errors="replace")
-            raise RuntimeError(f"{domain}: HTTP {exc.code} {detail}") from exc
-        except error.URLError as exc:
-            raise RuntimeError(f"{domain}: network error {exc.reason}") from exc
-
-        try:
-            payload = json.loads(body)
-        except json.JSONDecodeError as exc:
-            raise RuntimeError(f"{domain}: invalid JSON response ({exc})") from exc
+        payload = _shop_graphql(domain, token, PRODUCTS_QUERY, variables, "FetchProducts")
 
         errors = payload.get("errors")
         if errors:
+            # Shrink the inline variant page first (the rest comes through the batched
+            # overflow query), then the product page, until the query fits the cost limit.
+            if variant_page_size > 1 and (fitted := _fit_to_max_cost(errors, variant_page_size)) is not None:
+                variant_page_size = fitted
+                continue
+            if page_size > 1 and (fitted := _fit_to_max_cost(errors, page_size)) is not None:
+                page_size = fitted
+                continue
             raise RuntimeError(f"{domain}: GraphQL errors {errors}")
 
         data = payload.get("data")
@@ -538,6 +621,8 @@ def fetch_all_products(
         if not isinstance(edges, list):
             raise RuntimeError(f"{domain}: missing 'edges' in products response")
 
+        nodes: list[dict] = []
+        pending: dict[str, dict] = {}
         for edge in edges:
             if not isinstance(edge, dict):
                 continue
@@ -545,40 +630,46 @@ def fetch_all_products(
             if not isinstance(node, dict):
                 continue
 
-            images_payload = node.get("images")
-            image_nodes: list[dict[str, Any]] = []
-            if isinstance(images_payload, dict):
-                image_edges = images_payload.get("edges")
-                if isinstance(image_edges, list):
-                    for image_edge in image_edges:
-                        if not isinstance(image_edge, dict):
-                            continue
-                        image_node = image_edge.get("node")
-                        if isinstance(image_node, dict):
-                            image_nodes.append(image_node)
-
-            simplified_products.append(
-                {
-                    "id": node.get("id"),
-                    "title": node.get("title"),
-                    "handle": node.get("handle"),
-                    "description": node.get("description"),
-                    "descriptionHtml": node.get("descriptionHtml"),
-                    "productType": node.get("productType"),
-                    "tags": node.get("tags"),
-                    "featuredImage": node.get("featuredImage"),
-                    "images": image_nodes,
-                    "totalInventory": node.get("totalInventory"),
-                    "variants": fetch_product_variants(domain, token, node.get("id")),
-                }
-            )
+            variants = node.get("variants")
+            if not isinstance(variants, dict) or not isinstance(variants.get("edges"), list):
+                raise RuntimeError(f"{domain}: missing 'variants' in response")
+            page_info = variants.get("pageInfo")
+            if not isinstance(page_info, dict):
+                raise RuntimeError(f"{domain}: missing variant 'pageInfo' in response")
+            if page_info.get("hasNextPage") and isinstance(node.get("id"), str):
+                cursor_value = page_info.get("endCursor")
+                if not isinstance(cursor_value, str) or not cursor_value:
+                    raise RuntimeError(f"{domain}: missing 'endCursor' for next page of variants")
+                pending[node["id"]] = variants
+            nodes.append(node)
+
+        overflow_page_size, overflow_width = fetch_variant_overflow(domain, token, pending, overflow_page_size, overflow_width)
 
         page_info = products.get("pageInfo")
         if not isinstance(page_info, dict):
             raise RuntimeError(f"{domain}: missing 'pageInfo' in products response")
-
         has_next_page = bool(page_info.get("hasNextPage"))
         cursor_value = page_info.get("endCursor")
+
+        # Inventory batches span pages, so a page is held back (and checkpointed)
+        # until every one of its variants has its inventory item.
+        variant_ids: list[str] = []
+        for node in nodes:
+            for edge in node["variants"]["edges"]:
+                variant = edge.get("node") if isinstance(edge, dict) else None
+                if isinstance(variant, dict) and isinstance(variant.get("id"), str):
+                    inventory[variant["id"]] = variant
+                    variant_ids.append(variant["id"])
+        held.append((nodes, variant_ids, cursor_value, has_next_page))
+        level_page_size, inventory_width = fetch_inventory_items(
+            domain, token, inventory, level_page_size, inventory_width, drain=not has_next_page
+        )
+        while held and inventory.keys().isdisjoint(held[0][1]):
+            page_nodes, _, page_cursor, page_has_next = held.popleft()
+            page_products = [Product.from_node(node) for node in page_nodes]
+            simplified_products.extend(page_products)
+            if checkpoint is not None:
+                checkpoint.record([product.to_row(with_variants=True) for product in page_products], page_cursor, page_has_next)
         if not has_next_page:
             break
 
@@ -586,8 +677,11 @@ def fetch_all_products(
             raise RuntimeError(f"{domain}: missing 'endCursor' for next page of products")
 
         cursor = cursor_value
+        page_size = throttle.suggest_page_size("FetchProducts", page_size)
 
     return simplified_products
+
+
 def insert_load_state(
     load_state_client: Client,
     store_id: str,
@@ -637,13 +731,13 @@ def write_acp_export(
     load_state_client: Client,
     store_id: str,
     shop_info: dict[str, Any],
-    products: list[dict[str, Any]] | None,
+    products: list[Product] | None,
     version_time: datetime,
 ) -> None:
     payload: dict[str, Any] = {
         "store_id": store_id,
         "shop_info": shop_info,
-        "products": products if products is not None else [],
+        "products": [product.to_row(with_variants=True) for product in products or ()],
         "updated_at": version_time.isoformat(),
     }
 
@@ -658,72 +752,105 @@ def write_acp_export(
         print(f"failed to write acp_export for {store_id}: {exc}", file=sys.stderr)
 
 
+def product_hashes(products: list[Product] | None) -> dict[str, str]:
+    """``product_id -> content_hash`` of each product's ``product_info`` payload."""
+    hashes: dict[str, str] = {}
+    for product in products or ():
+        product_id = product.id
+        if isinstance(product_id, str) and product_id:
+            hashes[product_id] = content_hash(product.to_row())
+    return hashes
+
+
+def variant_hashes(products: list[Product] | None) -> dict[str, str]:
+    """``variant_id -> content_hash`` of each variant's ``variant_info`` payload (with its product ID)."""
+    hashes: dict[str, str] = {}
+    for product in products or ():
+        product_id = product.id
+        if not isinstance(product_id, str) or not product_id or not isinstance(product.variants, list):
+            continue
+        for variant in product.variants:
+            variant_id = variant.id
+            if isinstance(variant_id, str) and variant_id:
+                hashes[variant_id] = content_hash({"product_id": product_id, "variant_info": variant.to_row()})
+    return hashes
+
+
+def _insert_new_rows(
+    load_state_client: Client,
+    table: str,
+    key_column: str,
+    rows: list[dict[str, Any]],
+    chunk_size: int,
+) -> None:
+    # A row whose content reappears (A -> B -> A) may still be stored from an older version.
+    for idx in range(0, len(rows), chunk_size):
+        batch = rows[idx : idx + chunk_size]
+        (
+            load_state_client.schema("feed_shopify")
+            .table(table)
+            .upsert(batch, on_conflict=f"store_id,{key_column},content_hash", ignore_duplicates=True)
+            .execute()
+        )
+
+
 def write_product_info(
     load_state_client: Client,
     store_id: str,
     version_id: str,
-    products: list[dict[str, Any]] | None,
+    products: list[Product] | None,
     chunk_size: int = 50,
-) -> None:
-    if not products:
-        return
-
+    previous: dict[str, str] | None = None,
+) -> dict[str, str] | None:
+    """Insert the products whose content changed since ``previous`` (the last manifest's hashes).
+
+    Returns this version's ``product_id -> content_hash`` map, or None when a
+    write failed.
+    """
+    hashes = product_hashes(products)
+    previous = previous or {}
     rows: list[dict[str, Any]] = []
-    for product in products:
-        if not isinstance(product, dict):
-            continue
-        product_id = product.get("id")
-        if not isinstance(product_id, str) or not product_id:
+    for product in products or ():
+        product_id = product.id
+        if not isinstance(product_id, str) or not product_id or previous.get(product_id) == hashes[product_id]:
             continue
-        product_payload = {key: value for key, value in product.items() if key != "variants"}
         rows.append(
             {
                 "store_id": store_id,
                 "product_id": product_id,
                 "version_id": version_id,
-                "product_info": product_payload,
+                "content_hash": hashes[product_id],
+                "product_info": product.to_row(),
             }
         )
 
-    if not rows:
-        return
-
     try:
-        for idx in range(0, len(rows), chunk_size):
-            batch = rows[idx : idx + chunk_size]
-            (
-                load_state_client.schema("feed_shopify")
-                .table("product_info")
-                .insert(batch)
-                .execute()
-            )
+        _insert_new_rows(load_state_client, "product_info", "product_id", rows, chunk_size)
     except Exception as exc:  # noqa: BLE001
         print(f"failed to write product_info for {store_id}: {exc}", file=sys.stderr)
+        return None
+    return hashes
 
 
 def write_product_variants(
     load_state_client: Client,
     store_id: str,
     version_id: str,
-    products: list[dict[str, Any]] | None,
+    products: list[Product] | None,
     chunk_size: int = 50,
-) -> None:
-    if not products:
-        return
-
+    previous: dict[str, str] | None = None,
+) -> dict[str, str] | None:
+    """Insert the variants whose content changed since ``previous``; see ``write_product_info``."""
+    hashes = variant_hashes(products)
+    previous = previous or {}
     rows: list[dict[str, Any]] = []
-    for product in products:
-        if not isinstance(product, dict):
+    for product in products or ():
+        product_id = product.id
+        if not isinstance(product_id, str) or not product_id or not isinstance(product.variants, list):
             continue
-        product_id = product.get("id")
-        variants = product.get("variants")
-        if not isinstance(product_id, str) or not product_id or not isinstance(variants, list):
-            continue
-        for variant in variants:
-            if not isinstance(variant, dict):
-                continue
-            variant_id = variant.get("id")
-            if not isinstance(variant_id, str) or not variant_id:
+        for variant in product.variants:
+            variant_id = variant.id
+            if not isinstance(variant_id, str) or not variant_id or previous.get(variant_id) == hashes[variant_id]:
                 continue
             rows.append(
                 {
@@ -731,24 +858,133 @@ def write_product_variants(
                     "product_id": product_id,
                     "variant_id": variant_id,
                     "version_id": version_id,
-                    "variant_info": variant,
+                    "content_hash": hashes[variant_id],
+                    "variant_info": variant.to_row(),
                 }
             )
 
+    try:
+        _insert_new_rows(load_state_client, "product_variant_info", "variant_id", rows, chunk_size)
+    except Exception as exc:  # noqa: BLE001
+        print(f"failed to write product_variant_info for {store_id}: {exc}", file=sys.stderr)
+        return None
+    return hashes
+
+
+def write_version_manifest(
+    load_state_client: Client,
+    store_id: str,
+    version_id: str,
+    version_time: datetime,
+    products: dict[str, str],
+    variants: dict[str, str],
+) -> bool:
+    """Record which product and variant rows (by content hash) make up ``version_id``."""
+    try:
+        load_state_client.schema("feed_shopify").table("version_manifest").insert(
+            {
+                "store_id": store_id,
+                "version_id": version_id,
+                "version_time": version_time.isoformat(),
+                "products": products,
+                "variants": variants,
+            }
+        ).execute()
+    except Exception as exc:  # noqa: BLE001
+        print(f"failed to write version_manifest for {store_id}: {exc}", file=sys.stderr)
+        return False
+    return True
+
+
+def _success_version_ids(load_state_client: Client, store_id: str, limit: int) -> list[str]:
+    """The newest ``limit`` successful version IDs for a store, newest first."""
+    response = (
+        load_state_client.schema("feed_shopify")
+        .table("load_state")
+        .select("version_id")
+        .eq("store_id", store_id)
+        .eq("state", "success")
+        .order("version_time", desc=True)
+        .range(0, limit - 1)
+        .execute()
+    )
+    return [
+        row["version_id"]
+        for row in (response.data or [])
+        if isinstance(row, dict) and isinstance(row.get("version_id"), str)
+    ]
+
+
+def fetch_version_manifest(load_state_client: Client, store_id: str, version_id: str) -> dict[str, Any] | None:
+    response = (
+        load_state_client.schema("feed_shopify")
+        .table("version_manifest")
+        .select("products, variants")
+        .eq("store_id", store_id)
+        .eq("version_id", version_id)
+        .execute()
+    )
+    rows = [row for row in (response.data or []) if isinstance(row, dict)]
     if not rows:
-        return
+        return None
+    manifest = rows[0]
+    return {
+        "products": manifest.get("products") if isinstance(manifest.get("products"), dict) else {},
+        "variants": manifest.get("variants") if isinstance(manifest.get("variants"), dict) else {},
+    }
 
+
+def fetch_latest_manifest(load_state_client: Client, store_id: str) -> dict[str, Any] | None:
+    """The manifest of the store's newest successful version (None before the first manifest)."""
     try:
-        for idx in range(0, len(rows), chunk_size):
-            batch = rows[idx : idx + chunk_size]
-            (
+        version_ids = _success_version_ids(load_state_client, store_id, 1)
+        return fetch_version_manifest(load_state_client, store_id, version_ids[0]) if version_ids else None
+    except Exception as exc:  # noqa: BLE001
+        print(f"failed to fetch latest manifest for {store_id}: {exc}", file=sys.stderr)
+        return None
+
+
+def read_version(
+    load_state_client: Client,
+    store_id: str,
+    version_id: str,
+    chunk_size: int = 50,
+) -> dict[str, list[dict[str, Any]]]:
+    """``product_info`` and ``product_variant_info`` rows as of ``version_id``.
+
+    Rows are resolved through the version's manifest; versions written before
+    manifests existed are read by ``version_id`` as before. SQL readers can use
+    the ``product_info_as_of`` and ``product_variant_info_as_of`` views instead.
+    """
+    manifest = fetch_version_manifest(load_state_client, store_id, version_id)
+    result: dict[str, list[dict[str, Any]]] = {}
+    for table, section in (("product_info", "products"), ("product_variant_info", "variants")):
+        if manifest is None:
+            response = (
                 load_state_client.schema("feed_shopify")
-                .table("product_variant_info")
-                .insert(batch)
+                .table(table)
+                .select("*")
+                .eq("store_id", store_id)
+                .eq("version_id", version_id)
                 .execute()
             )
-    except Exception as exc:  # noqa: BLE001
-        print(f"failed to write product_variant_info for {store_id}: {exc}", file=sys.stderr)
+            result[table] = [row for row in (response.data or []) if isinstance(row, dict)]
+            continue
+        # Hashes cover the product (or variant) ID, so they identify rows within a store.
+        hashes = sorted(set(manifest[section].values()))
+        rows: list[dict[str, Any]] = []
+        for idx in range(0, len(hashes), chunk_size):
+            response = (
+                load_state_client.schema("feed_shopify")
+                .table(table)
+                .select("*")
+                .eq("store_id", store_id)
+                .in_("content_hash", hashes[idx : idx + chunk_size])
+                .execute()
+            )
+            rows.extend(row for row in (response.data or []) if isinstance(row, dict))
+        result[table] = rows
+    return result
 
 
 def cleanup_old_versions(
@@ -756,219 +992,358 @@ def cleanup_old_versions(
     store_id: str,
     retention: int,
 ) -> None:
+    """Keep the newest ``retention`` successful versions.
+
+    ``shop_info`` rows and pre-manifest ``product_info``/``product_variant_info``
+    rows go with their version. Content-hashed rows are shared across
+    versions, so they are deleted only once no kept version's manifest
+    references them.
+    """
     if retention <= 0:
         return
 
-    def _delete_versions(table: str, version_batch: list[str]) -> None:
+    def _delete_rows(table: str, column: str, values: list[str]) -> None:
         try:
             (
                 load_state_client.schema("feed_shopify")
                 .table(table)
                 .delete()
                 .eq("store_id", store_id)
-                .in_("version_id", version_batch)
+                .in_(column, values)
                 .execute()
             )
         except Exception as exc:  # noqa: BLE001
             print(f"failed to prune {table} for {store_id}: {exc}", file=sys.stderr)
 
     try:
-        response = (
-            load_state_client.schema("feed_shopify")
-            .table("load_state")
-            .select("version_id")
-            .eq("store_id", store_id)
-            .eq("state", "success")
-            .order("version_time", desc=True)
-            .range(0, retention - 1)
-            .execute()
-        )
+        keep_ids = set(_success_version_ids(load_state_client, store_id, retention))
     except Exception as exc:  # noqa: BLE001
         print(f"failed to fetch load_state for cleanup ({store_id}): {exc}", file=sys.stderr)
         return
 
-    keep_ids = {
-        row.get("version_id")
-        for row in (response.data or [])
-        if isinstance(row, dict) and isinstance(row.get("version_id"), str)
-    }
-
     if not keep_ids:
         return
 
-    def _prune_table(table: str) -> None:
+    def _pages(table: str, columns: str, order: tuple[str, ...]) -> Iterator[list[dict]]:
+        """The store's rows of ``table``, ``STORE_PAGE_SIZE`` at a time in ``order``."""
+        start = 0
+        while True:
+            query = load_state_client.schema("feed_shopify").table(table).select(columns).eq("store_id", store_id)
+            for column in order:
+                query = query.order(column)
+            records = query.range(start, start + STORE_PAGE_SIZE - 1).execute().data or []
+            yield [record for record in records if isinstance(record, dict)]
+            if len(records) < STORE_PAGE_SIZE:
+                return
+            start += STORE_PAGE_SIZE
+
+    referenced: dict[str, set[str]] = {"products": set(), "variants": set()}
+    stale_manifests: list[str] = []
+    try:
+        # Every kept manifest must be read before any row is judged unreferenced.
+        for page in _pages("version_manifest", "version_id, products, variants", ("version_id",)):
+            for row in page:
+                if not isinstance(row.get("version_id"), str):
+                    continue
+                if row["version_id"] not in keep_ids:
+                    stale_manifests.append(row["version_id"])
+                    continue
+                for section in referenced:
+                    if isinstance(row.get(section), dict):
+                        referenced[section].update(row[section].values())
+    except Exception as exc:  # noqa: BLE001
+        print(f"failed to list version_manifest for cleanup ({store_id}): {exc}", file=sys.stderr)
+        return
+
+    def _prune_table(table: str, section: str | None, key: tuple[str, ...]) -> None:
+        columns = "version_id, content_hash" if section else "version_id"
+        candidate_ids: set[str] = set()
+        candidate_hashes: set[str] = set()
         try:
-            response = (
-                load_state_client.schema("feed_shopify")
-                .table(table)
-                .select("version_id")
-                .eq("store_id", store_id)
-                .execute()
-            )
+            for page in _pages(table, columns, key):
+                for row in page:
+                    row_hash = row.get("content_hash") if section else None
+                    if isinstance(row_hash, str):
+                        if row_hash not in referenced[section]:
+                            candidate_hashes.add(row_hash)
+                    elif isinstance(row.get("version_id"), str) and row["version_id"] not in keep_ids:
+                        candidate_ids.add(row["version_id"])
         except Exception as exc:  # noqa: BLE001
             print(f"failed to list {table} for cleanup ({store_id}): {exc}", file=sys.stderr)
             return
 
-        candidate_ids = [
-            row.get("version_id")
-            for row in (response.data or [])
-            if isinstance(row, dict)
-            and isinstance(row.get("version_id"), str)
-            and row.get("version_id") not in keep_ids
-        ]
-        if not candidate_ids:
-            return
-
-        for idx in range(0, len(candidate_ids), 50):
-            batch = candidate_ids[idx : idx + 50]
-            _delete_versions(table, batch)
+        for column, values in (("version_id", sorted(candidate_ids)), ("content_hash", sorted(candidate_hashes))):
+            for idx in range(0, len(values), 50):
+                _delete_rows(table, column, values[idx : idx + 50])
 
-    _prune_table("shop_info")
-    _prune_table("product_info")
-    _prune_table("product_variant_info")
+    # Paged in primary-key order, so pages neither overlap nor skip rows.
+    _prune_table("shop_info", None, ("version_id",))
+    _prune_table("product_info", "products", ("product_id", "version_id"))
+    _prune_table("product_variant_info", "variants", ("product_id", "variant_id", "version_id"))
+    # Manifests go last, so rows are never left referenced by a manifest that was deleted first.
+    for idx in range(0, len(stale_manifests), 50):
+        _delete_rows("version_manifest", "version_id", stale_manifests[idx : idx + 50])
 
 
-def fetch_and_update(
-    stores: list[tuple[str, str, str]],
-    supabase_url: str,
-    supabase_key: str,
-):
-    version_id = str(uuid.uuid4())
-    version_time = datetime.now(timezone.utc)
-    load_state_client = create_client(supabase_url, supabase_key)
-    retention_env = os.getenv("SHOPIFY_SUCCESS_VERSION_RETENTION")
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
     try:
-        success_retention = int(retention_env) if retention_env is not None else DEFAULT_SUCCESS_VERSION_RETENTION
+        return int(value) if value is not None else default
     except ValueError:
-        success_retention = DEFAULT_SUCCESS_VERSION_RETENTION
-
-    for store_id, domain, access_token in stores:
-        # step 1: get shopify access token
-        runtime_log = ""
-        shop_info = []
-        products: list[dict[str, Any]] | None = None
-        token_value = access_token.strip() if isinstance(access_token, str) else ""
-
-        if store_id == "rockrooster":
-            override_token = os.getenv("ROCKROOSTER_SHOPIFY_ACCESS_TOKEN", "").strip()
-            if override_token:
-                token_value = override_token
-            elif not token_value:
-                runtime_log = "missing ROCKROOSTER_SHOPIFY_ACCESS_TOKEN"
-        elif not token_value:
-            runtime_log = "missing Shopify access token"
-        if runtime_log:
-            insert_load_state(
-                load_state_client,
-                store_id,
-                "failed",
-                runtime_log,
-                version_id,
-                version_time,
-            )
-            continue
-        # step 2: get shop info
-        try: 
-            shop_info = fetch_shop_info(domain, token_value)
-        except Exception as exc:
-            runtime_log = str(exc)
-            insert_load_state(
-                load_state_client,
-                store_id,
-                "failed",
-                runtime_log,
-                version_id,
-                version_time,
-            )
-            continue
+        return default
 
-        # # step 3: get delivery profiles
-        # TODO: disalbe it until the shipping policy is more clear
-        # try:
-        #     delivery_profiles = fetch_delivery_profiles(domain, token)
-        # except Exception as exc:
-        #     runtime_log = str(exc)
-        #     insert_load_state(
-        #         load_state_client,
-        #         store_id,
-        #         "failed",
-        #         runtime_log,
-        #         version_id,
-        #         version_time,
-        #     )
-        #     continue
-        # if isinstance(shop_info, dict):
-        #     print(delivery_profiles)
-        #     # shop_info["delivery_profiles"] = delivery_profiles
-
-        # step 4: get all products
-        try:
-            products = fetch_all_products(domain, token_value)
-        except Exception as exc:
-            runtime_log = str(exc)
-            insert_load_state(
-                load_state_client,
-                store_id,
-                "failed",
-                runtime_log,
-                version_id,
-                version_time,
-            )
-            continue
 
-        write_shop_info(
+def update_store(
+    load_state_client: Client,
+    store: tuple[str, str, str],
+    version_id: str,
+    version_time: datetime,
+    success_retention: int,
+    checkpoint: PaginationCheckpoint | None,
+    still_leased: Callable[[], bool] | None = None,
+) -> str:
+    """Crawl one store and write this version; returns the load_state written (or "lost")."""
+    store_id, domain, access_token = store
+    # step 1: get shopify access token
+    runtime_log = ""
+    shop_info = []
+    products: list[Product] | None = None
+    token_value = access_token.strip() if isinstance(access_token, str) else ""
+
+    if store_id == "rockrooster":
+        override_token = os.getenv("ROCKROOSTER_SHOPIFY_ACCESS_TOKEN", "").strip()
+        if override_token:
+            token_value = override_token
+        elif not token_value:
+            runtime_log = "missing ROCKROOSTER_SHOPIFY_ACCESS_TOKEN"
+    elif not token_value:
+        runtime_log = "missing Shopify access token"
+    if runtime_log:
+        insert_load_state(
             load_state_client,
             store_id,
-            shop_info,
+            "failed",
+            runtime_log,
             version_id,
             version_time,
         )
-
-        write_product_info(
+        return "failed"
+    # step 2: get shop info
+    try: 
+        shop_info = fetch_shop_info(domain, token_value)
+    except Exception as exc:
+        runtime_log = str(exc)
+        insert_load_state(
             load_state_client,
             store_id,
+            "failed",
+            runtime_log,
             version_id,
-            products,
+            version_time,
         )
-
-        write_product_variants(
+        return "failed"
+
+    # # step 3: get delivery profiles
+    # TODO: disalbe it until the shipping policy is more clear
+    # try:
+    #     delivery_profiles = fetch_delivery_profiles(domain, token)
+    # except Exception as exc:
+    #     runtime_log = str(exc)
+    #     insert_load_state(
+    #         load_state_client,
+    #         store_id,
+    #         "failed",
+    #         runtime_log,
+    #         version_id,
+    #         version_time,
+    #     )
+    #     return "failed"
+    # if isinstance(shop_info, dict):
+    #     print(delivery_profiles)
+    #     # shop_info["delivery_profiles"] = delivery_profiles
+
+    # step 4: get all products (resuming a recent interrupted crawl, if any)
+    try:
+        products = fetch_all_products(domain, token_value, checkpoint=checkpoint)
+    except Exception as exc:
+        if checkpoint is not None:
+            # Resume from the last page recorded, not the last periodic commit.
+            checkpoint.commit()
+        runtime_log = str(exc)
+        insert_load_state(
             load_state_client,
             store_id,
+            "failed",
+            runtime_log,
             version_id,
-            products,
-        )
-
-        write_acp_export(
-            load_state_client,
-            store_id,
-            shop_info,
-            products,
             version_time,
         )
+        return "failed"
+
+    # Another worker took the store over after our lease expired; leave the writes to it.
+    if still_leased is not None and not still_leased():
+        print(f"lease for {store_id} lost; skipping writes", file=sys.stderr)
+        return "lost"
+
+    write_shop_info(
+        load_state_client,
+        store_id,
+        shop_info,
+        version_id,
+        version_time,
+    )
 
-        cleanup_old_versions(
-            load_state_client,
-            store_id,
-            success_retention,
-        )
+    # Only products and variants whose content hash moved since the last
+    # successful version get new rows; the manifest maps this version onto them.
+    previous = fetch_latest_manifest(load_state_client, store_id) or {}
+    previous_products = previous.get("products") or {}
+    previous_variants = previous.get("variants") or {}
+    product_manifest = write_product_info(
+        load_state_client,
+        store_id,
+        version_id,
+        products,
+        previous=previous_products,
+    )
 
-        # write success state
-        product_count = len(products) if products else 0
-        variant_count = 0
-        if products:
-            for product in products:
-                variants = product.get("variants") if isinstance(product, dict) else None
-                if isinstance(variants, list):
-                    variant_count += sum(1 for variant in variants if isinstance(variant, dict))
+    variant_manifest = write_product_variants(
+        load_state_client,
+        store_id,
+        version_id,
+        products,
+        previous=previous_variants,
+    )
+
+    if (
+        product_manifest is None
+        or variant_manifest is None
+        or not write_version_manifest(load_state_client, store_id, version_id, version_time, product_manifest, variant_manifest)
+    ):
+        # Without its manifest the version cannot be read back; cleanup drops the orphaned rows.
         insert_load_state(
             load_state_client,
             store_id,
-            "success",
-            runtime_log,
+            "failed",
+            "failed to write product rows or version manifest",
             version_id,
             version_time,
-            metrics={"product_cnt": product_count, "variant_cnt": variant_count},
         )
+        return "failed"
+
+    write_acp_export(
+        load_state_client,
+        store_id,
+        shop_info,
+        products,
+        version_time,
+    )
+
+    # write success state
+    product_count = len(products) if products else 0
+    variant_count = sum(len(product.variants or ()) for product in products or ())
+    insert_load_state(
+        load_state_client,
+        store_id,
+        "success",
+        runtime_log,
+        version_id,
+        version_time,
+        metrics={
+            "product_cnt": product_count,
+            "variant_cnt": variant_count,
+            "product_changed_cnt": sum(1 for key, value in product_manifest.items() if previous_products.get(key) != value),
+            "variant_changed_cnt": sum(1 for key, value in variant_manifest.items() if previous_variants.get(key) != value),
+        },
+    )
+
+    # After the success state, so this version counts among the ones kept.
+    cleanup_old_versions(
+        load_state_client,
+        store_id,
+        success_retention,
+    )
+    if checkpoint is not None:
+        checkpoint.clear()
+    return "success"
+
+
+def fetch_and_update(
+    store_pages: Iterable[list[tuple[str, str, str]]],
+    supabase_url: str,
+    supabase_key: str,
+    store_concurrency: int = 1,
+    leases: StoreLeases | None = None,
+):
+    """Update every store, ``store_concurrency`` at a time.
+
+    Stores are submitted page by page as ``store_pages`` yields them, so work
+    starts before the whole store list has been read.
+
+    With ``leases`` each store is claimed first and skipped when another
+    worker holds it or finished it recently, so several workers can run over
+    the same store list; held leases are heartbeated until released.
+    """
+    version_id = str(uuid.uuid4())
+    version_time = datetime.now(timezone.utc)
+    success_retention = _env_int("SHOPIFY_SUCCESS_VERSION_RETENTION", DEFAULT_SUCCESS_VERSION_RETENTION)
+    checkpoint_dir = pathlib.Path(os.getenv("SHOPIFY_CHECKPOINT_DIR", DEFAULT_CHECKPOINT_DIR))
+    checkpoint_max_age = _env_int("SHOPIFY_CHECKPOINT_MAX_AGE_MINUTES", DEFAULT_CHECKPOINT_MAX_AGE_MINUTES)
+    checkpoint_fingerprint = {
+        "api_version": API_VERSION,
+        "query": hashlib.sha256((PRODUCTS_QUERY + variant_batch_query(1) + inventory_batch_query(1)).encode("utf-8")).hexdigest(),
+    }
+    # One Supabase client per worker thread; the underlying HTTP session is not shared.
+    clients = threading.local()
+
+    def run(store: tuple[str, str, str]) -> str:
+        if getattr(clients, "client", None) is None:
+            clients.client = create_client(supabase_url, supabase_key)
+        store_id = store[0]
+        checkpoint = None
+        if checkpoint_max_age > 0:
+            checkpoint = PaginationCheckpoint(
+                checkpoint_dir / store_id,
+                timedelta(minutes=checkpoint_max_age),
+                checkpoint_fingerprint,
+            )
+        still_leased = (lambda: leases.holds(store_id)) if leases is not None else None
+        state = "failed"
+        try:
+            state = update_store(
+                clients.client,
+                store,
+                version_id,
+                version_time,
+                success_retention,
+                checkpoint,
+                still_leased,
+            )
+        except Exception as exc:  # noqa: BLE001
+            print(f"store {store_id} failed: {exc}", file=sys.stderr)
+        finally:
+            if leases is not None:
+                leases.release(store_id, state)
+        return state
+
+    if leases is not None:
+        leases.start_heartbeat()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, store_concurrency)) as executor:
+            slots = threading.BoundedSemaphore(max(1, store_concurrency))
+            for page in store_pages:
+                if leases is not None:
+                    leases.ensure(store_id for store_id, _, _ in page)
+                for store in page:
+                    # Claim only when a slot is free, so no lease sits idle in the queue.
+                    slots.acquire()
+                    if leases is not None and not leases.claim(store[0]):
+                        slots.release()
+                        continue
+                    future = executor.submit(run, store)
+                    future.add_done_callback(lambda _: slots.release())
+    finally:
+        if leases is not None:
+            leases.stop_heartbeat()
 
 def main(argv: list[str] | None = None) -> dict[str, Any] | int:
     load_dotenv()
@@ -988,33 +1363,91 @@ def main(argv: list[str] | None = None) -> dict[str, Any] | int:
         default=os.getenv("SUPABASE_VENDOR_TABLE", "vendor_store_claim_state"),
         help="Supabase table containing vendor store claim state.",
     )
+    parser.add_argument(
+        "--store-concurrency",
+        type=int,
+        default=_env_int("SHOPIFY_STORE_CONCURRENCY", 1),
+        help="Stores this worker processes at the same time.",
+    )
+    parser.add_argument(
+        "--leases",
+        choices=("none", "supabase", "sqlite"),
+        default=os.getenv("SHOPIFY_STORE_LEASES", "none"),
+        help="Claim each store through a lease table so several workers can share the store list "
+        "(supabase: feed_shopify.store_lease; sqlite: --lease-db).",
+    )
+    parser.add_argument(
+        "--lease-db",
+        type=pathlib.Path,
+        default=pathlib.Path(os.getenv("SHOPIFY_LEASE_DB", "/tmp/integrations/product-feed/shopify/store_leases.sqlite3")),
+        help="SQLite lease database for --leases sqlite.",
+    )
+    parser.add_argument(
+        "--lease-ttl",
+        type=int,
+        default=_env_int("SHOPIFY_LEASE_TTL_SECONDS", DEFAULT_LEASE_TTL_SECONDS),
+        help="Seconds a lease survives without a heartbeat.",
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        type=int,
+        default=_env_int("SHOPIFY_LEASE_REFRESH_SECONDS", DEFAULT_REFRESH_INTERVAL_SECONDS),
+        help="Seconds after a store succeeds before any worker claims it again.",
+    )
+    parser.add_argument(
+        "--failure-backoff",
+        type=int,
+        default=_env_int("SHOPIFY_LEASE_FAILURE_BACKOFF_SECONDS", DEFAULT_FAILURE_BACKOFF_SECONDS),
+        help="Seconds after a store fails before any worker retries it.",
+    )
+    parser.add_argument("--worker-id", default=os.getenv("SHOPIFY_WORKER_ID"), help="Lease owner name (default: host-pid-random).")
     args = parser.parse_args(argv)
 
     if not args.supabase_url or not args.supabase_key:
         print("Supabase configuration is required (SUPABASE_URL and key).", file=sys.stderr)
         return 1
 
+    store_pages = fetch_shopify_stores(
+        base_url=args.supabase_url,
+        api_key=args.supabase_key,
+        table=args.supabase_table,
+    )
     try:
-        stores = fetch_shopify_stores(
-            base_url=args.supabase_url,
-            api_key=args.supabase_key,
-            table=args.supabase_table,
-        )
+        first_page = next(store_pages, [])
     except Exception as exc:  # noqa: BLE001
         print(f"Supabase fetch failed: {exc}", file=sys.stderr)
         return 1
-    
-    if not stores:
+
+    if not first_page:
         print("No Shopify stores returned from Supabase.", file=sys.stderr)
         return 1
 
     rock_token = os.getenv("ROCKROOSTER_SHOPIFY_ACCESS_TOKEN", "").strip()
-    stores.append(("rockrooster", "rock-rooster-footwear-inc.myshopify.com", rock_token))
+    # Later pages are read as the first ones are being processed.
+    store_pages = itertools.chain(
+        [first_page],
+        store_pages,
+        [[("rockrooster", "rock-rooster-footwear-inc.myshopify.com", rock_token)]],
+    )
+
+    leases: StoreLeases | None = None
+    lease_options = {
+        "worker_id": args.worker_id,
+        "ttl": args.lease_ttl,
+        "refresh_interval": args.refresh_interval,
+        "failure_backoff": args.failure_backoff,
+    }
+    if args.leases == "supabase":
+        leases = SupabaseStoreLeases(create_client(args.supabase_url, args.supabase_key), **lease_options)
+    elif args.leases == "sqlite":
+        leases = SQLiteStoreLeases(args.lease_db, **lease_options)
 
     return fetch_and_update(
-        stores,
+        store_pages,
         args.supabase_url,
         args.supabase_key,
+        store_concurrency=args.store_concurrency,
+        leases=leases,
     )
 
 
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""Receive Shopify product and inventory webhooks and patch the newest snapshots."""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import pathlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fetch_admin import (
+    DEFAULT_CONFIG_PATH,
+    DEFAULT_OUTPUT_DIR,
+    DEFAULT_PAGE_SIZE,
+    HISTORY_VERSION_RETENTION,
+    INCREMENTAL_ID_FILTER_CHUNK,
+    SNAPSHOT_FORMATS,
+    ShopifyError,
+    apply_storefront_urls,
+    close_logging,
+    fetch_admin,
+    latest_snapshot_path,
+    load_shops,
+    load_snapshot,
+    log,
+    prepare_logging,
+    primary_domain_parts,
+    prune_logs,
+    snapshot_product_edges,
+    write_snapshot,
+)
+
+WEBHOOK_TOPICS = ("products/update", "products/delete", "inventory_levels/update")
+WEBHOOK_SECRET_ENV = "SHOPIFY_WEBHOOK_SECRET"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8787
+DEFAULT_QUIET_SECONDS = 5.0  # a store's events are applied once it has been quiet this long
+MAX_PATCH_DELAY_SECONDS = 60.0  # ...or once its oldest pending event is this old
+SEEN_WEBHOOK_IDS = 10_000  # recent X-Shopify-Webhook-Id values remembered to drop redeliveries
+MAX_PATCH_ATTEMPTS = 5  # a store's batch is dropped after failing this many times; the next crawl reconciles it
+MAX_BODY_BYTES = 5_000_000
+
+
+class WebhookRejected(ShopifyError):
+    """Raised for a webhook that must not be applied; ``status`` is the HTTP reply."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def verify_hmac(secret: str, body: bytes, signature: str | None) -> bool:
+    """Check ``X-Shopify-Hmac-Sha256`` (base64 HMAC-SHA256 of the raw body)."""
+    if not signature:
+        return False
+    expected = base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii")
+    return hmac.compare_digest(expected, signature.strip())
+
+
+def admin_gid(payload: dict, resource: str, key: str = "id") -> str | None:
+    value = payload.get(key)
+    if value is None:
+        return None
+    return f"gid://shopify/{resource}/{value}"
+
+
+class PatchQueue:
+    """Pending per-store product patches, coalesced until the store goes quiet.
+
+    Each product keeps only its latest action (``refresh`` or ``delete``);
+    inventory items are resolved to their product when the batch is applied.
+    """
+
+    def __init__(self, quiet_seconds: float = DEFAULT_QUIET_SECONDS, max_delay: float = MAX_PATCH_DELAY_SECONDS) -> None:
+        self.quiet_seconds = quiet_seconds
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._pending: dict[str, dict] = {}
+
+    def add(self, store_id: str, product_id: str | None = None, action: str = "refresh", inventory_item_id: str | None = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            batch = self._pending.setdefault(store_id, {"products": {}, "inventory_items": set(), "first": now, "last": now})
+            batch["last"] = now
+            if product_id is not None:
+                batch["products"][product_id] = action
+            if inventory_item_id is not None:
+                batch["inventory_items"].add(inventory_item_id)
+
+    def requeue(self, store_id: str, batch: dict) -> None:
+        """Put back a batch that failed to apply; events queued since then take precedence."""
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending.get(store_id)
+            # Restart the quiet period so a failing store is retried every quiet_seconds, not every tick.
+            merged = {
+                "products": dict(batch["products"]),
+                "inventory_items": set(batch["inventory_items"]),
+                "first": now,
+                "last": now,
+                "attempts": batch.get("attempts", 0) + 1,
+            }
+            if pending is not None:
+                merged["products"].update(pending["products"])
+                merged["inventory_items"] |= pending["inventory_items"]
+            self._pending[store_id] = merged
+
+    def take(self, force: bool = False) -> list[tuple[str, dict]]:
+        """Remove and return the batches that are ready (all of them with ``force``)."""
+        now = time.monotonic()
+        with self._lock:
+            ready = [
+                store_id for store_id, batch in self._pending.items()
+                if force or now - batch["last"] >= self.quiet_seconds or now - batch["first"] >= self.max_delay
+            ]
+            return [(store_id, self._pending.pop(store_id)) for store_id in ready]
+
+
+class WebhookReceiver:
+    """Verifies, records and queues webhooks; ``flush`` applies queued patches to the snapshots."""
+
+    def __init__(
+        self,
+        stores: list[dict],
+        output_dir: pathlib.Path,
+        secret: str | None = None,
+        record_path: pathlib.Path | None = None,
+        quiet_seconds: float = DEFAULT_QUIET_SECONDS,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        history_retention: int = HISTORY_VERSION_RETENTION,
+        dedup_history: bool = False,
+        snapshot_format: str = "json",
+        change_log: bool = True,
+        sqlite_catalog: bool = False,
+    ) -> None:
+        self.stores: dict[str, dict] = {}
+        self.stores_by_id = {store["store_id"]: store for store in stores}
+        for store in stores:
+            for domain in (store["store_id"], f"{store['store_id']}.myshopify.com", store.get("shop_domain")):
+                if domain:
+                    self.stores[domain.lower()] = store
+        self.output_dir = output_dir
+        self.secret = secret
+        self.record_path = record_path
+        self.queue = PatchQueue(quiet_seconds)
+        self.page_size = page_size
+        self.history_retention = history_retention
+        self.snapshot_options = {
+            "dedup_history": dedup_history,
+            "snapshot_format": snapshot_format,
+            "change_log": change_log,
+            "sqlite_catalog": sqlite_catalog,
+        }
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self._record_lock = threading.Lock()
+
+    def receive(self, topic: str | None, shop_domain: str | None, signature: str | None, body: bytes, webhook_id: str | None = None) -> str:
+        """Verify and queue one delivery; returns a short outcome, raises ``WebhookRejected``."""
+        store = self.stores.get((shop_domain or "").lower())
+        if store is None:
+            raise WebhookRejected(404, f"unknown shop {shop_domain!r}")
+        secret = store.get("webhook_secret") or self.secret
+        if not secret:
+            raise WebhookRejected(401, f"no webhook secret configured for {store['store_id']}")
+        if not verify_hmac(secret, body, signature):
+            raise WebhookRejected(401, f"HMAC verification failed for {store['store_id']}")
+        if webhook_id:
+            with self._record_lock:
+                if webhook_id in self._seen:
+                    return "duplicate"
+        if topic not in WEBHOOK_TOPICS:
+            self.mark_seen(webhook_id)
+            return "ignored"
+        try:
+            payload = json.loads(body)
+        except ValueError as exc:
+            raise WebhookRejected(400, f"invalid JSON body: {exc}") from exc
+        if not isinstance(payload, dict):
+            raise WebhookRejected(400, "webhook body must be a JSON object")
+
+        store_id = store["store_id"]
+        if topic == "inventory_levels/update":
+            item_id = admin_gid(payload, "InventoryItem", "inventory_item_id")
+            if item_id is None:
+                raise WebhookRejected(400, "inventory_levels/update without inventory_item_id")
+            self.queue.add(store_id, inventory_item_id=item_id)
+        else:
+            product_id = payload.get("admin_graphql_api_id") or admin_gid(payload, "Product")
+            if product_id is None:
+                raise WebhookRejected(400, f"{topic} without a product id")
+            self.queue.add(store_id, product_id, "delete" if topic == "products/delete" else "refresh")
+        # Only now: a delivery rejected above must stay eligible for Shopify's retry.
+        self.mark_seen(webhook_id)
+        self.record(topic, shop_domain, signature, body, webhook_id)
+        return "queued"
+
+    def mark_seen(self, webhook_id: str | None) -> None:
+        if not webhook_id:
+            return
+        with self._record_lock:
+            self._seen[webhook_id] = None
+            while len(self._seen) > SEEN_WEBHOOK_IDS:
+                self._seen.popitem(last=False)
+
+    def record(self, topic: str | None, shop_domain: str | None, signature: str | None, body: bytes, webhook_id: str | None) -> None:
+        if self.record_path is None:
+            return
+        line = json.dumps({
+            "topic": topic,
+            "shop_domain": shop_domain,
+            "hmac": signature,
+            "webhook_id": webhook_id,
+            "body": body.decode("utf-8"),
+        }, ensure_ascii=False)
+        with self._record_lock:
+            self.record_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.record_path.open("a", encoding="utf-8") as handle:
+                handle.write(line + "\n")
+
+    def flush(self, force: bool = False) -> int:
+        """Apply the ready batches; a failed batch is requeued (up to ``MAX_PATCH_ATTEMPTS``). Returns failures."""
+        failures = 0
+        for store_id, batch in self.queue.take(force):
+            try:
+                self.apply(self.stores_by_id[store_id], batch["products"], batch["inventory_items"])
+            except Exception as exc:  # noqa: BLE001
+                failures += 1
+                attempts = batch.get("attempts", 0) + 1
+                if attempts >= MAX_PATCH_ATTEMPTS:
+                    log(f"Unable to apply webhooks for {store_id} after {attempts} attempts, dropping them: {exc}")
+                else:
+                    log(f"Unable to apply webhooks for {store_id} (attempt {attempts}), requeued: {exc}")
+                    self.queue.requeue(store_id, batch)
+        return failures
+
+    def apply(self, store: dict, actions: dict[str, str], inventory_items: set[str]) -> pathlib.Path | None:
+        """Re-fetch updated products, drop deleted ones and write the result as the store's newest snapshot."""
+        store_id = store["store_id"]
+        previous_path = latest_snapshot_path(self.output_dir / store_id)
+        if previous_path is None:
+            log(f"No snapshot for {store_id} to apply webhooks to; run a crawl first")
+            return None
+        snapshot = load_snapshot(previous_path)
+        edges = snapshot_product_edges(snapshot)
+
+        actions = dict(actions)
+        if inventory_items:
+            for edge in edges:
+                variants = (edge["node"].get("variants") or {}).get("edges") or []
+                for variant_edge in variants:
+                    item = ((variant_edge or {}).get("node") or {}).get("inventoryItem") or {}
+                    if item.get("id") in inventory_items:
+                        actions.setdefault(edge["node"]["id"], "refresh")
+                        break
+        if not actions:
+            return None
+
+        refresh = [product_id for product_id, action in actions.items() if action == "refresh"]
+        fetched: dict[str, dict] = {}
+        for start in range(0, len(refresh), INCREMENTAL_ID_FILTER_CHUNK):
+            chunk = refresh[start:start + INCREMENTAL_ID_FILTER_CHUNK]
+            id_filter = " OR ".join(f"id:{product_id.rsplit('/', 1)[-1]}" for product_id in chunk)
+            result = fetch_admin(store_id, store["admin_token"], self.page_size, search_query=id_filter)
+            fetched.update((edge["node"]["id"], edge) for edge in snapshot_product_edges(result))
+
+        shop = (snapshot.get("data") or {}).get("shop")
+        apply_storefront_urls(list(fetched.values()), store_id, *primary_domain_parts(shop))
+        patched: list[dict] = []
+        removed = 0
+        for edge in edges:
+            product_id = edge["node"]["id"]
+            if product_id not in actions:
+                patched.append(edge)
+            elif product_id in fetched:
+                patched.append({**fetched.pop(product_id), "cursor": edge.get("cursor")})
+            else:
+                removed += 1  # deleted, or refreshed but gone upstream
+        patched.extend(fetched.values())
+        log(f"Applying webhooks for {store_id}: {len(refresh)} re-fetched, {len(fetched)} added, {removed} removed")
+
+        products = snapshot.setdefault("data", {}).setdefault("products", {})
+        products["edges"] = patched
+        snapshot.pop("extensions", None)
+        return write_snapshot(store_id, snapshot, self.output_dir, self.history_retention, **self.snapshot_options)
+
+
+def make_handler(receiver: WebhookReceiver) -> type[BaseHTTPRequestHandler]:
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+            pass
+
+        def reply(self, status: int, message: str) -> None:
+            body = message.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self) -> None:  # noqa: N802
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0 or length > MAX_BODY_BYTES:
+                self.reply(413, "invalid body length")
+                return
+            body = self.rfile.read(length)
+            topic = self.headers.get("X-Shopify-Topic")
+            shop_domain = self.headers.get("X-Shopify-Shop-Domain")
+            try:
+                outcome = receiver.receive(
+                    topic,
+                    shop_domain,
+                    self.headers.get("X-Shopify-Hmac-Sha256"),
+                    body,
+                    self.headers.get("X-Shopify-Webhook-Id"),
+                )
+            except WebhookRejected as exc:
+                log(f"Rejected {topic} webhook from {shop_domain}: {exc}")
+                self.reply(exc.status, str(exc))
+                return
+            self.reply(200, outcome)
+
+    return WebhookHandler
+
+
+def replay(receiver: WebhookReceiver, path: pathlib.Path) -> int:
+    """Feed recorded deliveries (``--record`` JSONL) through the receiver and apply them; returns failures."""
+    failures = 0
+    with path.open("r", encoding="utf-8") as handle:
+        for number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            try:
+                receiver.receive(
+                    entry.get("topic"),
+                    entry.get("shop_domain"),
+                    entry.get("hmac"),
+                    entry["body"].encode("utf-8"),
+                    entry.get("webhook_id"),
+                )
+            except WebhookRejected as exc:
+                log(f"Replay line {number} rejected: {exc}")
+                failures += 1
+    return failures + receiver.flush(force=True)
+
+
+def serve(receiver: WebhookReceiver, host: str, port: int) -> None:
+    server = ThreadingHTTPServer((host, port), make_handler(receiver))
+    server.daemon_threads = True
+    stop = threading.Event()
+
+    def flush_loop() -> None:
+        while not stop.wait(0.5):
+            receiver.flush()
+
+    flusher = threading.Thread(target=flush_loop, name="webhook-flush", daemon=True)
+    flusher.start()
+    log(f"Listening for Shopify webhooks on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        stop.set()
+        flusher.join()
+        receiver.flush(force=True)
+        log("Webhook receiver stopped")
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Apply Shopify product and inventory webhooks to the newest Admin snapshots")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH, type=pathlib.Path, help="Path to shops.json secrets file")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, type=pathlib.Path, help="Directory holding the Shopify Admin API snapshots")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to listen on")
+    parser.add_argument("--port", default=DEFAULT_PORT, type=int, help="Port to listen on")
+    parser.add_argument("--secret", default=os.getenv(WEBHOOK_SECRET_ENV), help=f"App secret used to verify webhook HMACs when a store has no 'webhook_secret' (default ${WEBHOOK_SECRET_ENV})")
+    parser.add_argument("--quiet-seconds", default=DEFAULT_QUIET_SECONDS, type=float, help="Apply a store's pending webhooks once it has been quiet this long")
+    parser.add_argument("--record", type=pathlib.Path, help="Append every accepted delivery (headers and raw body) to this JSONL file")
+    parser.add_argument("--replay", type=pathlib.Path, help="Apply deliveries recorded with --record, then exit")
+    parser.add_argument("--page-size", default=DEFAULT_PAGE_SIZE, type=int, help="Products per re-fetch request")
+    parser.add_argument("--history-retention", default=HISTORY_VERSION_RETENTION, type=int, help="Snapshots to retain per store")
+    parser.add_argument("--dedup-history", action="store_true", help="Record patched snapshots in the deduplicated history (match fetch_admin.py)")
+    parser.add_argument("--format", dest="snapshot_format", choices=SNAPSHOT_FORMATS, default="json", help="Snapshot file format (match fetch_admin.py)")
+    parser.add_argument("--no-change-log", dest="change_log", action="store_false", help="Skip the digest and change log for patched snapshots")
+    parser.add_argument("--sqlite", dest="sqlite_catalog", action="store_true", help="Also load patched snapshots into <store>/catalog.sqlite3")
+    parser.add_argument("--log-to-stdout", action="store_true", help="Print log lines instead of writing to /tmp/integrations/product-feed/shopify/log")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    prepare_logging(args.log_to_stdout)
+    try:
+        receiver = WebhookReceiver(
+            load_shops(args.config),
+            args.output,
+            secret=args.secret,
+            record_path=None if args.replay else args.record,
+            quiet_seconds=args.quiet_seconds,
+            page_size=args.page_size,
+            history_retention=args.history_retention,
+            dedup_history=args.dedup_history,
+            snapshot_format=args.snapshot_format,
+            change_log=args.change_log,
+            sqlite_catalog=args.sqlite_catalog,
+        )
+        if args.replay:
+            failures = replay(receiver, args.replay)
+            return 1 if failures else 0
+        serve(receiver, args.host, args.port)
+    except ShopifyError as exc:
+        log(f"Webhook receiver failed: {exc}")
+        print(exc, file=sys.stderr)
+        return 1
+    finally:
+        prune_logs()
+        close_logging()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,42 @@
+import { Migration } from '@mikro-orm/migrations';
+
+// Change-only product versions (product-feed/platforms/shopify/pipeline/main.py):
+// product_info / product_variant_info rows are written once per distinct
+// content_hash, and version_manifest maps each version onto the rows it uses.
+// The content_hash indexes are not partial on deleted_at, unlike model indexes,
+// so PostgREST upserts can use them as their on_conflict target.
+export class Migration20261017060000 extends Migration {
+
+  override async up(): Promise<void> {
+    this.addSql(`alter table if exists "feed_shopify"."product_info" add column if not exists "content_hash" text null;`);
+    this.addSql(`CREATE UNIQUE INDEX IF NOT EXISTS "product_info_content_hash_key" ON "feed_shopify"."product_info" (store_id, product_id, content_hash);`);
+    this.addSql(`CREATE INDEX IF NOT EXISTS "product_info_store_hash_idx" ON "feed_shopify"."product_info" (store_id, content_hash);`);
+
+    this.addSql(`alter table if exists "feed_shopify"."product_variant_info" add column if not exists "content_hash" text null;`);
+    this.addSql(`CREATE UNIQUE INDEX IF NOT EXISTS "product_variant_info_content_hash_key" ON "feed_shopify"."product_variant_info" (store_id, variant_id, content_hash);`);
+    this.addSql(`CREATE INDEX IF NOT EXISTS "product_variant_info_store_hash_idx" ON "feed_shopify"."product_variant_info" (store_id, content_hash);`);
+
+    this.addSql(`create table if not exists "feed_shopify"."version_manifest" ("store_id" text not null, "version_id" text not null, "version_time" timestamptz not null, "products" jsonb not null, "variants" jsonb not null, "created_at" timestamptz not null default now(), "updated_at" timestamptz not null default now(), "deleted_at" timestamptz null, constraint "version_manifest_pkey" primary key ("store_id", "version_id"));`);
+    this.addSql(`CREATE INDEX IF NOT EXISTS "IDX_version_manifest_deleted_at" ON "feed_shopify"."version_manifest" (deleted_at) WHERE deleted_at IS NULL;`);
+
+    // Rows as of a version: WHERE store_id = ... AND version_id = ...
+    this.addSql(`create or replace view "feed_shopify"."product_info_as_of" as select m.store_id, m.version_id, p.product_id, p.content_hash, p.product_info from "feed_shopify"."version_manifest" m cross join lateral jsonb_each_text(m.products) as e(product_id, content_hash) join "feed_shopify"."product_info" p on p.store_id = m.store_id and p.product_id = e.product_id and p.content_hash = e.content_hash;`);
+    this.addSql(`create or replace view "feed_shopify"."product_variant_info_as_of" as select m.store_id, m.version_id, v.product_id, v.variant_id, v.content_hash, v.variant_info from "feed_shopify"."version_manifest" m cross join lateral jsonb_each_text(m.variants) as e(variant_id, content_hash) join "feed_shopify"."product_variant_info" v on v.store_id = m.store_id and v.variant_id = e.variant_id and v.content_hash = e.content_hash;`);
+  }
+
+  override async down(): Promise<void> {
+    this.addSql(`drop view if exists "feed_shopify"."product_variant_info_as_of";`);
+    this.addSql(`drop view if exists "feed_shopify"."product_info_as_of";`);
+
+    this.addSql(`drop table if exists "feed_shopify"."version_manifest" cascade;`);
+
+    this.addSql(`drop index if exists "feed_shopify"."product_variant_info_store_hash_idx";`);
+    this.addSql(`drop index if exists "feed_shopify"."product_variant_info_content_hash_key";`);
+    this.addSql(`alter table if exists "feed_shopify"."product_variant_info" drop column if exists "content_hash";`);
+
+    this.addSql(`drop index if exists "feed_shopify"."product_info_store_hash_idx";`);
+    this.addSql(`drop index if exists "feed_shopify"."product_info_content_hash_key";`);
+    this.addSql(`alter table if exists "feed_shopify"."product_info" drop column if exists "content_hash";`);
+  }
+
+}
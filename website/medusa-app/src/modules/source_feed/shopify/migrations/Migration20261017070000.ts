@@ -0,0 +1,22 @@
+import { Migration } from '@mikro-orm/migrations';
+
+// Store leases (product-feed/common/store_leases.py, pipeline/main.py
+// --leases supabase). The pipeline writes expires_at and completed_at when it
+// inserts a row, so they carry no defaults. Tables created from the earlier
+// pipeline/sql DDL get the model's timestamp columns, and lose the expires_at
+// index the PK-filtered lease updates never used.
+export class Migration20261017070000 extends Migration {
+
+  override async up(): Promise<void> {
+    this.addSql(`create table if not exists "feed_shopify"."store_lease" ("store_id" text not null, "owner" text null, "expires_at" timestamptz not null, "heartbeat_at" timestamptz null, "completed_at" timestamptz not null, "last_state" text null, "created_at" timestamptz not null default now(), "updated_at" timestamptz not null default now(), "deleted_at" timestamptz null, constraint "store_lease_pkey" primary key ("store_id"));`);
+    this.addSql(`alter table if exists "feed_shopify"."store_lease" add column if not exists "created_at" timestamptz not null default now(), add column if not exists "updated_at" timestamptz not null default now(), add column if not exists "deleted_at" timestamptz null;`);
+    this.addSql(`alter table if exists "feed_shopify"."store_lease" alter column "expires_at" drop default, alter column "completed_at" drop default;`);
+    this.addSql(`drop index if exists "feed_shopify"."store_lease_expires_at_idx";`);
+    this.addSql(`CREATE INDEX IF NOT EXISTS "IDX_store_lease_deleted_at" ON "feed_shopify"."store_lease" (deleted_at) WHERE deleted_at IS NULL;`);
+  }
+
+  override async down(): Promise<void> {
+    this.addSql(`drop table if exists "feed_shopify"."store_lease" cascade;`);
+  }
+
+}
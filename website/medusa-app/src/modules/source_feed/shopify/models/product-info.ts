@@ -6,6 +6,11 @@ const ShopifyProductInfo = model
     product_id: model.text().primaryKey(),
     version_id: model.id().primaryKey(),
     product_info: model.json().nullable(),
+    // Hash of product_info; a row is only written when it changes. The unique
+    // (store_id, product_id, content_hash) index the pipeline upserts against is
+    // created in Migration20261017060000: model indexes are partial
+    // (deleted_at IS NULL), which PostgREST's on_conflict cannot target.
+    content_hash: model.text().nullable(),
   })
   .indexes([
     {
@@ -7,6 +7,8 @@ const ShopifyProductVariantInfo = model
     variant_id: model.text().primaryKey(),
     version_id: model.id().primaryKey(),
     variant_info: model.json().nullable(),
+    // See product-info.ts; unique on (store_id, variant_id, content_hash).
+    content_hash: model.text().nullable(),
   })
   .indexes([
     {
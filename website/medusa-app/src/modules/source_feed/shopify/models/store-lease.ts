@@ -0,0 +1,15 @@
+import { model } from "@medusajs/framework/utils"
+
+// Per-store leases shared by pipeline workers (product-feed/common/store_leases.py,
+// pipeline/main.py --leases supabase). Claims, heartbeats and releases are
+// filtered updates on the store_id primary key.
+const ShopifyStoreLease = model.define("feed_shopify.store_lease", {
+  store_id: model.text().primaryKey(),
+  owner: model.text().nullable(),
+  expires_at: model.dateTime(),
+  heartbeat_at: model.dateTime().nullable(),
+  completed_at: model.dateTime(),
+  last_state: model.text().nullable(),
+})
+
+export default ShopifyStoreLease
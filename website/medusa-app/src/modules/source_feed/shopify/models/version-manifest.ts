@@ -0,0 +1,13 @@
+import { model } from "@medusajs/framework/utils"
+
+// Maps each product_info / product_variant_info version onto the change-only
+// rows it uses; read through the product_info_as_of views.
+const ShopifyVersionManifest = model.define("feed_shopify.version_manifest", {
+  store_id: model.text().primaryKey(),
+  version_id: model.id().primaryKey(),
+  version_time: model.dateTime(),
+  products: model.json(), // product_id -> content_hash
+  variants: model.json(), // variant_id -> content_hash
+})
+
+export default ShopifyVersionManifest